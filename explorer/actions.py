@@ -2,7 +2,7 @@ import tempfile
 from collections import defaultdict
 from datetime import date
 from wsgiref.util import FileWrapper
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZipFile
 
 from django.http import HttpResponse
 
@@ -49,7 +49,7 @@ def _package(queries):
 
 def _build_zip(queries):
     temp = tempfile.TemporaryFile()
-    zip_file = ZipFile(temp, "w")
+    zip_file = ZipFile(temp, "w", compression=ZIP_DEFLATED)
     for r in queries:
         zip_file.writestr(
             f"{r.title}.csv", CSVExporter(r).get_output() or "Error!"
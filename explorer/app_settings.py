@@ -42,6 +42,35 @@ EXPLORER_SQL_BLACKLIST = getattr(
 
 EXPLORER_DEFAULT_ROWS = getattr(settings, "EXPLORER_DEFAULT_ROWS", 1000)
 
+# Only fetch the rows that are going to be displayed when viewing a query (plus one, to know if there are more).
+# Summary statistics and charts are then based on those rows, and the total is counted on request.
+EXPLORER_ROW_LIMIT_PUSHDOWN = getattr(settings, "EXPLORER_ROW_LIMIT_PUSHDOWN", False)
+
+# Maximum number of seconds a query may run for, unless its Query or DatabaseConnection specifies otherwise.
+# None means no limit.
+EXPLORER_DEFAULT_QUERY_TIMEOUT = getattr(settings, "EXPLORER_DEFAULT_QUERY_TIMEOUT", None)
+
+# Statistics shown for numeric columns, on top of Sum, Avg, Min, Max and NUL. Any of "distinct", "stddev" and
+# percentiles such as "p50" or "p95".
+EXPLORER_SUMMARY_EXTRA_STATS = getattr(settings, "EXPLORER_SUMMARY_EXTRA_STATS", [])
+
+# Store query results column by column, using typed arrays for int and float columns. Uses less memory, and makes
+# summary statistics cheaper, for results with many numeric rows.
+EXPLORER_COLUMNAR_RESULTS = getattr(settings, "EXPLORER_COLUMNAR_RESULTS", False)
+
+# Pass $$parameter$$ values to the database driver as bound parameters, rather than substituting them into the SQL
+EXPLORER_BIND_PARAMS = getattr(settings, "EXPLORER_BIND_PARAMS", False)
+
+# Number of rows pulled from the cursor at a time when results are streamed (e.g. by the exporters)
+EXPLORER_STREAM_FETCH_SIZE = getattr(settings, "EXPLORER_STREAM_FETCH_SIZE", 2000)
+
+# Results of queries with a cache_ttl are cached in a Django cache ("cache") or in files in a directory ("disk").
+# Beyond a total of EXPLORER_RESULT_CACHE_MAX_SIZE bytes, the least recently used results are evicted.
+EXPLORER_RESULT_CACHE_STORAGE = getattr(settings, "EXPLORER_RESULT_CACHE_STORAGE", "cache")
+EXPLORER_RESULT_CACHE_ALIAS = getattr(settings, "EXPLORER_RESULT_CACHE_ALIAS", "default")
+EXPLORER_RESULT_CACHE_DIR = getattr(settings, "EXPLORER_RESULT_CACHE_DIR", None)  # Defaults to ./explorer_result_cache
+EXPLORER_RESULT_CACHE_MAX_SIZE = getattr(settings, "EXPLORER_RESULT_CACHE_MAX_SIZE", 100 * 1024 * 1024)
+
 EXPLORER_SCHEMA_EXCLUDE_TABLE_PREFIXES = getattr(
     settings,
     "EXPLORER_SCHEMA_EXCLUDE_TABLE_PREFIXES",
@@ -63,6 +92,29 @@ EXPLORER_SCHEMA_INCLUDE_VIEWS = getattr(
     "EXPLORER_SCHEMA_INCLUDE_VIEWS",
     False
 )
+# Build schemas in Celery (requires EXPLORER_TASKS_ENABLED). Otherwise they are built in a background thread, unless
+# EXPLORER_SCHEMA_BUILD_IN_BACKGROUND is off, in which case pages wait for them to be built.
+EXPLORER_ASYNC_SCHEMA = getattr(settings, "EXPLORER_ASYNC_SCHEMA", False)
+EXPLORER_SCHEMA_BUILD_IN_BACKGROUND = getattr(settings, "EXPLORER_SCHEMA_BUILD_IN_BACKGROUND", True)
+
+# How many seconds each table's cached description is reused for by later schema builds, while the table is unchanged
+EXPLORER_SCHEMA_TABLE_CACHE_TIMEOUT = getattr(settings, "EXPLORER_SCHEMA_TABLE_CACHE_TIMEOUT", 7 * 24 * 60 * 60)
+
+# The build_async_schemas task rebuilds this many connections' schemas at a time, giving each up to this many seconds
+EXPLORER_SCHEMA_WARMUP_CONCURRENCY = getattr(settings, "EXPLORER_SCHEMA_WARMUP_CONCURRENCY", 4)
+EXPLORER_SCHEMA_WARMUP_TIME_BUDGET = getattr(settings, "EXPLORER_SCHEMA_WARMUP_TIME_BUDGET", 300)
+
+# Queries without a snapshot interval of their own are snapshotted this often, in minutes. None snapshots them on every
+# run of the snapshot_queries task.
+EXPLORER_SNAPSHOT_INTERVAL = getattr(settings, "EXPLORER_SNAPSHOT_INTERVAL", 1440)
+# The snapshot_queries task snapshots this many queries at a time per database connection, or the number given for the
+# connection's alias in EXPLORER_SNAPSHOT_CONNECTION_CONCURRENCY, e.g. {"warehouse": 1}
+EXPLORER_SNAPSHOT_CONCURRENCY = getattr(settings, "EXPLORER_SNAPSHOT_CONCURRENCY", 2)
+EXPLORER_SNAPSHOT_CONNECTION_CONCURRENCY = getattr(settings, "EXPLORER_SNAPSHOT_CONNECTION_CONCURRENCY", {})
+# Failed snapshots are retried up to this many times, after this many seconds, doubling with each retry up to the max
+EXPLORER_SNAPSHOT_MAX_RETRIES = getattr(settings, "EXPLORER_SNAPSHOT_MAX_RETRIES", 5)
+EXPLORER_SNAPSHOT_RETRY_DELAY = getattr(settings, "EXPLORER_SNAPSHOT_RETRY_DELAY", 60)
+EXPLORER_SNAPSHOT_MAX_RETRY_DELAY = getattr(settings, "EXPLORER_SNAPSHOT_MAX_RETRY_DELAY", 3600)
 
 EXPLORER_TRANSFORMS = getattr(settings, "EXPLORER_TRANSFORMS", [])
 EXPLORER_PERMISSION_VIEW = getattr(
@@ -81,6 +133,8 @@ EXPLORER_RECENT_QUERY_COUNT = getattr(
 DEFAULT_EXPORTERS = [
     ("csv", "explorer.exporters.CSVExporter"),
     ("json", "explorer.exporters.JSONExporter"),
+    ("ndjson", "explorer.exporters.JSONLinesExporter"),
+    ("json_columns", "explorer.exporters.JSONColumnsExporter"),
 ]
 try:
     import xlsxwriter  # noqa
@@ -91,12 +145,33 @@ try:
     )
 except ImportError:
     pass
+try:
+    import pyarrow  # noqa
+
+    DEFAULT_EXPORTERS += [
+        ("parquet", "explorer.exporters.ParquetExporter"),
+        ("arrow", "explorer.exporters.ArrowStreamExporter"),
+    ]
+except ImportError:
+    pass
 
 EXPLORER_DATA_EXPORTERS = getattr(
     settings, "EXPLORER_DATA_EXPORTERS", DEFAULT_EXPORTERS
 )
 CSV_DELIMETER = getattr(settings, "EXPLORER_CSV_DELIMETER", ",")
 
+# Compression ("gzip" or "zstd") to apply to each export format by default, e.g. {"csv": "gzip"}. Downloads can ask
+# for one with ?compression=gzip|zstd|none. The "csv" entry also applies to query results and snapshots sent to S3.
+EXPLORER_EXPORT_COMPRESSION = getattr(settings, "EXPLORER_EXPORT_COMPRESSION", {})
+
+# Compression codecs for Parquet ("zstd", "snappy", "gzip", "lz4", "brotli" or "none") and Arrow IPC streams
+# ("zstd", "lz4" or None)
+EXPLORER_PARQUET_COMPRESSION = getattr(settings, "EXPLORER_PARQUET_COMPRESSION", "zstd")
+EXPLORER_ARROW_COMPRESSION = getattr(settings, "EXPLORER_ARROW_COMPRESSION", "zstd")
+
+# Send downloads and streams as they are generated, rather than building the whole export in memory first
+EXPLORER_STREAMING_EXPORTS = getattr(settings, "EXPLORER_STREAMING_EXPORTS", True)
+
 # API access
 EXPLORER_TOKEN = getattr(settings, "EXPLORER_TOKEN", "CHANGEME")
 
@@ -130,6 +205,19 @@ S3_REGION = getattr(settings, "EXPLORER_S3_REGION", "us-east-1")
 S3_ENDPOINT_URL = getattr(settings, "EXPLORER_S3_ENDPOINT_URL", None)
 S3_DESTINATION = getattr(settings, "EXPLORER_S3_DESTINATION", "")
 S3_SIGNATURE_VERSION = getattr(settings, "EXPLORER_S3_SIGNATURE_VERSION", "v4")
+# Uploads to S3 are sent in parts of this many bytes (at least 5 MB), this many parts at a time
+EXPLORER_S3_MULTIPART_CHUNK_SIZE = getattr(settings, "EXPLORER_S3_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024)
+EXPLORER_S3_UPLOAD_CONCURRENCY = getattr(settings, "EXPLORER_S3_UPLOAD_CONCURRENCY", 4)
+
+# truncate_querylogs deletes logs in batches of this many ids (falsy: all at once), sleeping this many seconds between
+# batches. If an archive directory is set, deleted logs are first written there as gzipped JSON lines.
+EXPLORER_QUERYLOG_TRUNCATE_BATCH_SIZE = getattr(settings, "EXPLORER_QUERYLOG_TRUNCATE_BATCH_SIZE", 10000)
+EXPLORER_QUERYLOG_TRUNCATE_PAUSE = getattr(settings, "EXPLORER_QUERYLOG_TRUNCATE_PAUSE", 0)
+EXPLORER_QUERYLOG_ARCHIVE_DIR = getattr(settings, "EXPLORER_QUERYLOG_ARCHIVE_DIR", None)
+
+# Write each query log once, when the query finishes, rather than when it starts and again when it finishes. Running
+# queries then can't be seen or cancelled.
+EXPLORER_BUFFERED_QUERY_LOGS = getattr(settings, "EXPLORER_BUFFERED_QUERY_LOGS", False)
 
 UNSAFE_RENDERING = getattr(settings, "EXPLORER_UNSAFE_RENDERING", False)
 
@@ -170,6 +258,11 @@ EXPLORER_PRUNE_LOCAL_UPLOAD_COPY_DAYS_INACTIVITY = getattr(settings,
 # 500mb default max
 EXPLORER_MAX_UPLOAD_SIZE = getattr(settings, "EXPLORER_MAX_UPLOAD_SIZE", 500 * 1024 * 1024)
 
+# Reuse database connections for user-defined DatabaseConnections. Pools are per thread; the size is per thread too.
+EXPLORER_CONNECTION_POOL_ENABLED = getattr(settings, "EXPLORER_CONNECTION_POOL_ENABLED", True)
+EXPLORER_CONNECTION_POOL_SIZE = getattr(settings, "EXPLORER_CONNECTION_POOL_SIZE", 10)
+EXPLORER_CONNECTION_POOL_MAX_IDLE = getattr(settings, "EXPLORER_CONNECTION_POOL_MAX_IDLE", 300)
+
 EXPLORER_HOSTED = getattr(settings, "EXPLORER_HOSTED", False)
 
 
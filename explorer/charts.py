@@ -1,3 +1,4 @@
+from array import array
 from io import BytesIO
 from typing import Iterable, Optional
 from .models import QueryResult
@@ -24,7 +25,7 @@ def get_chart(result: QueryResult, chart_type: str, num_rows: int) -> Optional[s
     data = result.data[:num_rows]
     numeric_columns = [
         c for c in range(1, len(data[0]))
-        if all([isinstance(col[c], (int, float)) or col[c] is None for col in data])
+        if _is_numeric(result, data, c)
     ]
     # Don't create charts for > 10 series. This is a lightweight visualization.
     if len(numeric_columns) < 1 or len(numeric_columns) > 10:
@@ -57,6 +58,13 @@ def get_chart(result: QueryResult, chart_type: str, num_rows: int) -> Optional[s
     return svg_str
 
 
+def _is_numeric(result: QueryResult, data: list, c: int) -> bool:
+    # Typed (columnar) storage only holds ints or floats
+    if result.is_columnar and isinstance(result.column(c), array):
+        return True
+    return all([isinstance(row[c], (int, float)) or row[c] is None for row in data])
+
+
 def get_svg(fig) -> str:
     buffer = BytesIO()
     fig.savefig(buffer, format="svg")
@@ -0,0 +1,200 @@
+"""
+Summary statistics for numeric result columns (see ColumnSummary), computed in one pass: with NumPy for larger columns
+if it's installed, else in plain Python.
+
+Sum, Avg, Min and Max treat NULLs as 0, and NUL counts them. The optional statistics (EXPLORER_SUMMARY_EXTRA_STATS)
+ignore NULLs: "distinct", "stddev" (of the population) and percentiles such as "p99", interpolated linearly.
+"""
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Below this many values, NumPy's per-call overhead outweighs what it saves
+NUMPY_MIN_VALUES = 1000
+
+MAX_PERCENTILE = 100
+
+
+def _parse_percentile(name):
+    try:
+        p = float(name[1:])
+    except ValueError:
+        return None
+    return p if name.startswith("p") and 0 <= p <= MAX_PERCENTILE else None
+
+
+def _parse_extra(extra):
+    distinct = stddev = False
+    percentiles = []
+    for name in extra:
+        key = name.lower()
+        if key == "distinct":
+            distinct = True
+        elif key == "stddev":
+            stddev = True
+        elif _parse_percentile(key) is not None:
+            percentiles.append(_parse_percentile(key))
+        else:
+            raise ValueError(f"Unknown summary statistic: {name}")
+    return distinct, stddev, percentiles
+
+
+def _percentile_label(p):
+    return f"P{p:g}"
+
+
+def _labels(distinct, stddev, percentiles):
+    labels = [("Sum", 2), ("Avg", 2), ("Min", 2), ("Max", 2), ("NUL", 0)]
+    if distinct:
+        labels.append(("Distinct", 0))
+    if stddev:
+        labels.append(("StdDev", 2))
+    labels.extend((_percentile_label(p), 2) for p in percentiles)
+    return labels
+
+
+def _percentile(sorted_values, p):
+    pos = (len(sorted_values) - 1) * p / 100
+    lo, hi = float(sorted_values[math.floor(pos)]), float(sorted_values[math.ceil(pos)])
+    return lo + (hi - lo) * (pos - math.floor(pos))
+
+
+class _RunningVariance:
+    # Welford's algorithm
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.m2 / self.count) if self.count else 0
+
+
+def _optional_stats(distinct, stddev, percentiles):
+    """
+    Accumulators for the optional statistics.
+
+    :return: A list of functions to call with each non-NULL value, and a list of functions that then return the
+             statistics' values (as lists)
+    """
+    adders, results = [], []
+    if distinct:
+        seen = set()
+        adders.append(seen.add)
+        results.append(lambda: [len(seen)])
+    if stddev:
+        variance = _RunningVariance()
+        adders.append(variance.add)
+        results.append(lambda: [variance.stddev])
+    if percentiles:
+        values = []
+        adders.append(values.append)
+
+        def percentile_values():
+            values.sort()
+            return [_percentile(values, p) if values else 0 for p in percentiles]
+        results.append(percentile_values)
+    return adders, results
+
+
+def _summarize_python(col, distinct, stddev, percentiles):
+    nulls = 0
+    total = 0
+    lo = hi = None
+    adders, results = _optional_stats(distinct, stddev, percentiles)
+
+    for v in col:
+        if v is None:
+            nulls += 1
+            continue
+        total += v
+        if lo is None or v < lo:
+            lo = v
+        if hi is None or v > hi:
+            hi = v
+        for add in adders:
+            add(v)
+
+    if nulls:
+        lo = 0 if lo is None else min(lo, 0)
+        hi = 0 if hi is None else max(hi, 0)
+
+    ret = [total, float(total) / len(col), lo, hi, nulls]
+    for result in results:
+        ret.extend(result())
+    return ret
+
+
+def _count_nulls(col):
+    if isinstance(col, array):
+        # Typed (columnar) storage can't hold NULLs
+        return 0
+    if isinstance(col, (list, tuple)):
+        return col.count(None)
+    return sum(v is None for v in col)
+
+
+def _summarize_numpy(col, distinct, stddev, percentiles):
+    try:
+        # NumPy converts None to NaN
+        arr = np.array(col, dtype=float)
+    except (TypeError, ValueError):
+        return None
+    if arr.ndim != 1:
+        return None
+    nulls = _count_nulls(col)
+    nan_mask = np.isnan(arr)
+    if int(nan_mask.sum()) != nulls:
+        # There are NaN values as well as NULLs; leave those to the pure Python version to deal with
+        return None
+    values = arr[~nan_mask] if nulls else arr
+
+    if values.size:
+        lo, hi = values.min(), values.max()
+        if nulls:
+            lo, hi = min(lo, 0), max(hi, 0)
+    else:
+        lo = hi = 0
+    total = values.sum()
+
+    ret = [total, total / len(arr), lo, hi, nulls]
+    if distinct:
+        ret.append(len(np.unique(values)))
+    if stddev:
+        ret.append(values.std() if values.size else 0)
+    if percentiles:
+        ret.extend(np.percentile(values, percentiles) if values.size else [0] * len(percentiles))
+    return ret
+
+
+def summarize(col, extra=()):
+    """
+    Compute the summary statistics of a column.
+
+    :param col: A sequence of numbers and Nones
+    :param extra: Names of optional statistics to include, see the module docstring
+    :return: A list of (label, value, precision) tuples, in display order
+    """
+    distinct, stddev, percentiles = _parse_extra(extra)
+    labels = _labels(distinct, stddev, percentiles)
+    if not len(col):
+        return [(label, 0, precision) for label, precision in labels]
+
+    values = None
+    if np is not None and len(col) >= NUMPY_MIN_VALUES:
+        values = _summarize_numpy(col, distinct, stddev, percentiles)
+    if values is None:
+        values = _summarize_python(col, distinct, stddev, percentiles)
+    return [(label, value, precision) for (label, precision), value in zip(labels, values, strict=True)]
@@ -0,0 +1,63 @@
+"""
+Column-oriented storage for query results (EXPLORER_COLUMNAR_RESULTS). Columns of only ints or only floats are kept in
+typed arrays, which take a fraction of the memory of a list of Python objects.
+"""
+from array import array
+from collections.abc import Sequence
+
+_TYPECODES = {
+    int: "q",
+    float: "d",
+}
+
+
+def to_column(values):
+    """
+    A typed array if the values are all ints (of up to 64 bits) or all floats, else a list.
+    """
+    types = set(map(type, values))
+    if len(types) == 1:
+        typecode = _TYPECODES.get(types.pop())
+        if typecode:
+            try:
+                return array(typecode, values)
+            except OverflowError:
+                pass
+    return list(values)
+
+
+class ColumnarRows(Sequence):
+    """
+    A list of rows, stored by column. Rows are built on the fly, so changing one doesn't change the data; use
+    set_column() for that.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows, width):
+        if not rows:
+            return cls([[] for _ in range(width)])
+        return cls([to_column(c) for c in zip(*rows, strict=True)])
+
+    def set_column(self, ix, values):
+        self.columns[ix] = to_column(values)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [list(r) for r in zip(*[c[i] for c in self.columns], strict=True)]
+        return [c[i] for c in self.columns]
+
+    def __iter__(self):
+        return map(list, zip(*self.columns, strict=True))
+
+    def __eq__(self, other):
+        if isinstance(other, (ColumnarRows, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
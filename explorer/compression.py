@@ -0,0 +1,89 @@
+"""
+Compression of exports (downloads, S3 uploads), applied incrementally so that streamed output stays streamed.
+
+gzip is always available. zstd needs the zstandard package.
+"""
+import zlib
+
+from explorer import app_settings
+
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# File extension and content type of each kind of compressed file
+COMPRESSIONS = {
+    GZIP: (".gz", "application/gzip"),
+    ZSTD: (".zst", "application/zstd"),
+}
+
+# Both favour speed, as exports are compressed while they are being sent
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+class UnsupportedCompression(ValueError):
+    pass
+
+
+def is_zstd_available():
+    try:
+        import zstandard  # noqa
+        return True
+    except ImportError:
+        return False
+
+
+def get_compression(name, format=None):
+    """
+    Resolve a requested compression: a name from COMPRESSIONS, "none" for no compression, or None (or "") for the
+    default of the export format (see EXPLORER_EXPORT_COMPRESSION).
+
+    :return: A name from COMPRESSIONS, or None for no compression
+    :raises UnsupportedCompression: For unknown compressions, and for zstd if zstandard isn't installed
+    """
+    if not name:
+        name = app_settings.EXPLORER_EXPORT_COMPRESSION.get(format)
+    if not name or name == "none":
+        return None
+    if name not in COMPRESSIONS:
+        raise UnsupportedCompression(f"Unknown compression '{name}'. Use one of: {', '.join(COMPRESSIONS)} or none.")
+    if name == ZSTD and not is_zstd_available():
+        raise UnsupportedCompression("zstd compression needs the zstandard package.")
+    return name
+
+
+def _compressor(compression):
+    if compression == GZIP:
+        # wbits=31 writes a gzip header and trailer rather than a bare zlib stream
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    import zstandard
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+
+def compress_stream(chunks, compression):
+    """
+    Compress an iterator of str (encoded as UTF-8) or bytes chunks, yielding compressed bytes as they are produced.
+    """
+    compressor = _compressor(compression)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def compress(data, compression):
+    """
+    :param data: str or bytes
+    :return: The compressed data, as bytes
+    """
+    return b"".join(compress_stream([data], compression))
+
+
+def compressed_filename(filename, compression):
+    return filename + COMPRESSIONS[compression][0] if compression else filename
+
+
+def compressed_content_type(content_type, compression):
+    return COMPRESSIONS[compression][1] if compression else content_type
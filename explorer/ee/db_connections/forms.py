@@ -37,4 +37,5 @@ class DatabaseConnectionForm(forms.ModelForm):
             "host": forms.TextInput(attrs={"class": "form-control"}),
             "port": forms.TextInput(attrs={"class": "form-control"}),
             "extras": JSONTextInput(attrs={"class": "form-control"}),
+            "query_timeout": forms.NumberInput(attrs={"class": "form-control"}),
         }
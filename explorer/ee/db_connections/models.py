@@ -2,7 +2,9 @@ import os
 import json
 from django.db import models, DatabaseError, connections, transaction
 from django.db.utils import load_backend
+from explorer import app_settings
 from explorer.app_settings import EXPLORER_CONNECTIONS
+from explorer.ee.db_connections import pool
 from explorer.ee.db_connections.utils import quick_hash, uploaded_db_local_path
 from django.core.cache import cache
 from django_cryptography.fields import encrypt
@@ -49,6 +51,10 @@ class DatabaseConnection(models.Model):
     extras = models.JSONField(blank=True, null=True)
     upload_fingerprint = models.CharField(max_length=255, blank=True, null=True)
     default = models.BooleanField(default=False)
+    query_timeout = models.PositiveIntegerField(
+        blank=True, null=True,
+        help_text="Maximum number of seconds a query may run for on this connection. Leave blank for no limit."
+    )
 
     def __str__(self):
         return f"{self.alias}"
@@ -102,11 +108,17 @@ class DatabaseConnection(models.Model):
             return uploaded_db_local_path(self.name)
 
     def delete_local_sqlite(self):
+        pool.discard(self.pk)
         if self.is_upload and os.path.exists(self.local_name):
             os.remove(self.local_name)
 
     # See the comment in apps.py for a more in-depth explanation of what's going on here.
-    def as_django_connection(self):
+    def as_django_connection(self, pooled=True):
+        """
+        A Django DatabaseWrapper for this connection. Unless `pooled` is False (or EXPLORER_CONNECTION_POOL_ENABLED
+        is off), saved connections come from a per-thread pool, so the same thread gets back the same open
+        connection on subsequent calls. See pool.py.
+        """
         if self.is_upload:
             self.download_sqlite_if_needed()
 
@@ -138,11 +150,21 @@ class DatabaseConnection(models.Model):
             extras_dict = json.loads(self.extras) if isinstance(self.extras, str) else self.extras
             connection_settings.update(extras_dict)
 
-        try:
-            backend = load_backend(self.engine)
-            return backend.DatabaseWrapper(connection_settings, self.alias)
-        except DatabaseError as e:
-            raise DatabaseError(f"Failed to create explorer connection: {e}") from e
+        def create_wrapper():
+            try:
+                backend = load_backend(self.engine)
+                return backend.DatabaseWrapper(connection_settings, self.alias)
+            except DatabaseError as e:
+                raise DatabaseError(f"Failed to create explorer connection: {e}") from e
+
+        # Unsaved connections (e.g. ones being validated) are never pooled
+        if not (pooled and self.pk and app_settings.EXPLORER_CONNECTION_POOL_ENABLED):
+            return create_wrapper()
+
+        # Keep the connection open between checkouts, and check it is still alive before reusing it
+        connection_settings["CONN_MAX_AGE"] = None
+        connection_settings["CONN_HEALTH_CHECKS"] = True
+        return pool.get_connection(self.pk, connection_settings, create_wrapper)
 
     def save(self, *args, **kwargs):
         # If this instance is marked as default, unset the default on all other instances
@@ -156,3 +178,10 @@ class DatabaseConnection(models.Model):
                 self.default = True
 
         super().save(*args, **kwargs)
+        pool.discard(self.pk)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        pool.discard(pk)
+        return result
@@ -0,0 +1,108 @@
+"""
+Per-thread pool of the Django DatabaseWrappers of user-defined DatabaseConnections, so that queries don't each pay for
+a new connection. Wrappers are replaced when the connection's settings change.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.core.signals import request_finished
+from django.db import DatabaseError
+
+from explorer import app_settings
+
+_local = threading.local()
+
+
+class PooledConnection:
+
+    def __init__(self, wrapper, fingerprint):
+        self.wrapper = wrapper
+        self.fingerprint = fingerprint
+        self.last_used = monotonic()
+
+    @property
+    def in_use(self):
+        return self.wrapper.in_atomic_block
+
+    def close(self):
+        # Closing a wrapper that is inside a transaction would break whoever is using it; just forget about it instead
+        if self.in_use:
+            return
+        try:
+            self.wrapper.close()
+        except DatabaseError:
+            pass
+
+
+def _pool():
+    if not hasattr(_local, "pool"):
+        _local.pool = OrderedDict()
+    return _local.pool
+
+
+def settings_fingerprint(connection_settings):
+    return hashlib.sha256(json.dumps(connection_settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_connection(key, connection_settings, factory):
+    """
+    Return this thread's pooled wrapper for `key`, creating it with `factory()` if there is none, or if the one in the
+    pool was created with different settings.
+    """
+    pool = _pool()
+    fingerprint = settings_fingerprint(connection_settings)
+    evict_idle()
+
+    pooled = pool.pop(key, None)
+    if pooled and pooled.fingerprint != fingerprint:
+        pooled.close()
+        pooled = None
+
+    if pooled:
+        pooled.last_used = monotonic()
+        if not pooled.in_use:
+            # Drops a broken connection, and with CONN_HEALTH_CHECKS has the next cursor check it's still alive
+            pooled.wrapper.close_if_unusable_or_obsolete()
+    else:
+        pooled = PooledConnection(factory(), fingerprint)
+
+    pool[key] = pooled
+    while len(pool) > max(app_settings.EXPLORER_CONNECTION_POOL_SIZE, 1):
+        _, oldest = pool.popitem(last=False)
+        oldest.close()
+    return pooled.wrapper
+
+
+def evict_idle(**kwargs):
+    """
+    Close this thread's pooled connections that have not been used for EXPLORER_CONNECTION_POOL_MAX_IDLE seconds.
+    """
+    pool = _pool()
+    max_idle = app_settings.EXPLORER_CONNECTION_POOL_MAX_IDLE
+    if max_idle is None:
+        return
+    now = monotonic()
+    for key, pooled in list(pool.items()):
+        if now - pooled.last_used > max_idle and not pooled.in_use:
+            del pool[key]
+            pooled.close()
+
+
+def discard(key):
+    """
+    Close and forget this thread's pooled connection for `key`, e.g. because the DatabaseConnection was edited.
+    """
+    pooled = _pool().pop(key, None)
+    if pooled:
+        pooled.close()
+
+
+def clear():
+    for key in list(_pool()):
+        discard(key)
+
+
+request_finished.connect(evict_idle)
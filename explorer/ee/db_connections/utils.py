@@ -3,6 +3,10 @@ import os
 import hashlib
 import sqlite3
 import io
+from contextlib import contextmanager
+from time import time
+
+from django.db import DatabaseError
 
 
 def default_db_connection():
@@ -89,3 +93,137 @@ def quick_hash(file_path, num_samples=10, sample_size=1024):
             hasher.update(sample_data)
 
     return hasher.hexdigest()
+
+
+# transaction.atomic() finds the connection by its alias, which reaches a different object than the one a
+# DatabaseConnection gave out when that isn't pooled. These run a transaction on the given object itself.
+
+def begin_transaction(connection):
+    """
+    Start a transaction on the connection, or a savepoint if it is already in one.
+
+    :return: A token to pass to end_transaction()
+    """
+    if not connection.get_autocommit():
+        return connection.savepoint()
+    connection.set_autocommit(False)
+    return True
+
+
+def end_transaction(connection, token, failed=False):
+    """
+    Commit (or, if failed, roll back) what begin_transaction() started.
+    """
+    if token is True:
+        try:
+            if failed:
+                connection.rollback()
+            else:
+                connection.commit()
+        finally:
+            connection.set_autocommit(True)
+    elif token is not None:
+        if failed:
+            connection.savepoint_rollback(token)
+        else:
+            connection.savepoint_commit(token)
+
+
+@contextmanager
+def connection_transaction(connection):
+    token = begin_transaction(connection)
+    try:
+        yield
+    except BaseException:
+        end_transaction(connection, token, failed=True)
+        raise
+    end_transaction(connection, token)
+
+
+# Statement timeouts and cancellation are implemented natively per backend. Backends not listed here run without a
+# timeout and can't be cancelled.
+
+@contextmanager
+def statement_timeout(connection, seconds):
+    """
+    Limit how long statements executed inside this block may run, using the backend's own mechanism.
+
+    :param connection: A Django database connection (e.g. from DatabaseConnection.as_django_connection)
+    :param seconds: The limit. Falsy values mean no limit.
+    """
+    if not seconds:
+        yield
+        return
+
+    ms = int(seconds * 1000)
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        with connection.cursor() as cursor:
+            # SET LOCAL is scoped to the current transaction; otherwise it has to be undone explicitly
+            if not connection.get_autocommit():
+                cursor.execute(f"SET LOCAL statement_timeout = {ms}")
+                yield
+            else:
+                cursor.execute(f"SET statement_timeout = {ms}")
+                try:
+                    yield
+                finally:
+                    cursor.execute("RESET statement_timeout")
+    elif vendor == "mysql":
+        variable, value = ("max_statement_time", seconds) if connection.mysql_is_mariadb \
+            else ("max_execution_time", ms)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET SESSION {variable} = {value}")
+            try:
+                yield
+            finally:
+                cursor.execute(f"SET SESSION {variable} = DEFAULT")
+    elif vendor == "sqlite":
+        connection.ensure_connection()
+        deadline = time() + seconds
+        # Returning a truthy value from the progress handler makes SQLite abort the statement
+        connection.connection.set_progress_handler(lambda: time() > deadline, 10000)
+        try:
+            yield
+        except DatabaseError as e:
+            if time() > deadline and "interrupted" in str(e):
+                raise DatabaseError(f"Query exceeded the timeout of {seconds} seconds") from e
+            raise e
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+def backend_pid(connection):
+    """
+    The id of the Postgres backend process serving this connection, which cancel_backend needs. It is looked up once
+    per underlying database connection, so runs on a pooled or persistent connection don't pay for it each time.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    connection.ensure_connection()
+    cached = getattr(connection, "_explorer_backend_pid", None)
+    if cached and cached[0] is connection.connection:
+        return cached[1]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_backend_pid()")
+        pid = cursor.fetchone()[0]
+    connection._explorer_backend_pid = (connection.connection, pid)
+    return pid
+
+
+def cancel_backend(connection, pid):
+    """
+    Cancel whatever statement the given backend process is running. Must be called with a different connection than
+    the one running the statement.
+
+    :return: True if the backend accepted the cancellation
+    """
+    pid = int(pid)
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == "postgresql":
+            cursor.execute("SELECT pg_cancel_backend(%s)", [pid])
+            return bool(cursor.fetchone()[0])
+    raise NotImplementedError(f"Cancelling queries is not supported for {vendor}")
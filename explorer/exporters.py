@@ -1,6 +1,7 @@
 import codecs
 import csv
 import json
+import tempfile
 import uuid
 from datetime import datetime
 from io import BytesIO, StringIO
@@ -10,6 +11,17 @@ from django.utils.module_loading import import_string
 from django.utils.text import get_valid_filename, slugify
 
 from explorer import app_settings
+from explorer.utils import ClosingIterator
+
+
+# Streamed output is handed to the response in pieces of roughly this many characters
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# JSONExporter and JSONColumnsExporter encode this many rows at a time
+JSON_BATCH_SIZE = 1000
+
+# Arrow and Parquet exports are written in record batches (Parquet row groups) of this many rows
+ARROW_BATCH_SIZE = 64 * 1024
 
 
 def get_exporter_class(format):
@@ -17,6 +29,24 @@ def get_exporter_class(format):
     return import_string(class_str)
 
 
+def _chunked(pieces, size=STREAM_CHUNK_SIZE):
+    """
+    Join many small strings (or bytes) into fewer, larger chunks, so that a response isn't written to the socket one
+    row at a time.
+    """
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield piece[:0].join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+
 class BaseExporter:
 
     name = ""
@@ -31,11 +61,33 @@ class BaseExporter:
         return value
 
     def get_file_output(self, **kwargs):
-        res = self.query.execute_query_only()
+        res = self.query.execute_query_only(stream=True)
         return self._get_output(res, **kwargs)
 
+    def get_output_stream(self, **kwargs):
+        """
+        Returns an iterator of output chunks, produced as rows come off the cursor. The query is executed before this
+        returns, so SQL errors are raised here rather than part-way through a response. The iterator should be closed
+        if it isn't read to the end, which ends the query's transaction (see StreamingQueryResult).
+        """
+        res = self.query.execute_query_only(stream=True)
+        return ClosingIterator(self._get_output_stream(res, **kwargs), res.close)
+
+    def _get_output_stream(self, res, **kwargs):
+        """
+        Exporters that can write their format incrementally should override this. The default produces the whole
+        output as a single chunk.
+
+        :param res: QueryResult
+        :param kwargs: Optional. Any exporter-specific arguments.
+        :return: Iterator of str or bytes
+        """
+        yield self._get_output(res, **kwargs).getvalue()
+
     def _get_output(self, res, **kwargs):
         """
+        Implementations should read rows via res.iter_rows() so that a StreamingQueryResult is never materialized.
+
         :param res: QueryResult
         :param kwargs: Optional. Any exporter-specific arguments.
         :return: File-like object
@@ -53,80 +105,209 @@ class CSVExporter(BaseExporter):
     file_extension = ".csv"
 
     def _get_output(self, res, **kwargs):
+        csv_data = StringIO()
+        for chunk in self._get_output_stream(res, **kwargs):
+            csv_data.write(chunk)
+        return csv_data
+
+    def _get_output_stream(self, res, **kwargs):
         delim = kwargs.get("delim") or app_settings.CSV_DELIMETER
         delim = "\t" if delim == "tab" else str(delim)
         delim = app_settings.CSV_DELIMETER if len(delim) > 1 else delim
-        csv_data = StringIO()
-        csv_data.write(codecs.BOM_UTF8.decode("utf-8"))
-        writer = csv.writer(csv_data, delimiter=delim)
+        buffer = StringIO()
+        buffer.write(codecs.BOM_UTF8.decode("utf-8"))
+        writer = csv.writer(buffer, delimiter=delim)
         writer.writerow(res.headers)
-        for row in res.data:
+        for row in res.iter_rows():
             writer.writerow(row)
-        return csv_data
+            if buffer.tell() >= STREAM_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
 
 
 class JSONExporter(BaseExporter):
+    """
+    A list of one object per row. Rows are encoded many at a time, with orjson if it's installed.
+    """
 
     name = "JSON"
     content_type = "application/json"
     file_extension = ".json"
 
     def _get_output(self, res, **kwargs):
-        data = []
-        for row in res.data:
-            data.append(
-                dict(zip(
-                    [str(h) if h is not None else "" for h in res.headers],
-                    row
-                ))
-            )
+        # Built from the stream, rather than from a list of every row's dict, so the data isn't held twice
+        return BytesIO(b"".join(self._get_output_stream(res, **kwargs)))
+
+    def _get_output_stream(self, res, **kwargs):
+        headers = _json_headers(res)
+        dumps = _json_dumps()
+
+        def pieces():
+            yield b"["
+            separator = b""
+            for batch in _row_batches(res.iter_rows(), JSON_BATCH_SIZE):
+                # Encoded as one list, less its brackets
+                yield separator + dumps([dict(zip(headers, row, strict=True)) for row in batch])[1:-1]
+                separator = b","
+            yield b"]"
+
+        return _chunked(pieces())
 
-        json_data = json.dumps(data, cls=DjangoJSONEncoder)
-        return StringIO(json_data)
+
+class JSONLinesExporter(BaseExporter):
+    """
+    Newline-delimited JSON: one object per row, encoded with orjson if it's installed.
+    """
+
+    name = "JSON Lines"
+    content_type = "application/x-ndjson"
+    file_extension = ".ndjson"
+
+    def _get_output(self, res, **kwargs):
+        return BytesIO(b"".join(self._get_output_stream(res, **kwargs)))
+
+    def _get_output_stream(self, res, **kwargs):
+        headers = _json_headers(res)
+        dumps = _json_dumps()
+        return _chunked(dumps(dict(zip(headers, row, strict=True))) + b"\n" for row in res.iter_rows())
+
+
+class JSONColumnsExporter(BaseExporter):
+    """
+    A compact JSON layout that doesn't repeat the column names on every row: {"columns": [...], "rows": [[...], ...]}.
+    Rows are encoded many at a time, with orjson if it's installed.
+    """
+
+    name = "JSON (columns)"
+    content_type = "application/json"
+    file_extension = ".json"
+
+    def _get_output(self, res, **kwargs):
+        return BytesIO(b"".join(self._get_output_stream(res, **kwargs)))
+
+    def _get_output_stream(self, res, **kwargs):
+        dumps = _json_dumps()
+
+        def pieces():
+            yield b'{"columns":' + dumps(_json_headers(res)) + b',"rows":['
+            separator = b""
+            for batch in _row_batches(res.iter_rows(), JSON_BATCH_SIZE):
+                # Encoded as one list, less its brackets
+                yield separator + dumps(batch)[1:-1]
+                separator = b","
+            yield b"]}"
+
+        return _chunked(pieces())
+
+
+def _row_batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _json_headers(res):
+    return [str(h) if h is not None else "" for h in res.headers]
+
+
+def _json_dumps():
+    """
+    A function that encodes a value as compact UTF-8 JSON, with orjson if it's installed, and encodes the types that
+    DjangoJSONEncoder does (dates and times, decimals, UUIDs, durations...) the same way it does.
+    """
+    django_encoder = DjangoJSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+    def stdlib_dumps(value):
+        return django_encoder.encode(value).encode("utf-8")
+
+    try:
+        import orjson
+    except ImportError:
+        return stdlib_dumps
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value):
+        try:
+            return orjson.dumps(value, default=django_encoder.default, option=options)
+        except TypeError:
+            # Values orjson can't encode at all, e.g. integers over 64 bits
+            return stdlib_dumps(value)
+
+    return dumps
 
 
 class ExcelExporter(BaseExporter):
+    """
+    Writes workbooks with xlsxwriter's constant_memory mode, which flushes each row to a temporary file as soon as the
+    next one is started, so memory use doesn't grow with the number of rows. Results with more rows than a sheet can
+    hold are continued on further sheets.
+    """
 
     name = "Excel"
     content_type = "application/vnd.ms-excel"
     file_extension = ".xlsx"
 
     def _get_output(self, res, **kwargs):
-        import xlsxwriter
         output = BytesIO()
+        self._write_workbook(res, output)
+        return output
 
-        wb = xlsxwriter.Workbook(output, {"in_memory": True})
+    def _get_output_stream(self, res, **kwargs):
+        # The workbook is only complete once it's closed, so it's built in a temporary file that is then streamed.
+        with tempfile.TemporaryFile() as output:
+            self._write_workbook(res, output)
+            output.seek(0)
+            yield from iter(lambda: output.read(STREAM_CHUNK_SIZE), b"")
 
-        ws = wb.add_worksheet(name=self._format_title())
+    def _write_workbook(self, res, output):
+        import xlsxwriter
 
-        # Write headers
-        row = 0
-        col = 0
+        wb = xlsxwriter.Workbook(output, {"constant_memory": True})
         header_style = wb.add_format({"bold": True})
-        for header in res.header_strings:
-            ws.write(row, col, header, header_style)
-            col += 1
-
-        # Write data
-        row = 1
-        col = 0
-        for data_row in res.data:
-            for data in data_row:
-                # xlsxwriter can't handle timezone-aware datetimes or
-                # UUIDs, so we help out here and just cast it to a
-                # string
-                if isinstance(data, (datetime, uuid.UUID)):
-                    data = str(data)
-                # JSON and Array fields
-                if isinstance(data, (dict, list)):
-                    data = json.dumps(data)
-                ws.write(row, col, data)
-                col += 1
+        title = self._format_title()
+        converters = None
+        # How many columns have only had Nones so far, and so have no converter yet
+        unresolved = None
+        ws = None
+        row = EXCEL_MAX_ROWS
+        sheets = 0
+
+        for data_row in res.iter_rows():
+            if row >= EXCEL_MAX_ROWS:
+                sheets += 1
+                ws = wb.add_worksheet(name=self._sheet_name(title, sheets))
+                ws.write_row(0, 0, res.header_strings, header_style)
+                row = 1
+            if unresolved is None or unresolved:
+                converters = _excel_converters(data_row, converters)
+                unresolved = converters.count(None)
+                if unresolved and (sheets > 1 or row >= EXCEL_CONVERTER_ROWS):
+                    # Columns that are still empty are probably always empty; convert any values they do have
+                    # however they come
+                    converters = [_excel_value if c is None else c for c in converters]
+                    unresolved = 0
+            try:
+                ws.write_row(row, 0, [
+                    convert(data) if convert and data is not None else data
+                    for convert, data in zip(converters, data_row, strict=True)
+                ])
+            except TypeError:
+                # A value of a different type than the rest of its column
+                ws.write_row(row, 0, [_excel_value(data) for data in data_row])
             row += 1
-            col = 0
 
+        if ws is None:
+            ws = wb.add_worksheet(name=title)
+            ws.write_row(0, 0, res.header_strings, header_style)
         wb.close()
-        return output
 
     def _format_title(self):
         # XLSX writer won't allow sheet names > 31 characters or that
@@ -135,3 +316,289 @@ class ExcelExporter(BaseExporter):
         # test/workbook/test_check_sheetname.py
         title = slugify(self.query.title)
         return title[:31]
+
+    @staticmethod
+    def _sheet_name(title, number):
+        if number == 1:
+            return title
+        suffix = f" ({number})"
+        return (title[:31 - len(suffix)] + suffix).strip()
+
+
+# Rows per worksheet, including the header row
+EXCEL_MAX_ROWS = 1048576
+
+# Columns that have only had Nones after this many rows stop being checked for a value to pick their converter from
+EXCEL_CONVERTER_ROWS = 1000
+
+
+def _excel_value(data):
+    # xlsxwriter can't handle timezone-aware datetimes or UUIDs, so we help out here and just cast it to a string
+    if isinstance(data, (datetime, uuid.UUID)):
+        return str(data)
+    # JSON and Array fields
+    if isinstance(data, (dict, list)):
+        return json.dumps(data)
+    return data
+
+
+def _excel_converters(data_row, converters=None):
+    """
+    Pick how to convert each column's values for xlsxwriter from the first of them that isn't None: str for
+    datetimes and UUIDs, _excel_value for JSON (whose values can be of any type), or False for values that can be
+    written as they are. Columns that have only had Nones so far are left as None.
+    """
+    converters = list(converters or [None] * len(data_row))
+    for i, data in enumerate(data_row):
+        if converters[i] is not None or data is None:
+            continue
+        if isinstance(data, (datetime, uuid.UUID)):
+            converters[i] = str
+        elif isinstance(data, (dict, list)):
+            converters[i] = _excel_value
+        else:
+            converters[i] = False
+    return converters
+
+
+class ArrowExporter(BaseExporter):
+    """
+    Base class for Apache Arrow based formats. Rows are converted to record batches of ARROW_BATCH_SIZE rows, keeping
+    their types; JSON and array values are written as JSON text.
+
+    A column's type is widened when a later batch doesn't fit it (see _widen), which means rewriting the batches
+    already written, so the file is built in a temporary file and only streamed once complete. Columns without any
+    values are of Arrow's null type.
+    """
+
+    def _get_output(self, res, **kwargs):
+        output = BytesIO()
+        for chunk in self._get_output_stream(res, **kwargs):
+            output.write(chunk)
+        return output
+
+    def _get_output_stream(self, res, **kwargs):
+        import pyarrow as pa
+
+        output = tempfile.TemporaryFile()
+        try:
+            writer = None
+            schema = pa.schema([pa.field(name, pa.null()) for name in res.header_strings])
+            for rows in _row_batches(res.iter_rows(), ARROW_BATCH_SIZE):
+                columns = [[_arrow_value(v) for v in column] for column in zip(*rows, strict=True)]
+                arrays, widened = _arrow_arrays(columns, schema)
+                if writer is None:
+                    writer = self._open_writer(pa.PythonFile(output, mode="w"), widened)
+                elif widened != schema:
+                    writer.close()
+                    output, writer, rewritten = self._rewrite(output, widened)
+                    if rewritten != widened:
+                        arrays, widened = _arrow_arrays(columns, rewritten)
+                schema = widened
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            if writer is None:
+                writer = self._open_writer(pa.PythonFile(output, mode="w"), schema)
+            writer.close()
+            output.seek(0)
+            yield from iter(lambda: output.read(STREAM_CHUNK_SIZE), b"")
+        finally:
+            output.close()
+
+    def _rewrite(self, output, schema):
+        """
+        Copy the batches written to output to a new temporary file, converted to schema. Columns whose values can't
+        all be converted without loss are converted to text instead.
+
+        :return: (the new file, a writer to it to carry on with, the schema it was written with)
+        """
+        import pyarrow as pa
+
+        while True:
+            rewritten = tempfile.TemporaryFile()
+            writer = self._open_writer(pa.PythonFile(rewritten, mode="w"), schema)
+            output.seek(0)
+            try:
+                for batch in self._read_batches(output):
+                    writer.write_batch(_cast_batch(batch, schema))
+            except _LossyCast as e:
+                writer.close()
+                rewritten.close()
+                schema = schema.set(e.column, schema.field(e.column).with_type(pa.string()))
+                continue
+            output.close()
+            return rewritten, writer, schema
+
+    def _open_writer(self, sink, schema):
+        """
+        :return: A writer with write_batch() and close() that writes the format to sink.
+        """
+        raise NotImplementedError
+
+    def _read_batches(self, source):
+        """
+        :return: An iterator of the record batches in source, a file written by a writer from _open_writer().
+        """
+        raise NotImplementedError
+
+
+class ParquetExporter(ArrowExporter):
+
+    name = "Parquet"
+    content_type = "application/vnd.apache.parquet"
+    file_extension = ".parquet"
+
+    def _open_writer(self, sink, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(sink, schema, compression=app_settings.EXPLORER_PARQUET_COMPRESSION)
+
+    def _read_batches(self, source):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(source).iter_batches(batch_size=ARROW_BATCH_SIZE)
+
+
+class ArrowStreamExporter(ArrowExporter):
+
+    name = "Arrow"
+    content_type = "application/vnd.apache.arrow.stream"
+    file_extension = ".arrows"
+
+    def _open_writer(self, sink, schema):
+        import pyarrow as pa
+        options = pa.ipc.IpcWriteOptions(compression=app_settings.EXPLORER_ARROW_COMPRESSION)
+        return pa.ipc.new_stream(sink, schema, options=options)
+
+    def _read_batches(self, source):
+        import pyarrow as pa
+        return pa.ipc.open_stream(source)
+
+
+# Integers beyond this can't all be represented exactly as floats
+MAX_EXACT_FLOAT_INT = 2 ** 53
+
+
+def _arrow_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    return value
+
+
+def _arrow_type(values):
+    """
+    The type of a batch of a column's values: null if they are all None, decimal for integers too large for int64
+    (or text beyond 38 digits), and text for values that Arrow can't find a type for.
+    """
+    import pyarrow as pa
+
+    present = [v for v in values if v is not None]
+    if not present:
+        return pa.null()
+    if isinstance(present[0], uuid.UUID):
+        return pa.uuid() if hasattr(pa, "uuid") else pa.string()
+    try:
+        inferred = pa.array(values).type
+    except OverflowError:
+        return _big_int_type(present)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    if pa.types.is_decimal(inferred):
+        # Leave room for larger values in later batches
+        return pa.decimal128(38, min(inferred.scale, 38))
+    return inferred
+
+
+def _big_int_type(values):
+    import pyarrow as pa
+
+    if all(isinstance(v, int) and not isinstance(v, bool) and abs(v) < 10 ** 38 for v in values):
+        return pa.decimal128(38, 0)
+    return pa.string()
+
+
+def _widen(current, new):
+    """
+    The narrowest type that holds values of both types without loss, as far as the types go: integers widen to
+    floats or decimals, and decimals to the larger scale. Anything else that differs widens to text.
+    """
+    import pyarrow as pa
+
+    if new == current or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    types = (current, new)
+    if all(pa.types.is_integer(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    if all(pa.types.is_integer(t) or pa.types.is_decimal(t) for t in types):
+        return pa.decimal128(38, max(t.scale for t in types if pa.types.is_decimal(t)))
+    return pa.string()
+
+
+def _arrow_arrays(columns, schema):
+    """
+    Convert a batch's columns to arrays, widening the schema's types where the batch doesn't fit them.
+
+    :return: (arrays, the widened schema)
+    """
+    arrays = []
+    for i, values in enumerate(columns):
+        field = schema.field(i)
+        array = _arrow_array(values, _widen(field.type, _arrow_type(values)))
+        arrays.append(array)
+        if array.type != field.type:
+            schema = schema.set(i, field.with_type(array.type))
+    return arrays, schema
+
+
+def _arrow_array(values, arrow_type):
+    """
+    :return: An array of the values of arrow_type, or of text if they don't all convert to it without loss.
+    """
+    import pyarrow as pa
+
+    if not pa.types.is_string(arrow_type):
+        if pa.types.is_floating(arrow_type) and any(
+            isinstance(v, int) and abs(v) > MAX_EXACT_FLOAT_INT for v in values
+        ):
+            return _arrow_array(values, pa.string())
+        try:
+            return pa.array(values, type=arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            return _arrow_array(values, pa.string())
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=arrow_type)
+
+
+class _LossyCast(Exception):
+
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+
+def _cast_batch(batch, schema):
+    """
+    Convert a record batch that was written earlier to a schema its types have been widened to.
+
+    :raises _LossyCast: If a column's values don't all convert without loss
+    """
+    import pyarrow as pa
+
+    arrays = []
+    for i, (array, field) in enumerate(zip(batch.columns, schema, strict=True)):
+        if array.type == field.type:
+            arrays.append(array)
+        elif pa.types.is_string(field.type):
+            # The same text as a value of the batch being written would get (see _arrow_array)
+            arrays.append(_arrow_array(array.to_pylist(), field.type))
+        else:
+            try:
+                arrays.append(array.cast(field.type))
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                raise _LossyCast(i) from None
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
@@ -1,5 +1,5 @@
 from django.forms import BooleanField, CharField, ModelForm, ValidationError
-from django.forms.widgets import CheckboxInput, Select
+from django.forms.widgets import CheckboxInput, NumberInput, Select
 from django.db.models import Value, IntegerField, When, Case
 
 from explorer.models import MSG_FAILED_BLACKLIST, Query
@@ -83,4 +83,14 @@ class QueryForm(ModelForm):
 
     class Meta:
         model = Query
-        fields = ["title", "sql", "description", "snapshot", "database_connection", "few_shot"]
+        fields = ["title", "sql", "description", "snapshot", "database_connection", "few_shot", "timeout",
+                  "cache_ttl", "snapshot_interval"]
+        widgets = {
+            # Rendered below the results, outside of the editor <form> element
+            "timeout": NumberInput(attrs={"class": "form-control form-control-sm d-inline-block w-auto",
+                                          "form": "editor"}),
+            "cache_ttl": NumberInput(attrs={"class": "form-control form-control-sm d-inline-block w-auto",
+                                            "form": "editor"}),
+            "snapshot_interval": NumberInput(attrs={"class": "form-control form-control-sm d-inline-block w-auto",
+                                                    "form": "editor"}),
+        }
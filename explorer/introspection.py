@@ -0,0 +1,174 @@
+"""
+Describe every table in a database with one catalog query, rather than Django's query or more per table (see
+schema.build_schema_info). Field types come from the backend's own get_field_type() where possible, so they match
+describing each table; SQL Server and Snowflake use INFORMATION_SCHEMA_FIELD_TYPES.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import DatabaseError
+
+
+logger = logging.getLogger(__name__)
+
+
+def _field_info(field_info_class, **values):
+    # The backends' FieldInfo namedtuples grow fields between Django versions; leave the ones we don't know as None.
+    info = dict.fromkeys(field_info_class._fields)
+    info.update(values)
+    return field_info_class(**info)
+
+
+def _field_type(connection, data_type, description):
+    try:
+        return connection.introspection.get_field_type(data_type, description)
+    except KeyError:
+        return "Unknown"
+
+
+def _describe_sqlite(connection, cursor):
+    from django.db.backends.sqlite3.introspection import FieldInfo, get_field_size
+
+    cursor.execute("""
+        SELECT m.name, m.sql, p.name, p.type, p.pk
+        FROM sqlite_master m, pragma_table_xinfo(m.name) p
+        WHERE m.type IN ('table', 'view') AND p.hidden IN (0, 2, 3)
+        ORDER BY m.name, p.cid
+    """)
+    can_introspect_json = connection.features.can_introspect_json_field
+    ret = defaultdict(list)
+    for table_name, table_sql, column_name, data_type, pk in cursor.fetchall():
+        has_json_constraint = bool(
+            can_introspect_json and table_sql and f'json_valid("{column_name.lower()}")' in table_sql.lower()
+        )
+        description = _field_info(
+            FieldInfo, name=column_name, type_code=data_type, display_size=get_field_size(data_type), pk=pk == 1,
+            has_json_constraint=has_json_constraint
+        )
+        ret[table_name].append((column_name, _field_type(connection, data_type, description)))
+    return ret
+
+
+def _describe_postgresql(connection, cursor):
+    from django.db.backends.postgresql.introspection import FieldInfo
+
+    # Domains are described by their base type, as they are in query results.
+    cursor.execute("""
+        SELECT
+            c.relname, a.attname,
+            CASE WHEN t.typtype = 'd' THEN t.typbasetype ELSE a.atttypid END,
+            pg_get_expr(ad.adbin, ad.adrelid),
+            a.attidentity != ''
+        FROM pg_catalog.pg_attribute a
+        JOIN pg_catalog.pg_class c ON a.attrelid = c.oid
+        JOIN pg_catalog.pg_namespace n ON c.relnamespace = n.oid
+        JOIN pg_catalog.pg_type t ON a.atttypid = t.oid
+        LEFT JOIN pg_catalog.pg_attrdef ad ON a.attrelid = ad.adrelid AND a.attnum = ad.adnum
+        WHERE c.relkind IN ('f', 'm', 'p', 'r', 'v')
+            AND n.nspname NOT IN ('pg_catalog', 'pg_toast')
+            AND pg_catalog.pg_table_is_visible(c.oid)
+            AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY c.relname, a.attnum
+    """)
+    ret = defaultdict(list)
+    for table_name, column_name, type_code, default, is_autofield in cursor.fetchall():
+        description = _field_info(
+            FieldInfo, name=column_name, type_code=type_code, default=default, is_autofield=is_autofield
+        )
+        ret[table_name].append((column_name, _field_type(connection, type_code, description)))
+    return ret
+
+
+# The type codes MySQL reports in query results for each information_schema data type
+MYSQL_TYPE_CODES = {
+    "tinyint": "TINY", "smallint": "SHORT", "mediumint": "INT24", "int": "LONG", "integer": "LONG",
+    "bigint": "LONGLONG", "decimal": "NEWDECIMAL", "numeric": "NEWDECIMAL", "float": "FLOAT", "double": "DOUBLE",
+    "real": "DOUBLE", "char": "STRING", "varchar": "VAR_STRING", "binary": "STRING", "varbinary": "VAR_STRING",
+    "tinytext": "BLOB", "text": "BLOB", "mediumtext": "BLOB", "longtext": "BLOB", "tinyblob": "BLOB", "blob": "BLOB",
+    "mediumblob": "BLOB", "longblob": "BLOB", "enum": "STRING", "set": "STRING", "date": "DATE",
+    "datetime": "DATETIME", "timestamp": "TIMESTAMP", "time": "TIME", "year": "YEAR", "json": "JSON", "bit": "BIT",
+}
+
+
+def _describe_mysql(connection, cursor):
+    from django.db.backends.mysql.introspection import FieldInfo
+    from MySQLdb.constants import FIELD_TYPE
+
+    cursor.execute("""
+        SELECT table_name, column_name, data_type, extra, column_type LIKE '% unsigned'
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE()
+        ORDER BY table_name, ordinal_position
+    """)
+    ret = defaultdict(list)
+    for table_name, column_name, data_type, extra, is_unsigned in cursor.fetchall():
+        type_code = getattr(FIELD_TYPE, MYSQL_TYPE_CODES.get(data_type.lower(), ""), None)
+        description = _field_info(
+            FieldInfo, name=column_name, type_code=type_code, extra=extra or "", is_unsigned=bool(is_unsigned),
+            has_json_constraint=False, data_type=data_type
+        )
+        ret[table_name].append((column_name, _field_type(connection, type_code, description)))
+    return ret
+
+
+INFORMATION_SCHEMA_FIELD_TYPES = {
+    "bigint": "BigIntegerField", "int": "IntegerField", "integer": "IntegerField", "smallint": "SmallIntegerField",
+    "tinyint": "SmallIntegerField", "bit": "BooleanField", "boolean": "BooleanField",
+    "decimal": "DecimalField", "numeric": "DecimalField", "number": "DecimalField", "money": "DecimalField",
+    "smallmoney": "DecimalField", "float": "FloatField", "real": "FloatField", "double": "FloatField",
+    "char": "CharField", "nchar": "CharField", "varchar": "CharField", "nvarchar": "CharField",
+    "text": "TextField", "ntext": "TextField", "date": "DateField", "time": "TimeField",
+    "datetime": "DateTimeField", "datetime2": "DateTimeField", "smalldatetime": "DateTimeField",
+    "datetimeoffset": "DateTimeField", "timestamp_ltz": "DateTimeField", "timestamp_ntz": "DateTimeField",
+    "timestamp_tz": "DateTimeField", "uniqueidentifier": "UUIDField", "binary": "BinaryField",
+    "varbinary": "BinaryField", "variant": "JSONField", "object": "JSONField", "array": "JSONField",
+}
+
+
+def _information_schema_describer(schema_function):
+    def describe(connection, cursor):
+        cursor.execute(f"""
+            SELECT table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = {schema_function}
+            ORDER BY table_name, ordinal_position
+        """)
+        ret = defaultdict(list)
+        for table_name, column_name, data_type in cursor.fetchall():
+            ret[table_name].append(
+                (column_name, INFORMATION_SCHEMA_FIELD_TYPES.get(data_type.lower(), "Unknown"))
+            )
+        return ret
+    return describe
+
+
+BULK_INTROSPECTORS = {
+    "sqlite": _describe_sqlite,
+    "postgresql": _describe_postgresql,
+    "mysql": _describe_mysql,
+    "microsoft": _information_schema_describer("SCHEMA_NAME()"),
+    "snowflake": _information_schema_describer("CURRENT_SCHEMA()"),
+}
+
+
+def describe_all_tables(connection, cursor):
+    """
+    Describe all the tables in the database with a single catalog query.
+
+    :return: A dict of table name to [(column_name, field_type)], or None if there is no bulk introspector for the
+             database's vendor or it failed, in which case tables have to be described one at a time.
+    """
+    introspector = BULK_INTROSPECTORS.get(connection.vendor)
+    if introspector is None:
+        return None
+    try:
+        described = introspector(connection, cursor)
+    except (DatabaseError, ImportError) as e:
+        logger.info(f"Couldn't describe all tables at once, describing them one at a time: {e}")
+        return None
+    # Named as the backend's own introspection names them (e.g. Snowflake's uppercase identifiers are lowercased)
+    convert = connection.introspection.identifier_converter
+    return {
+        convert(table_name): [(convert(column_name), field_type) for column_name, field_type in columns]
+        for table_name, columns in described.items()
+    }
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from explorer.models import QueryStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the run statistics of saved queries from their query logs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "query_ids", nargs="*", type=int,
+            help="Only rebuild the statistics of these queries (default: all of them)"
+        )
+
+    def handle(self, *args, **options):
+        count = QueryStats.rebuild(options["query_ids"] or None)
+        self.stdout.write(f"Rebuilt run statistics for {count} queries.")
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0028_promptlog_database_connection_promptlog_user_request'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='databaseconnection',
+            name='query_timeout',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum number of seconds a query may run for on this connection. Leave blank for no limit.', null=True),
+        ),
+        migrations.AddField(
+            model_name='query',
+            name='timeout',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum number of seconds this query may run for. Overrides the timeout of the database connection.', null=True),
+        ),
+        migrations.AddField(
+            model_name='querylog',
+            name='backend_pid',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0029_query_timeouts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='query',
+            name='cache_ttl',
+            field=models.PositiveIntegerField(blank=True, help_text='Cache the results of this query for this many seconds. Leave blank to always re-run it.', null=True),
+        ),
+    ]
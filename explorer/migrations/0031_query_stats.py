@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 07:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0030_query_cache_ttl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryStats',
+            fields=[
+                ('query', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='explorer.query')),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_run_success', models.BooleanField(blank=True, null=True)),
+                ('duration_count', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.FloatField(default=0)),
+                ('max_duration', models.FloatField(blank=True, null=True)),
+                ('duration_histogram', models.JSONField(default=list)),
+                ('p50_duration', models.FloatField(blank=True, null=True)),
+                ('p95_duration', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Query stats',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0031_query_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='query',
+            name='last_snapshot_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='query',
+            name='snapshot_interval',
+            field=models.PositiveIntegerField(blank=True, help_text='Snapshot this query every this many minutes. Leave blank for the default, which is daily.', null=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
 import logging
+from collections import namedtuple
+from operator import itemgetter
 from time import time
 import uuid
 
@@ -8,13 +10,19 @@ from django.db import DatabaseError, models, transaction
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
-from explorer import app_settings
+from explorer import app_settings, query_stats
+from explorer.column_stats import summarize
+from explorer.columnar import ColumnarRows
 from explorer.telemetry import Stat, StatNames
 from explorer.utils import (
-    extract_params, get_params_for_url, get_s3_bucket, passes_blacklist, s3_url,
+    bind_params, extract_params, get_params_for_url, get_s3_bucket, passes_blacklist, s3_url,
     shared_dict_update, swap_params,
 )
-from explorer.ee.db_connections.utils import default_db_connection
+from explorer.ee.db_connections.utils import (
+    backend_pid, begin_transaction, cancel_backend, connection_transaction, default_db_connection, end_transaction,
+    statement_timeout,
+)
+from explorer.result_cache import cache_result, get_cached_result, result_cache_key
 
 
 # Issue #618. All models must be imported so that Django understands how to manage migrations for the app
@@ -58,6 +66,13 @@ class Query(models.Model):
     database_connection = models.ForeignKey(to=DatabaseConnection, on_delete=models.SET_NULL, null=True)
     few_shot = models.BooleanField(default=False, help_text=_(
         "Will be included as a good example of SQL in assistant queries that use relevant tables"))
+    timeout = models.PositiveIntegerField(blank=True, null=True, help_text=_(
+        "Maximum number of seconds this query may run for. Overrides the timeout of the database connection."))
+    cache_ttl = models.PositiveIntegerField(blank=True, null=True, help_text=_(
+        "Cache the results of this query for this many seconds. Leave blank to always re-run it."))
+    snapshot_interval = models.PositiveIntegerField(blank=True, null=True, help_text=_(
+        "Snapshot this query every this many minutes. Leave blank for the default, which is daily."))
+    last_snapshot_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     def __init__(self, *args, **kwargs):
         self.params = kwargs.get("params")
@@ -72,8 +87,19 @@ class Query(models.Model):
     def __str__(self):
         return str(self.title)
 
+    def get_stats(self):
+        """
+        This query's QueryStats: the ones loaded with select_related("stats") if they were, otherwise read fresh.
+        Queries that have never been run get empty, unsaved stats.
+        """
+        if Query.stats.is_cached(self):
+            stats = getattr(self, "stats", None)
+        else:
+            stats = QueryStats.objects.filter(query_id=self.pk).first()
+        return stats or QueryStats(query_id=self.pk)
+
     def get_run_count(self):
-        return self.querylog_set.count()
+        return self.get_stats().run_count
 
     def last_run_log(self):
         ql = self.querylog_set.first()
@@ -82,13 +108,11 @@ class Query(models.Model):
     def avg_duration_display(self):
         d = self.avg_duration()
         if d:
-            return f"{self.avg_duration():10.3f}"
+            return f"{d:10.3f}"
         return ""
 
     def avg_duration(self):
-        return self.querylog_set.aggregate(
-            models.Avg("duration")
-        )["duration__avg"]
+        return self.get_stats().avg_duration
 
     def passes_blacklist(self):
         return passes_blacklist(self.final_sql())
@@ -96,7 +120,17 @@ class Query(models.Model):
     def final_sql(self):
         return swap_params(self.sql, self.available_params())
 
-    def execute_query_only(self):
+    def sql_and_params(self):
+        """
+        The SQL to execute and the parameters to pass to the driver with it. With EXPLORER_BIND_PARAMS, parameter
+        values are bound by the driver instead of being substituted into the SQL; otherwise this is
+        (final_sql(), None).
+        """
+        if app_settings.EXPLORER_BIND_PARAMS:
+            return bind_params(self.sql, self.available_params())
+        return self.final_sql(), None
+
+    def _check_blacklist(self):
         # check blacklist every time sql is run to catch parameterized SQL
         passes_blacklist_flag, failing_words = self.passes_blacklist()
 
@@ -108,30 +142,115 @@ class Query(models.Model):
                 error,
                 code="InvalidSql"
             )
-        conn = self.database_connection or default_db_connection()
+
+    def _database_connection(self):
+        return self.database_connection or default_db_connection()
+
+    def _django_connection(self):
+        return self._database_connection().as_django_connection()
+
+    def effective_timeout(self):
+        """
+        The statement timeout (in seconds) to run this query with: the query's own, else its connection's, else the
+        EXPLORER_DEFAULT_QUERY_TIMEOUT setting. None means no limit.
+        """
+        return (self.timeout or self._database_connection().query_timeout or
+                app_settings.EXPLORER_DEFAULT_QUERY_TIMEOUT)
+
+    def execute_query_only(self, stream=False, max_rows=None, on_execute=None):
+        """
+        Run the query without processing or logging it.
+
+        :param stream: If True, return a StreamingQueryResult whose rows are pulled from the cursor in batches as
+                       they are iterated, rather than a QueryResult holding the entire result set in memory.
+        :param max_rows: Optional. Only fetch this many rows. See QueryResult.
+        :param on_execute: Optional. See QueryResult.
+        """
+        self._check_blacklist()
+        sql, params = self.sql_and_params()
+        if stream:
+            return StreamingQueryResult(
+                sql, self._django_connection(),
+                options=ExecutionOptions(params=params, timeout=self.effective_timeout())
+            )
         return QueryResult(
-            self.final_sql(), conn.as_django_connection()
+            sql, self._django_connection(), max_rows=max_rows,
+            options=ExecutionOptions(params=params, timeout=self.effective_timeout(), on_execute=on_execute)
         )
 
-    def execute_with_logging(self, executing_user):
-        ql = self.log(executing_user)
-        ql.save()
+    def count_rows(self):
+        """
+        Count the rows the query returns, without fetching them. Used when results were fetched with max_rows and
+        the result set turned out to be larger.
+        """
+        self._check_blacklist()
+        sql, params = self.sql_and_params()
+        sql = sql.strip().rstrip(";")
+        connection = self._django_connection()
+        # Counting can cost as much as running the query, so it is held to the same timeout
+        with connection_transaction(connection), connection.cursor() as cursor:
+            with statement_timeout(connection, self.effective_timeout()):
+                # No AS before the alias, because Oracle doesn't allow one there.
+                # The newline ends any -- comment the SQL finishes with, which would otherwise swallow the parenthesis.
+                cursor.execute(f"SELECT COUNT(*) FROM ({sql}\n) explorer_count", params)
+            return cursor.fetchone()[0]
+
+    def result_cache_key(self, max_rows=None):
+        return result_cache_key(self.final_sql(), self._database_connection().id, max_rows)
+
+    def cached_result(self, max_rows=None):
+        """
+        The cached results of running this query (see result_cache.py), or None if it isn't cached or has no cache_ttl.
+        """
+        if not self.cache_ttl:
+            return None
+        self._check_blacklist()
+        return get_cached_result(self.result_cache_key(max_rows))
+
+    def execute_with_logging(self, executing_user, max_rows=None, refresh=False):
+        """
+        Run the query and log it. If the query has a cache_ttl and there are cached results (and refresh isn't
+        set) those are returned instead, without running or logging anything, and the returned QueryLog is None.
+
+        The log is normally written before the query runs, so that running queries can be seen and cancelled, and
+        updated when it finishes. With EXPLORER_BUFFERED_QUERY_LOGS it is only written once the query has finished.
+        """
+        if not refresh:
+            ret = self.cached_result(max_rows)
+            if ret is not None:
+                return ret, None
+        buffered = app_settings.EXPLORER_BUFFERED_QUERY_LOGS
+        ql = self.log(executing_user, save=not buffered)
         try:
-            ret = self.execute()
-        except DatabaseError as e:
-            ql.success = False
-            ql.error = str(e)
-            ql.save()
-            raise e
-        ql.duration = ret.duration
-        ql.save()
+            ret = self.execute(max_rows=max_rows, on_execute=None if buffered else ql.record_backend_pid,
+                               refresh=True)
+        except Exception as e:
+            ql.finish(error=str(e))
+            raise
+        else:
+            ql.finish(duration=ret.duration)
+        finally:
+            # Anything that gets past the handler above (e.g. a worker being shut down) mustn't leave the log looking
+            # like it is still running
+            if ql.backend_pid is not None:
+                QueryLog.objects.filter(pk=ql.pk).update(backend_pid=None)
         Stat(StatNames.QUERY_RUN,
              {"sql_len": len(ql.sql), "duration": ql.duration}).track()
         return ret, ql
 
-    def execute(self):
-        ret = self.execute_query_only()
+    def execute(self, max_rows=None, on_execute=None, refresh=False):
+        """
+        Run and process the query. If the query has a cache_ttl, results are served from the cache when they can be
+        (unless refresh is set), and fresh results are cached.
+        """
+        if not refresh:
+            ret = self.cached_result(max_rows)
+            if ret is not None:
+                return ret
+        ret = self.execute_query_only(max_rows=max_rows, on_execute=on_execute)
         ret.process()
+        if self.cache_ttl:
+            cache_result(self.result_cache_key(max_rows), ret, self.cache_ttl)
         return ret
 
     def available_params(self):
@@ -172,7 +291,14 @@ class Query(models.Model):
     def params_for_url(self):
         return get_params_for_url(self)
 
-    def log(self, user=None):
+    def log(self, user=None, save=True):
+        """
+        Log a run of this query.
+
+        The run is counted in the query's QueryStats when it finishes (see QueryLog.finish).
+
+        :param save: Whether to save the log now. If not, it is saved by QueryLog.finish().
+        """
         if user:
             if user.is_anonymous:
                 user = None
@@ -182,7 +308,8 @@ class Query(models.Model):
             run_by_user=user,
             database_connection=self.database_connection,
         )
-        ql.save()
+        if save:
+            ql.save()
         return ql
 
     @property
@@ -241,15 +368,112 @@ class QueryLog(models.Model):
     database_connection = models.ForeignKey(to=DatabaseConnection, on_delete=models.SET_NULL, null=True)
     success = models.BooleanField(default=True)
     error = models.TextField(blank=True, null=True)
+    # Database-side process id of the connection running the query, while it is running, so that it can be cancelled.
+    backend_pid = models.IntegerField(blank=True, null=True)
 
     @property
     def is_playground(self):
         return self.query_id is None
 
+    @property
+    def is_running(self):
+        return self.backend_pid is not None and self.duration is None and self.success
+
+    def record_backend_pid(self, connection):
+        self.backend_pid = backend_pid(connection)
+        if self.backend_pid is not None:
+            QueryLog.objects.filter(pk=self.pk).update(backend_pid=self.backend_pid)
+
+    def finish(self, duration=None, error=None):
+        """
+        Record how this run ended, and add it to its query's QueryStats. A log that wasn't saved when the run started
+        (see Query.log) is saved now, with run_at being the time the run finished.
+
+        :param duration: How long the query took, in milliseconds
+        :param error: The error the query failed with, or None if it succeeded
+        """
+        self.duration = duration
+        self.success = error is None
+        self.error = error
+        self.backend_pid = None
+        self.save()
+        if self.query_id:
+            QueryStats.record_finished(self)
+
+    def cancel(self):
+        """
+        Cancel the query, if it is still running, by killing the statement being run by its backend process. This
+        uses a separate connection to the same database.
+
+        :return: True if a running query was cancelled
+        """
+        if not self.is_running:
+            return False
+        # Logs of queries on the default connection don't record it (see Query.log)
+        db_connection = self.database_connection or default_db_connection()
+        if db_connection is None:
+            return False
+        return cancel_backend(db_connection.as_django_connection(), self.backend_pid)
+
     class Meta:
         ordering = ["-run_at"]
 
 
+class QueryStats(models.Model):
+    """
+    Run statistics for a query, rolled up from its QueryLogs as they are written (see query_stats.py). Because they
+    are kept separately, they outlive the logs they were computed from (e.g. after truncate_querylogs), and can be
+    recomputed from the logs that remain with the rebuild_query_stats management command.
+    """
+    query = models.OneToOneField(Query, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    run_count = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    last_run_success = models.BooleanField(blank=True, null=True)
+    # Successful runs that recorded a duration, in milliseconds
+    duration_count = models.PositiveIntegerField(default=0)
+    total_duration = models.FloatField(default=0)
+    max_duration = models.FloatField(blank=True, null=True)
+    # Run counts per query_stats.DURATION_BUCKETS bucket
+    duration_histogram = models.JSONField(default=list)
+    p50_duration = models.FloatField(blank=True, null=True)
+    p95_duration = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        verbose_name_plural = _("Query stats")
+
+    @property
+    def avg_duration(self):
+        return self.total_duration / self.duration_count if self.duration_count else None
+
+    @classmethod
+    def _update(cls, query_id, update):
+        # Read-modify-write under a row lock, so that concurrent runs of the same query don't lose updates.
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().filter(query_id=query_id).first()
+            if stats is None:
+                cls.objects.get_or_create(query_id=query_id)
+                stats = cls.objects.select_for_update().get(query_id=query_id)
+            update(stats)
+            stats.save()
+
+    @classmethod
+    def record_finished(cls, ql):
+        """
+        Count a finished run, and how it ended, in one update of the query's stats.
+        """
+        def update(stats):
+            query_stats.record_started(stats, ql.run_at)
+            query_stats.record_finished(stats, ql.run_at, ql.success, ql.duration)
+            query_stats.update_percentiles(stats)
+        cls._update(ql.query_id, update)
+
+    @classmethod
+    def rebuild(cls, query_ids=None):
+        return query_stats.rebuild(QueryLog, cls, query_ids)
+
+
 class QueryFavorite(models.Model):
     query = models.ForeignKey(
         Query,
@@ -266,24 +490,67 @@ class QueryFavorite(models.Model):
         unique_together = ["query", "user"]
 
 
+# How to run a QueryResult's SQL: see QueryResult
+ExecutionOptions = namedtuple("ExecutionOptions", ["params", "timeout", "on_execute"], defaults=(None, None, None))
+
+
 class QueryResult:
+    """
+    Executes the SQL and loads the results.
+
+    If max_rows is given, at most that many rows are fetched (with fetchmany(), from a server-side cursor on Postgres),
+    and has_more says whether any were left behind. options are ExecutionOptions: params for the driver, a timeout in
+    seconds (see statement_timeout), and on_execute, called with the connection just before the SQL runs.
+
+    Processed results can be pickled for the result cache, without the connection; cached_at is when they were cached.
+    """
 
-    def __init__(self, sql, connection):
+    def __init__(self, sql, connection, max_rows=None, options=None):
 
+        options = options or ExecutionOptions()
         self.sql = sql
+        self.params = options.params
         self.connection = connection
+        self.max_rows = max_rows
+        self.timeout = options.timeout
+        self.has_more = False
+        self.cached_at = None
+
+        if options.on_execute:
+            options.on_execute(connection)
+
+        if max_rows is None:
+            cursor, duration = self.execute_query()
+            self._description = cursor.description or []
+            rows = cursor.fetchall()
+            cursor.close()
+        else:
+            self._description, rows, duration = self.execute_query_limited()
+            self.has_more = len(rows) > max_rows
+            rows = rows[:max_rows]
 
-        cursor, duration = self.execute_query()
+        if app_settings.EXPLORER_COLUMNAR_RESULTS:
+            self._data = ColumnarRows.from_rows(rows, len(self._description))
+        else:
+            self._data = [list(r) for r in rows]
 
-        self._description = cursor.description or []
-        self._data = [list(r) for r in cursor.fetchall()]
         self.duration = duration
 
-        cursor.close()
-
         self._headers = self._get_headers()
         self._summary = {}
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connection"] = None
+        # Some drivers' column descriptions aren't picklable
+        state["_description"] = [tuple(d) for d in self._description]
+        return state
+
+    @property
+    def cache_age(self):
+        if self.cached_at is not None:
+            return time() - self.cached_at
+
     @property
     def data(self):
         return self._data or []
@@ -322,9 +589,33 @@ class QueryResult:
             for ix, h in enumerate(self.headers) if str(h) in transforms.keys()
         ]
 
+    @property
+    def is_columnar(self):
+        return isinstance(self._data, ColumnarRows)
+
     def column(self, ix):
+        if self.is_columnar:
+            return self._data.columns[ix]
         return [r[ix] for r in self.data]
 
+    def columns(self, ixs):
+        """
+        The values of several columns, collected in a single pass over the rows (unless they are stored by column
+        already).
+        """
+        if self.is_columnar:
+            return [self._data.columns[ix] for ix in ixs]
+        if not ixs:
+            return []
+        if len(ixs) == 1:
+            return [self.column(ixs[0])]
+        if not self.data:
+            return [[] for _ in ixs]
+        return list(zip(*map(itemgetter(*ixs), self.data), strict=True))
+
+    def iter_rows(self):
+        return iter(self.data)
+
     def process(self):
         start_time = time()
 
@@ -334,12 +625,16 @@ class QueryResult:
         logger.info("Explorer Query Processing took %sms." % ((time() - start_time) * 1000))
 
     def process_columns(self):
-        for ix in self._get_numerics():
-            self.headers[ix].add_summary(self.column(ix))
+        numerics = self._get_numerics()
+        for ix, col in zip(numerics, self.columns(numerics), strict=True):
+            self.headers[ix].add_summary(col)
 
     def process_rows(self):
         transforms = self._get_transforms()
-        if transforms:
+        if transforms and self.is_columnar:
+            for ix, t in transforms:
+                self._data.set_column(ix, [t.format(str(v)) for v in self.column(ix)])
+        elif transforms:
             for r in self.data:
                 for ix, t in transforms:
                     r[ix] = t.format(str(r[ix]))
@@ -349,14 +644,134 @@ class QueryResult:
         start_time = time()
 
         try:
-            with transaction.atomic(self.connection.alias):
-                cursor.execute(self.sql)
+            with connection_transaction(self.connection):
+                with statement_timeout(self.connection, self.timeout):
+                    cursor.execute(self.sql, self.params)
         except DatabaseError as e:
             cursor.close()
             raise e
 
         return cursor, ((time() - start_time) * 1000)
 
+    def execute_query_limited(self):
+        start_time = time()
+
+        # The cursor is created and read inside the transaction. On Postgres that makes it a plain (not WITH HOLD)
+        # named cursor, so the server stops producing rows once we stop fetching them.
+        with connection_transaction(self.connection):
+            cursor = self.connection.chunked_cursor()
+            try:
+                with statement_timeout(self.connection, self.timeout):
+                    cursor.execute(self.sql, self.params)
+                    rows = cursor.fetchmany(self.max_rows + 1)
+                description = cursor.description or []
+            finally:
+                cursor.close()
+
+        return description, rows, ((time() - start_time) * 1000)
+
+
+class StreamingQueryResult(QueryResult):
+    """
+    A QueryResult whose rows are fetched in batches of EXPLORER_STREAM_FETCH_SIZE as iter_rows() is consumed, which it
+    can be only once. On Postgres they come from a named cursor, in a transaction that stays open until the rows have
+    been read or close() is called. MySQL's driver reads the whole result on execute regardless.
+    """
+
+    def __init__(self, sql, connection, fetch_size=None, options=None):
+
+        options = options or ExecutionOptions()
+        self.sql = sql
+        self.params = options.params
+        self.connection = connection
+        self.fetch_size = fetch_size or app_settings.EXPLORER_STREAM_FETCH_SIZE
+        self.timeout = options.timeout
+        self.max_rows = None
+        self.has_more = False
+        self.cached_at = None
+        self._data = None
+        self._cursor = None
+        self._transaction = None
+
+        if options.on_execute:
+            options.on_execute(connection)
+
+        self._cursor, duration = self.execute_query()
+
+        # Named cursors only populate the description once the first batch has been fetched, and that is also where
+        # they surface any errors in the SQL.
+        try:
+            self._first_batch = self._cursor.fetchmany(self.fetch_size)
+        except DatabaseError as e:
+            self.close(failed=True)
+            raise e
+        self._description = self._cursor.description or []
+        self.duration = duration
+
+        self._headers = self._get_headers()
+        self._summary = {}
+
+    @property
+    def data(self):
+        # For callers that need random access to the rows. This materializes whatever is left on the cursor, so it
+        # gives up the memory benefits of streaming.
+        if self._data is None:
+            self._data = list(self.iter_rows())
+        return self._data
+
+    def iter_rows(self):
+        if self._data is not None:
+            yield from self._data
+            return
+        if self._cursor is None:
+            return
+        try:
+            batch = self._first_batch
+            self._first_batch = None
+            while batch:
+                for r in batch:
+                    yield list(r)
+                batch = self._cursor.fetchmany(self.fetch_size)
+        except BaseException:
+            # Including GeneratorExit, when the rows are abandoned part-way (e.g. a download is cancelled)
+            self.close(failed=True)
+            raise
+        self.close()
+
+    def close(self, failed=False):
+        """
+        Close the cursor and end the transaction it was read in: committed, or rolled back if reading failed.
+        """
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        if self._transaction is not None:
+            token, self._transaction = self._transaction, None
+            end_transaction(self.connection, token, failed)
+
+    def _uses_named_cursor(self):
+        return (self.connection.vendor == "postgresql" and
+                not self.connection.settings_dict.get("DISABLE_SERVER_SIDE_CURSORS"))
+
+    def execute_query(self):
+        # A named cursor is created inside a transaction that close() ends, rather than in autocommit mode. One created
+        # outside a transaction is declared WITH HOLD, which makes the server run the whole query and keep a copy of
+        # its result before the first row can be fetched.
+        if self._uses_named_cursor():
+            self._transaction = begin_transaction(self.connection)
+        cursor = self.connection.chunked_cursor()
+        start_time = time()
+
+        try:
+            with statement_timeout(self.connection, self.timeout):
+                cursor.execute(self.sql, self.params)
+        except DatabaseError as e:
+            cursor.close()
+            self.close(failed=True)
+            raise e
+
+        return cursor, ((time() - start_time) * 1000)
+
 
 class ColumnHeader:
 
@@ -373,16 +788,10 @@ class ColumnHeader:
 
 class ColumnStat:
 
-    def __init__(self, label, statfn, precision=2, handles_null=False):
+    def __init__(self, label, value, precision=2):
         self.label = label
-        self.statfn = statfn
         self.precision = precision
-        self.handles_null = handles_null
-
-    def __call__(self, coldata):
-        self.value = round(
-            float(self.statfn(coldata)), self.precision
-        ) if coldata else 0
+        self.value = round(float(value), precision)
 
     def __str__(self):
         return self.label
@@ -393,19 +802,9 @@ class ColumnSummary:
     def __init__(self, header, col):
         self._header = header
         self._stats = [
-            ColumnStat("Sum", sum),
-            ColumnStat("Avg", lambda x: float(sum(x)) / float(len(x))),
-            ColumnStat("Min", min),
-            ColumnStat("Max", max),
-            ColumnStat(
-                "NUL",
-                lambda x: int(sum(map(lambda y: 1 if y is None else 0, x))), 0, True
-            )
+            ColumnStat(label, value, precision)
+            for label, value, precision in summarize(col, app_settings.EXPLORER_SUMMARY_EXTRA_STATS)
         ]
-        without_nulls = list(map(lambda x: 0 if x is None else x, col))
-
-        for stat in self._stats:
-            stat(col) if stat.handles_null else stat(without_nulls)
 
     @property
     def stats(self):
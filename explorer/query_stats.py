@@ -0,0 +1,94 @@
+"""
+Run statistics for saved queries, rolled up from their QueryLogs (see QueryStats) as runs finish, and by rebuild().
+Durations are kept as a histogram over DURATION_BUCKETS, so p50 and p95 are the upper bounds of the buckets they fall
+in (capped at the longest duration seen).
+"""
+from django.db import transaction
+from django.db.models import Q
+
+# Upper bounds, in milliseconds, of the duration histogram's buckets. There is one more bucket, for anything longer.
+DURATION_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+
+REBUILD_CHUNK_SIZE = 2000
+
+
+def bucket_for(duration):
+    for i, bound in enumerate(DURATION_BUCKETS):
+        if duration <= bound:
+            return i
+    return len(DURATION_BUCKETS)
+
+
+def histogram_percentile(histogram, max_duration, pct):
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = pct / 100 * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            bound = DURATION_BUCKETS[i] if i < len(DURATION_BUCKETS) else max_duration
+            return min(bound, max_duration)
+    return max_duration
+
+
+def record_started(stats, run_at):
+    stats.run_count += 1
+    if stats.last_run_at is None or run_at >= stats.last_run_at:
+        stats.last_run_at = run_at
+        stats.last_run_success = True
+
+
+def record_finished(stats, run_at, success, duration):
+    if not success:
+        stats.failure_count += 1
+        if run_at == stats.last_run_at:
+            stats.last_run_success = False
+        return
+    stats.success_count += 1
+    if duration is None:
+        return
+    if len(stats.duration_histogram) != len(DURATION_BUCKETS) + 1:
+        stats.duration_histogram = [0] * (len(DURATION_BUCKETS) + 1)
+    stats.duration_histogram[bucket_for(duration)] += 1
+    stats.duration_count += 1
+    stats.total_duration += duration
+    if stats.max_duration is None or duration > stats.max_duration:
+        stats.max_duration = duration
+
+
+def update_percentiles(stats):
+    stats.p50_duration = histogram_percentile(stats.duration_histogram, stats.max_duration, 50)
+    stats.p95_duration = histogram_percentile(stats.duration_histogram, stats.max_duration, 95)
+
+
+def rebuild(querylog_model, stats_model, query_ids=None):
+    """
+    Recompute QueryStats from scratch, in one pass over the logs, for the given queries or for all of them.
+
+    :return: The number of queries that have stats
+    """
+    # Counted the same as QueryLog.finish() counts them: runs that are still going, or never finished, are left out
+    finished = Q(success=False) | Q(duration__isnull=False)
+    logs = querylog_model.objects.filter(finished, query__isnull=False).order_by()
+    existing = stats_model.objects.all()
+    if query_ids is not None:
+        logs = logs.filter(query_id__in=query_ids)
+        existing = existing.filter(query_id__in=query_ids)
+
+    rollup = {}
+    fields = ("query_id", "run_at", "success", "duration")
+    for query_id, run_at, success, duration in logs.values_list(*fields).iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        stats = rollup.get(query_id)
+        if stats is None:
+            stats = rollup[query_id] = stats_model(query_id=query_id, duration_histogram=[])
+        record_started(stats, run_at)
+        record_finished(stats, run_at, success, duration)
+    for stats in rollup.values():
+        update_percentiles(stats)
+
+    with transaction.atomic():
+        existing.delete()
+        stats_model.objects.bulk_create(rollup.values(), batch_size=REBUILD_CHUNK_SIZE)
+    return len(rollup)
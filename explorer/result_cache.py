@@ -0,0 +1,155 @@
+"""
+Cache of the results of queries with a cache_ttl. Entries are keyed by the final SQL, connection and row limit, and
+stored pickled in a Django cache or in files, least recently used ones being evicted to stay under
+EXPLORER_RESULT_CACHE_MAX_SIZE.
+"""
+import hashlib
+import logging
+import os
+import pickle
+from time import time
+
+from django.core.cache import caches
+
+from explorer import app_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def result_cache_key(sql, connection_id, max_rows=None):
+    digest = hashlib.sha256(f"{connection_id}:{max_rows}:{sql}".encode()).hexdigest()
+    return f"_explorer_result_{digest}"
+
+
+class DjangoCacheStorage:
+    """
+    Entries in a Django cache, with an index of their sizes, last use and expiry for enforcing the size limit.
+    """
+
+    index_key = "_explorer_result_cache_index"
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        value = self.cache.get(key)
+        if value is not None:
+            index = self.cache.get(self.index_key, {})
+            if key in index:
+                index[key][1] = time()
+                self.cache.set(self.index_key, index, None)
+        return value
+
+    def set(self, key, value, ttl):
+        now = time()
+        self.cache.set(key, value, ttl)
+        index = {k: v for k, v in self.cache.get(self.index_key, {}).items() if v[2] > now}
+        index[key] = [len(value), now, now + ttl]
+        total = sum(v[0] for v in index.values())
+        for k in sorted(index, key=lambda k: index[k][1]):
+            if total <= app_settings.EXPLORER_RESULT_CACHE_MAX_SIZE:
+                break
+            total -= index.pop(k)[0]
+            self.cache.delete(k)
+        self.cache.set(self.index_key, index, None)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+class DiskStorage:
+    """
+    An entry per file. Reading an entry bumps its file's modification time, which eviction goes by.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        # Expiry is checked when the entry is read (see get_cached_result)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= app_settings.EXPLORER_RESULT_CACHE_MAX_SIZE:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_storage():
+    if app_settings.EXPLORER_RESULT_CACHE_STORAGE == "disk":
+        directory = app_settings.EXPLORER_RESULT_CACHE_DIR or os.path.join(os.getcwd(), "explorer_result_cache")
+        return DiskStorage(directory)
+    return DjangoCacheStorage(app_settings.EXPLORER_RESULT_CACHE_ALIAS)
+
+
+def get_cached_result(key):
+    """
+    :return: The cached QueryResult, with cached_at set to when it was cached, or None if there is no fresh entry.
+    """
+    storage = get_storage()
+    value = storage.get(key)
+    if value is None:
+        return None
+    try:
+        expires_at, cached_at, result = pickle.loads(value)
+    except Exception as e:
+        logger.warning(f"Discarding unreadable cached query result: {e}")
+        storage.delete(key)
+        return None
+    if expires_at <= time():
+        storage.delete(key)
+        return None
+    result.cached_at = cached_at
+    return result
+
+
+def cache_result(key, result, ttl):
+    now = time()
+    try:
+        value = pickle.dumps((now + ttl, now, result))
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        # e.g. a driver returned values that can't be pickled
+        logger.warning(f"Query result could not be cached: {e}")
+        return
+    if len(value) > app_settings.EXPLORER_RESULT_CACHE_MAX_SIZE:
+        return
+    get_storage().set(key, value, ttl)
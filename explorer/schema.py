@@ -1,12 +1,69 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
 from django.core.cache import cache
-from django.db import ProgrammingError
+from django.db import DatabaseError, ProgrammingError, connections
 
+from explorer import app_settings
 from explorer.app_settings import (
     EXPLORER_SCHEMA_EXCLUDE_TABLE_PREFIXES,
     EXPLORER_SCHEMA_INCLUDE_TABLE_PREFIXES, EXPLORER_SCHEMA_INCLUDE_VIEWS,
 )
+from explorer.introspection import describe_all_tables
 from explorer.tasks import build_schema_cache_async
 from explorer.utils import InvalidExplorerConnectionException
+from explorer.ee.db_connections import pool
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_READY = "ready"
+SCHEMA_BUILDING = "building"
+SCHEMA_FAILED = "failed"
+SCHEMA_TIMED_OUT = "timed out"
+
+# How long a schema build may run before another one is allowed to start
+SCHEMA_BUILD_LOCK_TIMEOUT = 600
+# How long to wait after a failed background build before trying again
+SCHEMA_BUILD_RETRY_DELAY = 60
+SCHEMA_BUILD_POLL_INTERVAL = 0.5
+
+# For each database vendor, a query listing every table with a "stamp" that changes whenever the table's columns do.
+# Tables whose stamp is unchanged since they were last described are taken from the per-table cache rather than
+# described again. Tables on other vendors (or without a stamp) are always described.
+TABLE_STAMP_QUERIES = {
+    "sqlite": "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view')",
+    # pg_class and pg_attribute rows get a new xmin whenever a table or one of its columns is altered.
+    "postgresql": """
+        SELECT c.relname, c.xmin::text || ':' || string_agg(a.attnum || '.' || a.xmin::text, ',' ORDER BY a.attnum)
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+        WHERE c.relkind IN ('f', 'm', 'p', 'r', 'v') AND pg_catalog.pg_table_is_visible(c.oid)
+        GROUP BY c.relname, c.xmin::text
+    """,
+    # Built from the columns themselves: ALTER TABLE ... ALGORITHM=INSTANT doesn't change a table's create time, and
+    # views don't have one. Each column is checksummed rather than GROUP_CONCATed, as GROUP_CONCAT is cut off at
+    # group_concat_max_len (1024 bytes by default).
+    "mysql": """
+        SELECT table_name, CONCAT(COUNT(*), ':', SUM(CRC32(CONCAT_WS(':', ordinal_position, column_name, column_type,
+                                                                    is_nullable))))
+        FROM information_schema.columns WHERE table_schema = DATABASE()
+        GROUP BY table_name
+    """,
+    "microsoft": """
+        SELECT o.name, o.modify_date FROM sys.objects o
+        WHERE o.type IN ('U', 'V') AND o.schema_id = SCHEMA_ID()
+    """,
+    "snowflake": """
+        SELECT table_name, last_altered FROM information_schema.tables WHERE table_schema = CURRENT_SCHEMA()
+    """,
+}
 
 
 # These wrappers make it easy to mock and test
@@ -22,6 +79,10 @@ def _include_views():
     return EXPLORER_SCHEMA_INCLUDE_VIEWS is True
 
 
+def _run_in_background(func, *args):
+    threading.Thread(target=func, args=args, daemon=True).start()
+
+
 def _include_table(t):
     if _get_includes() is not None:
         return any([t.startswith(p) for p in _get_includes()])
@@ -32,8 +93,21 @@ def connection_schema_cache_key(connection_id):
     return f"_explorer_cache_key_{connection_id}"
 
 
-def connection_schema_json_cache_key(connection_id):
-    return f"_explorer_cache_key_json_{connection_id}"
+def connection_schema_stale_cache_key(connection_id):
+    return f"_explorer_cache_key_stale_{connection_id}"
+
+
+def connection_schema_lock_key(connection_id):
+    return f"_explorer_cache_key_lock_{connection_id}"
+
+
+def connection_schema_error_key(connection_id):
+    return f"_explorer_cache_key_error_{connection_id}"
+
+
+def connection_table_cache_key(connection_id, table_name):
+    # Table names can contain characters (and run to lengths) that some cache backends don't allow in keys
+    return f"_explorer_cache_key_{connection_id}_table_{hashlib.sha256(table_name.encode()).hexdigest()[:32]}"
 
 
 def transform_to_json_schema(schema_info):
@@ -45,34 +119,242 @@ def transform_to_json_schema(schema_info):
     return json_schema
 
 
-def schema_json_info(db_connection):
-    key = connection_schema_json_cache_key(db_connection.id)
+def encode_schema(schema_info):
+    """
+    Encode a schema (see build_schema_info) for the cache, as a compressed JSON document in which each field type is
+    stored once and columns refer to it by index.
+
+    :return: (version, payload). The version is a hash of the schema, so it only changes when the schema does.
+    """
+    types = {}
+    tables = [
+        [table_name, [[column_name, types.setdefault(field_type, len(types))] for column_name, field_type in columns]]
+        for table_name, columns in schema_info
+    ]
+    data = json.dumps({"types": list(types), "tables": tables}, separators=(",", ":")).encode()
+    return hashlib.sha256(data).hexdigest()[:20], zlib.compress(data)
+
+
+def decode_schema(payload):
+    data = json.loads(zlib.decompress(payload))
+    types = data["types"]
+    return [
+        (table_name, [(column_name, types[type_index]) for column_name, type_index in columns])
+        for table_name, columns in data["tables"]
+    ]
+
+
+def _cached_schema(key):
     ret = cache.get(key)
+    # Older versions of Explorer cached the schema as a list
+    return ret if isinstance(ret, tuple) else None
+
+
+def schema_payload(db_connection, wait=True):
+    """
+    The connection's encoded schema, as (version, payload) (see encode_schema). See schema_info() for how it is built,
+    and what wait does.
+    """
+    ret = _cached_schema(connection_schema_cache_key(db_connection.id))
     if ret:
         return ret
+    stale = _cached_schema(connection_schema_stale_cache_key(db_connection.id))
+    if stale or not wait:
+        start_schema_build(db_connection)
+        # The build may not have been in the background
+        return _cached_schema(connection_schema_cache_key(db_connection.id)) or stale
+    if cache.add(connection_schema_lock_key(db_connection.id), True, SCHEMA_BUILD_LOCK_TIMEOUT):
+        build_schema_cache_async(db_connection.id)
+        return _cached_schema(connection_schema_cache_key(db_connection.id))
+    return _wait_for_schema(db_connection)
+
+
+def schema_json_info(db_connection, wait=True):
+    """
+    The connection's schema as {table_name: [column_name, ...]}. See schema_info() for what wait does; without it,
+    this returns None if the schema isn't available yet.
+    """
     try:
-        si = schema_info(db_connection) or []
+        si = schema_info(db_connection, wait=wait)
     except InvalidExplorerConnectionException:
         return []
-    json_schema = transform_to_json_schema(si)
-    cache.set(key, json_schema)
-    return json_schema
+    return None if si is None else transform_to_json_schema(si)
+
+
+def schema_info(db_connection, wait=True):
+    """
+    The connection's schema (see build_schema_info), from the cache. While it is being built, the previous build's
+    schema is returned if there is one; otherwise this waits for it, or with wait=False starts it and returns None.
+    """
+    ret = schema_payload(db_connection, wait=wait)
+    return None if ret is None else decode_schema(ret[1])
+
+
+def schema_status(db_connection):
+    """
+    Get the connection's schema without waiting for it to be built (see schema_info).
+
+    :return: (SCHEMA_READY, schema), (SCHEMA_BUILDING, None) or, if the last build failed, (SCHEMA_FAILED, None)
+    """
+    schema = schema_info(db_connection, wait=False)
+    if schema is not None:
+        return SCHEMA_READY, schema
+    if cache.get(connection_schema_lock_key(db_connection.id)):
+        return SCHEMA_BUILDING, None
+    # The build finished (or failed) since schema_info() looked
+    ret = _cached_schema(connection_schema_cache_key(db_connection.id))
+    return (SCHEMA_READY, decode_schema(ret[1])) if ret else (SCHEMA_FAILED, None)
+
+
+def start_schema_build(db_connection):
+    """
+    Start building the connection's schema: with Celery if EXPLORER_ASYNC_SCHEMA is on, otherwise in a thread (or,
+    with EXPLORER_SCHEMA_BUILD_IN_BACKGROUND off, right here). Nothing happens if a build is already running, or if one
+    failed in the last SCHEMA_BUILD_RETRY_DELAY seconds.
+
+    :return: Whether a build was started
+    """
+    if cache.get(connection_schema_error_key(db_connection.id)):
+        return False
+    if not cache.add(connection_schema_lock_key(db_connection.id), True, SCHEMA_BUILD_LOCK_TIMEOUT):
+        return False
+    if app_settings.ENABLE_TASKS and app_settings.EXPLORER_ASYNC_SCHEMA:
+        build_schema_cache_async.delay(db_connection.id)
+    elif app_settings.EXPLORER_SCHEMA_BUILD_IN_BACKGROUND:
+        _run_in_background(_build_in_thread, db_connection.id)
+    else:
+        _build(db_connection.id)
+    return True
 
 
-def schema_info(db_connection):
+def _build(db_connection_id):
+    try:
+        build_schema_cache_async(db_connection_id)
+    except Exception as e:
+        logger.exception(f"Failed to build the schema of connection {db_connection_id}: {e}")
+        cache.set(connection_schema_error_key(db_connection_id), str(e), SCHEMA_BUILD_RETRY_DELAY)
+
+
+def _build_in_thread(db_connection_id):
+    try:
+        _build(db_connection_id)
+    finally:
+        _close_thread_connections()
+
+
+def _close_thread_connections():
+    # This thread's connections (pooled or Django's) would otherwise stay open until the thread is collected
+    pool.clear()
+    connections.close_all()
+
+
+def _wait_for_schema(db_connection):
     key = connection_schema_cache_key(db_connection.id)
-    ret = cache.get(key)
-    if ret:
+    deadline = monotonic() + SCHEMA_BUILD_LOCK_TIMEOUT
+    while monotonic() < deadline:
+        time.sleep(SCHEMA_BUILD_POLL_INTERVAL)
+        ret = _cached_schema(key)
+        if ret:
+            return ret
+        if not cache.get(connection_schema_lock_key(db_connection.id)):
+            break
+    # The other build failed or is taking too long; build it here instead
+    build_schema_cache_async(db_connection.id)
+    return _cached_schema(key)
+
+
+def build_and_cache_schema(db_connection):
+    """
+    Build the connection's schema and cache it, encoded (see encode_schema), as the current schema and as the schema
+    to serve while the next one is built. Then release the build lock.
+    """
+    try:
+        ret = build_schema_info(db_connection)
+        encoded = encode_schema(ret)
+        cache.set(connection_schema_cache_key(db_connection.id), encoded)
+        cache.set(connection_schema_stale_cache_key(db_connection.id), encoded, None)
+        cache.delete(connection_schema_error_key(db_connection.id))
         return ret
-    else:
-        return build_schema_cache_async(db_connection.id)
+    finally:
+        cache.delete(connection_schema_lock_key(db_connection.id))
+
+
+def rebuild_schema_cache(db_connection):
+    """
+    Rebuild the connection's cached schema now, unless a build of it is already running.
+
+    :return: A report of the build: {"connection": id, "alias": ..., "status": ..., "tables": number of tables,
+             "duration": seconds, "error": ...}. The status is SCHEMA_READY, SCHEMA_FAILED, or SCHEMA_BUILDING if
+             another build was already running.
+    """
+    report = {"connection": db_connection.id, "alias": db_connection.alias, "tables": None, "error": None}
+    started = monotonic()
+    if not cache.add(connection_schema_lock_key(db_connection.id), True, SCHEMA_BUILD_LOCK_TIMEOUT):
+        return {**report, "status": SCHEMA_BUILDING, "duration": 0}
+    try:
+        report["tables"] = len(build_and_cache_schema(db_connection))
+        report["status"] = SCHEMA_READY
+    except Exception as e:
+        logger.exception(f"Failed to build the schema of connection {db_connection.id}: {e}")
+        report["status"] = SCHEMA_FAILED
+        report["error"] = str(e) or type(e).__name__
+    report["duration"] = round(monotonic() - started, 3)
+    return report
+
+
+def _rebuild_with_budget(db_connection, time_budget):
+    # Django can't interrupt a query, so a build that overruns its budget is left to finish in its own thread (holding
+    # the connection's build lock) while the warm-up moves on.
+    report = {}
+
+    def build():
+        try:
+            report.update(rebuild_schema_cache(db_connection))
+        finally:
+            _close_thread_connections()
+
+    thread = threading.Thread(target=build, daemon=True)
+    thread.start()
+    thread.join(time_budget)
+    if thread.is_alive():
+        return {
+            "connection": db_connection.id, "alias": db_connection.alias, "status": SCHEMA_TIMED_OUT,
+            "tables": None, "duration": time_budget, "error": None,
+        }
+    return report
+
+
+def warm_schema_caches(db_connections, concurrency, time_budget):
+    """
+    Rebuild the cached schemas of several connections in a pool of `concurrency` threads, giving each build up to
+    `time_budget` seconds.
+
+    :return: The builds' reports (see rebuild_schema_cache), in the order of db_connections. Builds that ran out of
+             time have the status SCHEMA_TIMED_OUT.
+    """
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        return list(executor.map(lambda c: _rebuild_with_budget(c, time_budget), db_connections))
+
+
+def format_schema_report(report):
+    if report["status"] == SCHEMA_READY:
+        return f"{report['alias']}: {report['tables']} tables in {report['duration']:.1f}s"
+    if report["status"] == SCHEMA_FAILED:
+        return f"{report['alias']}: failed after {report['duration']:.1f}s ({report['error']})"
+    if report["status"] == SCHEMA_TIMED_OUT:
+        return f"{report['alias']}: still building after {report['duration']:.1f}s"
+    return f"{report['alias']}: skipped, it was already being built"
 
 
 def clear_schema_cache(db_connection):
     key = connection_schema_cache_key(db_connection.id)
     cache.delete(key)
 
-    key = connection_schema_json_cache_key(db_connection.id)
+    # Otherwise the old schema would still be served while the new one is built
+    key = connection_schema_stale_cache_key(db_connection.id)
+    cache.delete(key)
+
+    key = connection_schema_error_key(db_connection.id)
     cache.delete(key)
 
 
@@ -81,6 +363,11 @@ def build_schema_info(db_connection):
         Construct schema information via engine-specific queries of the
         tables in the DB.
 
+        Tables are cached individually too (see TABLE_STAMP_QUERIES), and
+        only tables that have changed since they were cached are described
+        again, with a single catalog query where the database supports it
+        (see introspection.py).
+
         :return: Schema information of the following form,
                  sorted by db_table_name.
             [
@@ -96,32 +383,72 @@ def build_schema_info(db_connection):
     connection = db_connection.as_django_connection()
     ret = []
     with connection.cursor() as cursor:
-        tables_to_introspect = connection.introspection.table_names(
-            cursor, include_views=_include_views()
-        )
+        tables_to_introspect = [
+            t for t in connection.introspection.table_names(cursor, include_views=_include_views())
+            if _include_table(t)
+        ]
+        stamps = _table_stamps(connection, cursor)
+        keys = {t: connection_table_cache_key(db_connection.id, t) for t in tables_to_introspect if t in stamps}
+        cached = cache.get_many(keys.values())
+        described = {}
+        # Described with one catalog query if any table needs describing, else (or if that fails) table by table
+        all_tables = None
 
         for table_name in tables_to_introspect:
-            if not _include_table(table_name):
+            key = keys.get(table_name)
+            hit = cached.get(key)
+            if hit and hit[0] == stamps[table_name]:
+                ret.append((table_name, hit[1]))
                 continue
-            try:
-                table_description = connection.introspection.get_table_description(
-                    cursor, table_name
-                )
-            # Issue 675. A connection maybe not have permissions to access some tables in the DB.
-            except ProgrammingError:
+            if all_tables is None:
+                all_tables = describe_all_tables(connection, cursor) or {}
+            td = all_tables.get(table_name) or _describe_table(connection, cursor, table_name)
+            if td is None:
                 continue
-
-            td = []
-            for row in table_description:
-                column_name = row[0]
-                try:
-                    field_type = connection.introspection.get_field_type(
-                        row[1], row
-                    )
-                except KeyError:
-                    field_type = "Unknown"
-                td.append((column_name, field_type))
+            if key:
+                described[key] = (stamps[table_name], td)
             ret.append((table_name, td))
+    if described:
+        logger.info(f"Described {len(described)} new or changed tables for connection {db_connection.id}.")
+        # Kept for longer than the connection's schema, so that the next build can reuse them
+        cache.set_many(described, timeout=app_settings.EXPLORER_SCHEMA_TABLE_CACHE_TIMEOUT)
     return ret
 
 
+def _table_stamps(connection, cursor):
+    sql = TABLE_STAMP_QUERIES.get(connection.vendor)
+    if sql is None:
+        return {}
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    except DatabaseError as e:
+        logger.info(f"Couldn't check which tables have changed, describing all of them: {e}")
+        return {}
+    convert = connection.introspection.identifier_converter
+    return {
+        convert(table_name): hashlib.sha256(str(stamp).encode()).hexdigest()
+        for table_name, stamp in rows if stamp is not None
+    }
+
+
+def _describe_table(connection, cursor, table_name):
+    try:
+        table_description = connection.introspection.get_table_description(
+            cursor, table_name
+        )
+    # Issue 675. A connection maybe not have permissions to access some tables in the DB.
+    except ProgrammingError:
+        return None
+
+    td = []
+    for row in table_description:
+        column_name = row[0]
+        try:
+            field_type = connection.introspection.get_field_type(
+                row[1], row
+            )
+        except KeyError:
+            field_type = "Unknown"
+        td.append((column_name, field_type))
+    return td
@@ -0,0 +1,126 @@
+"""
+Scheduling of query snapshots (see tasks.snapshot_queries). Queries are due once their snapshot interval (or
+EXPLORER_SNAPSHOT_INTERVAL) has passed. Each connection has a number of lanes (EXPLORER_SNAPSHOT_CONCURRENCY), each
+running one snapshot after another, and claimed in the cache so that the limit holds across runs; this needs a cache
+shared by the workers. The most expensive queries (see QueryStats) are planned first, each into the least loaded lane.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from explorer import app_settings
+from explorer.ee.db_connections.models import DatabaseConnection
+from explorer.models import Query
+
+# A query counts as due this close to the end of its interval, so that it isn't pushed back a whole run
+SCHEDULE_SLACK = timedelta(minutes=1)
+
+# A lane that is never released (e.g. because its worker died) is freed after this many seconds
+LANE_TIMEOUT = 6 * 60 * 60
+
+
+def is_due(query, now):
+    interval = query.snapshot_interval or app_settings.EXPLORER_SNAPSHOT_INTERVAL
+    if query.last_snapshot_at is None or not interval:
+        return True
+    return query.last_snapshot_at + timedelta(minutes=interval) - SCHEDULE_SLACK <= now
+
+
+def due_snapshots(now=None):
+    """
+    :return: The queries to snapshot now, with their stats loaded
+    """
+    now = now or timezone.now()
+    queries = Query.objects.filter(snapshot=True).select_related("stats")
+    return [q for q in queries if is_due(q, now)]
+
+
+def snapshot_cost(query):
+    """
+    The expected duration of a snapshot of the query in milliseconds (the p95 of its runs, or else their average), or
+    None if it has no recorded runs.
+    """
+    stats = query.get_stats()
+    return stats.p95_duration or stats.avg_duration
+
+
+def connection_concurrency(db_connection_id):
+    limits = app_settings.EXPLORER_SNAPSHOT_CONNECTION_CONCURRENCY
+    if limits:
+        alias = DatabaseConnection.objects.filter(pk=db_connection_id).values_list("alias", flat=True).first()
+        if alias in limits:
+            return max(limits[alias], 1)
+    return max(app_settings.EXPLORER_SNAPSHOT_CONCURRENCY, 1)
+
+
+def plan_lanes(queries, concurrency):
+    """
+    Split queries into at most `concurrency` lanes, most expensive first, balancing the lanes' expected durations.
+
+    :return: A list of lanes, each a list of query ids in the order they should run
+    """
+    costs = {q.id: snapshot_cost(q) for q in queries}
+    unknown = max((c for c in costs.values() if c is not None), default=0)
+    ordered = sorted(queries, key=lambda q: (costs[q.id] is not None, -(costs[q.id] or 0), q.id))
+    lanes = [[] for _ in range(min(concurrency, len(queries)))]
+    loads = [0] * len(lanes)
+    for q in ordered:
+        i = loads.index(min(loads))
+        lanes[i].append(q.id)
+        loads[i] += unknown if costs[q.id] is None else costs[q.id]
+    return lanes
+
+
+def lane_key(db_connection_id, lane):
+    return f"_explorer_snapshot_lane_{db_connection_id}_{lane}"
+
+
+def claim_lanes(db_connection_id, count):
+    """
+    Claim up to `count` of the connection's free lanes.
+
+    :return: The keys of the lanes claimed, to be released with release_lane() when their snapshots are done
+    """
+    claimed = []
+    for lane in range(connection_concurrency(db_connection_id)):
+        if len(claimed) >= count:
+            break
+        key = lane_key(db_connection_id, lane)
+        if cache.add(key, True, LANE_TIMEOUT):
+            claimed.append(key)
+    return claimed
+
+
+def release_lane(key):
+    cache.delete(key)
+
+
+def plan_snapshots(queries):
+    """
+    Claim lanes for the queries and plan what each runs. Connections without free lanes are left out.
+
+    :return: {database connection id: [(lane key, query ids)]}
+    """
+    # Queries without a connection run on the default one, and share its lanes
+    default_id = None
+    if any(q.database_connection_id is None for q in queries):
+        default_id = DatabaseConnection.objects.filter(default=True).values_list("id", flat=True).first()
+    by_connection = {}
+    for q in queries:
+        by_connection.setdefault(q.database_connection_id or default_id, []).append(q)
+    plan = {}
+    for connection_id, connection_queries in by_connection.items():
+        keys = claim_lanes(connection_id, len(connection_queries))
+        if keys:
+            plan[connection_id] = list(zip(keys, plan_lanes(connection_queries, len(keys)), strict=True))
+    return plan
+
+
+def retry_delay(retries):
+    """
+    Seconds to wait before retrying a failed snapshot for the (retries + 1)th time: EXPLORER_SNAPSHOT_RETRY_DELAY,
+    doubling with each retry, up to EXPLORER_SNAPSHOT_MAX_RETRY_DELAY.
+    """
+    delay = app_settings.EXPLORER_SNAPSHOT_RETRY_DELAY * 2 ** retries
+    return min(delay, app_settings.EXPLORER_SNAPSHOT_MAX_RETRY_DELAY)
@@ -1,5 +1,31 @@
 const schemaCache = {};
 
+// While the schema is being built, the server answers 202; ask again after this many ms, up to this many times.
+const BUILDING_POLL_INTERVAL = 1000;
+const BUILDING_MAX_POLLS = 120;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Schemas are kept in localStorage with their ETag, so that later page loads only download them when they change.
+const storageKey = (conn) => `explorer-schema:${window.baseUrlPath}${conn}`;
+
+const loadStored = (conn) => {
+    try {
+        return JSON.parse(localStorage.getItem(storageKey(conn)));
+    } catch (error) {
+        return null;
+    }
+};
+
+const store = (conn, etag, schema) => {
+    try {
+        localStorage.setItem(storageKey(conn), JSON.stringify({etag, schema}));
+    } catch (error) {
+        // Storage is full or unavailable; the schema is still cached for this page
+        console.warn('Could not store the table schema:', error);
+    }
+};
+
 const fetchSchema = async () => {
 
     const conn = getConnElement().value;
@@ -8,13 +34,29 @@ const fetchSchema = async () => {
         return schemaCache[conn];
     }
 
+    const stored = loadStored(conn);
+    const headers = stored && stored.etag ? {'If-None-Match': stored.etag} : {};
+    const request = () => fetch(`${window.baseUrlPath}schema.json/${conn}`, {headers});
+
     try {
-        const response = await fetch(`${window.baseUrlPath}schema.json/${conn}`);
+        let response = await request();
+        for (let polls = 0; response.status === 202 && polls < BUILDING_MAX_POLLS; polls++) {
+            await sleep(BUILDING_POLL_INTERVAL);
+            response = await request();
+        }
+        if (response.status === 202) {
+            throw new Error('Timed out waiting for the schema to be built');
+        }
+        if (response.status === 304) {
+            schemaCache[conn] = stored.schema;
+            return stored.schema;
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! Status: ${response.status}`);
         }
         const schema = await response.json();
         schemaCache[conn] = schema;  // Cache the schema
+        store(conn, response.headers.get('ETag'), schema);
         return schema;
     } catch (error) {
         console.error('Error fetching table schema:', error);
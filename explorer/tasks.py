@@ -1,16 +1,23 @@
-import io
+import gzip
+import json
 import random
 import string
 import os
-from datetime import date, datetime, timedelta
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
 
 from django.core.cache import cache
 from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Min
 from django.utils import timezone
 
 from explorer import app_settings
+from explorer.compression import get_compression
 from explorer.exporters import get_exporter_class
 from explorer.models import Query, QueryLog
+from explorer.snapshots import due_snapshots, plan_snapshots, release_lane, retry_delay
 from explorer.ee.db_connections.models import DatabaseConnection
 
 
@@ -42,7 +49,8 @@ def execute_query(query_id, email_address):
     exporter = get_exporter_class("csv")(q)
     random_part = "".join(random.choice(string.ascii_uppercase + string.digits) for _ in range(20))
     try:
-        url = s3_csv_upload(f"{random_part}.csv", convert_csv_to_bytesio(exporter))
+        with closing(exporter.get_output_stream()) as output:
+            url = s3_csv_upload(f"{random_part}.csv", output, get_compression(None, "csv"))
         subj = f'[SQL Explorer] Report "{q.title}" is ready'
         msg = f"Download results:\n\r{url}"
     except Exception as e:
@@ -52,62 +60,141 @@ def execute_query(query_id, email_address):
     send_mail(subj, msg, app_settings.FROM_EMAIL, [email_address])
 
 
-# I am sure there is a much more efficient way to do this but boto3 expects a binary file basically
-def convert_csv_to_bytesio(csv_exporter):
-    csv_file_io = csv_exporter.get_file_output()
-    csv_file_io.seek(0)
-    csv_data: str = csv_file_io.read()
-    bio = io.BytesIO(bytes(csv_data, "utf-8"))
-    return bio
-
-
 @shared_task
 def snapshot_query(query_id):
+    """
+    Upload a snapshot of a query's results to S3. Failures are retried with exponential backoff (see
+    snapshots.retry_delay), up to EXPLORER_SNAPSHOT_MAX_RETRIES times, after which the snapshot is given up on rather
+    than failing the rest of its lane.
+    """
     try:
         logger.info(f"Starting snapshot for query {query_id}...")
         q = Query.objects.get(pk=query_id)
         exporter = get_exporter_class("csv")(q)
-        k = "query-{}/snap-{}.csv".format(q.id, date.today().strftime("%Y%m%d-%H:%M:%S"))
+        k = "query-{}/snap-{}.csv".format(q.id, timezone.now().strftime("%Y%m%d-%H:%M:%S"))
         logger.info(f"Uploading snapshot for query {query_id} as {k}...")
-        url = s3_csv_upload(k, convert_csv_to_bytesio(exporter))
+        with closing(exporter.get_output_stream()) as output:
+            url = s3_csv_upload(k, output, get_compression(None, "csv"))
         logger.info(f"Done uploading snapshot for query {query_id}. URL: {url}")
     except Exception as e:
-        logger.warning(f"Failed to snapshot query {query_id} ({e}). Retrying...")
-        snapshot_query.retry()
+        retries = snapshot_query.request.retries
+        if retries >= app_settings.EXPLORER_SNAPSHOT_MAX_RETRIES:
+            logger.error(f"Failed to snapshot query {query_id} ({e}). Giving up after {retries} retries.")
+            return
+        delay = retry_delay(retries)
+        logger.warning(f"Failed to snapshot query {query_id} ({e}). Retrying in {delay}s...")
+        snapshot_query.retry(countdown=delay, max_retries=app_settings.EXPLORER_SNAPSHOT_MAX_RETRIES)
 
 
 @shared_task
 def snapshot_queries():
+    """
+    Snapshot the queries that are due (see snapshots.py), as one chain of snapshot_query subtasks per free lane of
+    their connection, ending with release_snapshot_lane. Call this as often as the shortest snapshot interval in use.
+
+    :return: The number of snapshots started
+    """
+    from celery import chain
     logger.info("Starting query snapshots...")
-    qs = Query.objects.filter(snapshot=True).values_list("id", flat=True)
-    logger.info(f"Found {len(qs)} queries to snapshot. Creating snapshot tasks...")
-    for qid in qs:
-        snapshot_query.delay(qid)
+    now = timezone.now()
+    queries = due_snapshots(now)
+    logger.info(f"Found {len(queries)} queries to snapshot. Creating snapshot tasks...")
+    plan = plan_snapshots(queries)
+    started = [qid for lanes in plan.values() for _, lane in lanes for qid in lane]
+    if len(started) < len(queries):
+        logger.info(f"Leaving {len(queries) - len(started)} queries for the next run, as their lanes are all busy.")
+    # Claimed before the subtasks start, so that the next run doesn't start them again while they are still going
+    Query.objects.filter(pk__in=started).update(last_snapshot_at=now)
+    for connection_id, lanes in plan.items():
+        count = sum(len(lane) for _, lane in lanes)
+        logger.info(f"Snapshotting {count} queries on connection {connection_id} in {len(lanes)} lanes.")
+        for key, lane in lanes:
+            chain(*(snapshot_query.si(qid) for qid in lane), release_snapshot_lane.si(key)).apply_async()
     logger.info("Done creating tasks.")
+    return len(started)
+
+
+@shared_task
+def release_snapshot_lane(key):
+    release_lane(key)
+
+
+TRUNCATE_CURSOR_CACHE_KEY = "explorer_truncate_querylogs_cursor"
+# Keeps the "id IN (...)" lists of archived logs within database parameter limits (e.g. SQLite's)
+ARCHIVE_DELETE_CHUNK_SIZE = 500
 
 
 @shared_task
-def truncate_querylogs(days):
+def truncate_querylogs(days, batch_size=None, pause=None, archive_dir=None, max_batches=None):
+    """
+    Delete QueryLogs older than the given number of days, in short transactions of batch_size ids each, pausing between
+    them. Progress is kept in the cache, so an interrupted run (or one stopped after max_batches) resumes where it left
+    off. With archive_dir, each batch is first appended to a gzipped JSON lines file there.
+
+    batch_size, pause and archive_dir default to the EXPLORER_QUERYLOG_TRUNCATE_* settings.
+    """
+    batch_size = app_settings.EXPLORER_QUERYLOG_TRUNCATE_BATCH_SIZE if batch_size is None else batch_size
+    pause = app_settings.EXPLORER_QUERYLOG_TRUNCATE_PAUSE if pause is None else pause
+    archive_dir = archive_dir or app_settings.EXPLORER_QUERYLOG_ARCHIVE_DIR
+
     t = timezone.make_aware(datetime.now() - timedelta(days=days), timezone.get_default_timezone())
-    qs = QueryLog.objects.filter(run_at__lt=t)
-    logger.info(f"Deleting {qs.count()} QueryLog objects older than {days} days.")
-    qs.delete()
-    logger.info("Done deleting QueryLog objects.")
+    qs = QueryLog.objects.filter(run_at__lt=t).order_by()
+    archive = _querylog_archive_path(archive_dir) if archive_dir else None
+    if not batch_size:
+        logger.info(f"Deleting {qs.count()} QueryLog objects older than {days} days.")
+        _delete_querylogs(qs, archive)
+        logger.info("Done deleting QueryLog objects.")
+        return
+
+    last_pk = qs.aggregate(last_pk=Max("pk"))["last_pk"]
+    if last_pk is None:
+        cache.delete(TRUNCATE_CURSOR_CACHE_KEY)
+        logger.info(f"No QueryLog objects older than {days} days.")
+        return
+    start = cache.get(TRUNCATE_CURSOR_CACHE_KEY) or qs.aggregate(first_pk=Min("pk"))["first_pk"]
+    logger.info(f"Deleting QueryLog objects older than {days} days, ids {start} to {last_pk}.")
+
+    deleted = batches = 0
+    while start <= last_pk:
+        if max_batches is not None and batches >= max_batches:
+            logger.info(f"Deleted {deleted} QueryLog objects. Stopping at id {start}, to be resumed on the next run.")
+            return
+        end = start + batch_size
+        deleted += _delete_querylogs(qs.filter(pk__gte=start, pk__lt=end), archive)
+        cache.set(TRUNCATE_CURSOR_CACHE_KEY, end, timeout=None)
+        start = end
+        batches += 1
+        if pause and start <= last_pk:
+            time.sleep(pause)
+    cache.delete(TRUNCATE_CURSOR_CACHE_KEY)
+    logger.info(f"Done deleting {deleted} QueryLog objects.")
+
+
+def _querylog_archive_path(archive_dir):
+    os.makedirs(archive_dir, exist_ok=True)
+    return os.path.join(archive_dir, f"querylogs-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz")
+
+
+def _delete_querylogs(qs, archive):
+    if archive is None:
+        return qs.delete()[0]
+    pks = []
+    # Each batch is appended as a separate gzip member; readers (gzip.open, zcat) treat them as one stream.
+    with gzip.open(archive, "at", encoding="utf-8") as f:
+        for row in qs.values().iterator():
+            f.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            pks.append(row["id"])
+    deleted = 0
+    for i in range(0, len(pks), ARCHIVE_DELETE_CHUNK_SIZE):
+        deleted += QueryLog.objects.filter(pk__in=pks[i:i + ARCHIVE_DELETE_CHUNK_SIZE]).delete()[0]
+    return deleted
 
 
 @shared_task
 def build_schema_cache_async(db_connection_id):
-    from .schema import (
-        build_schema_info,
-        connection_schema_cache_key,
-        connection_schema_json_cache_key,
-        transform_to_json_schema,
-    )
+    from .schema import build_and_cache_schema
     db_connection = DatabaseConnection.objects.get(id=db_connection_id)
-    ret = build_schema_info(db_connection)
-    cache.set(connection_schema_cache_key(db_connection.id), ret)
-    cache.set(connection_schema_json_cache_key(db_connection.id), transform_to_json_schema(ret))
-    return ret
+    return build_and_cache_schema(db_connection)
 
 
 @shared_task
@@ -121,8 +208,44 @@ def remove_unused_sqlite_dbs():
                 os.remove(db.local_name)
 
 
+# Extra time a warm-up subtask gets, past its soft time limit, before the worker kills it
+SCHEMA_WARMUP_HARD_LIMIT_GRACE = 30
+
+
+@shared_task
+def warm_schema_cache(db_connection_id):
+    from explorer.schema import format_schema_report, rebuild_schema_cache
+    report = rebuild_schema_cache(DatabaseConnection.objects.get(id=db_connection_id))
+    logger.info(f"Schema warm-up: {format_schema_report(report)}")
+    return report
+
+
 @shared_task
-def build_async_schemas():
-    from explorer.schema import schema_info
-    for c in DatabaseConnection.objects.non_uploads().all():
-        schema_info(c.alias)
+def build_async_schemas(concurrency=None, time_budget=None):
+    """
+    Rebuild the cached schemas of all connections (except uploads), EXPLORER_SCHEMA_WARMUP_CONCURRENCY at a time: as
+    warm_schema_cache subtasks with Celery (returning how many), otherwise in a thread pool (returning their reports).
+    """
+    from explorer.schema import format_schema_report, warm_schema_caches
+    concurrency = max(concurrency or app_settings.EXPLORER_SCHEMA_WARMUP_CONCURRENCY, 1)
+    time_budget = time_budget or app_settings.EXPLORER_SCHEMA_WARMUP_TIME_BUDGET
+    db_connections = list(DatabaseConnection.objects.non_uploads())
+
+    if app_settings.ENABLE_TASKS:
+        from celery import chain
+        # One chain of subtasks per slot, so that no more than `concurrency` of them run at once
+        for lane in (db_connections[i::concurrency] for i in range(concurrency)):
+            if lane:
+                chain(
+                    warm_schema_cache.si(c.id).set(
+                        soft_time_limit=time_budget, time_limit=time_budget + SCHEMA_WARMUP_HARD_LIMIT_GRACE
+                    ) for c in lane
+                ).apply_async()
+        return len(db_connections)
+
+    started = time.monotonic()
+    reports = warm_schema_caches(db_connections, concurrency, time_budget)
+    for report in reports:
+        logger.info(f"Schema warm-up: {format_schema_report(report)}")
+    logger.info(f"Warmed up {len(reports)} schemas in {time.monotonic() - started:.1f}s.")
+    return reports
@@ -6,6 +6,8 @@ EXPLORER_AI_API_KEY = "foo"
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_TASK_ALWAYS_EAGER = True
 TEST_MODE = True
+# Background threads can't see the test transaction's data; tests that need background builds patch this
+EXPLORER_SCHEMA_BUILD_IN_BACKGROUND = False
 
 DATABASES = {
     "default": {
@@ -1,5 +1,5 @@
 import io
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZipFile
 
 from django.test import TestCase
 
@@ -32,6 +32,7 @@ class TestSqlQueryActions(TestCase):
         self.assertEqual(len(z.namelist()), 2)
         self.assertEqual(z.namelist()[0], f"{q.title}.csv")
         self.assertEqual(got_csv.lower().decode("utf-8-sig"), expected_csv)
+        self.assertEqual(z.infolist()[0].compress_type, ZIP_DEFLATED)
 
     # if commas are not removed from the filename, then Chrome throws
     # "duplicate headers received from server"
@@ -224,7 +224,11 @@ class TestPromptContext(TestCase):
             ("snapshot", "BooleanField"),
             ("connection", "CharField"),
             ("database_connection_id", "IntegerField"),
-            ("few_shot", "BooleanField")]
+            ("few_shot", "BooleanField"),
+            ("timeout", "PositiveIntegerField"),
+            ("cache_ttl", "PositiveIntegerField"),
+            ("last_snapshot_at", "DateTimeField"),
+            ("snapshot_interval", "PositiveIntegerField")]
         self.assertEqual(ret, expected)
 
     def test_schema_info_from_table_names_case_invariant(self):
@@ -240,7 +244,11 @@ class TestPromptContext(TestCase):
             ("snapshot", "BooleanField"),
             ("connection", "CharField"),
             ("database_connection_id", "IntegerField"),
-            ("few_shot", "BooleanField")]
+            ("few_shot", "BooleanField"),
+            ("timeout", "PositiveIntegerField"),
+            ("cache_ttl", "PositiveIntegerField"),
+            ("last_snapshot_at", "DateTimeField"),
+            ("snapshot_interval", "PositiveIntegerField")]
         self.assertEqual(ret, expected)
 
 
@@ -0,0 +1,61 @@
+import gzip
+import unittest
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from explorer.compression import (
+    GZIP, ZSTD, UnsupportedCompression, compress, compress_stream, compressed_content_type,
+    compressed_filename, get_compression, is_zstd_available,
+)
+
+
+def zstd_decompress(data):
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+class TestGetCompression(TestCase):
+
+    def test_requested(self):
+        self.assertEqual(get_compression("gzip"), GZIP)
+        self.assertIsNone(get_compression("none"))
+        self.assertIsNone(get_compression(None))
+
+    @patch("explorer.app_settings.EXPLORER_EXPORT_COMPRESSION", {"csv": "gzip"})
+    def test_format_default(self):
+        self.assertEqual(get_compression(None, "csv"), GZIP)
+        self.assertEqual(get_compression("", "csv"), GZIP)
+        self.assertIsNone(get_compression("none", "csv"))
+        self.assertIsNone(get_compression(None, "json"))
+
+    def test_unknown(self):
+        with self.assertRaises(UnsupportedCompression):
+            get_compression("rar")
+
+    @patch("explorer.compression.is_zstd_available", lambda: False)
+    def test_zstd_not_installed(self):
+        with self.assertRaises(UnsupportedCompression):
+            get_compression("zstd")
+
+    def test_names(self):
+        self.assertEqual(compressed_filename("report.csv", GZIP), "report.csv.gz")
+        self.assertEqual(compressed_filename("report.csv", None), "report.csv")
+        self.assertEqual(compressed_content_type("text/csv", ZSTD), "application/zstd")
+        self.assertEqual(compressed_content_type("text/csv", None), "text/csv")
+
+
+class TestCompress(TestCase):
+
+    chunks = ["a,b\r\n", b"1,2\r\n", "Jenét,3\r\n" * 1000]
+    expected = ("a,b\r\n1,2\r\n" + "Jenét,3\r\n" * 1000).encode("utf-8")
+
+    def test_gzip_stream(self):
+        self.assertEqual(gzip.decompress(b"".join(compress_stream(iter(self.chunks), GZIP))), self.expected)
+
+    def test_empty(self):
+        self.assertEqual(gzip.decompress(compress(b"", GZIP)), b"")
+
+    @unittest.skipIf(not is_zstd_available(), "zstandard not installed")
+    def test_zstd_stream(self):
+        self.assertEqual(zstd_decompress(b"".join(compress_stream(iter(self.chunks), ZSTD))), self.expected)
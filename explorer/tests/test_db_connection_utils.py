@@ -5,11 +5,14 @@ if EXPLORER_USER_UPLOADS_ENABLED:
     import pandas as pd
 import os
 import sqlite3
-from django.db import DatabaseError
+import tempfile
+import threading
+from django.db import DatabaseError, transaction
 from explorer.models import DatabaseConnection
 from unittest.mock import patch, MagicMock
+from explorer.ee.db_connections import pool
 from explorer.ee.db_connections.utils import (
-    pandas_to_sqlite
+    backend_pid, cancel_backend, default_db_connection, pandas_to_sqlite, statement_timeout
 )
 
 
@@ -122,3 +125,183 @@ class TestPandasToSQLite(TestCase):
         conn = DatabaseConnection(alias="not_registered", engine=DatabaseConnection.DJANGO)
         conn.save()
         self.assertRaises(DatabaseError, conn.as_django_connection)
+
+
+class TestStatementTimeout(TestCase):
+
+    def mock_connection(self, vendor, in_transaction=False):
+        cursor = MagicMock()
+        conn = MagicMock(vendor=vendor, mysql_is_mariadb=False)
+        conn.get_autocommit.return_value = not in_transaction
+        conn.cursor.return_value.__enter__.return_value = cursor
+        return conn, cursor
+
+    def executed(self, cursor):
+        return [c.args[0] for c in cursor.execute.call_args_list]
+
+    def test_postgres_in_transaction(self):
+        conn, cursor = self.mock_connection("postgresql", in_transaction=True)
+        with statement_timeout(conn, 2):
+            pass
+        self.assertEqual(self.executed(cursor), ["SET LOCAL statement_timeout = 2000"])
+
+    def test_postgres_outside_transaction(self):
+        conn, cursor = self.mock_connection("postgresql")
+        with statement_timeout(conn, 2):
+            pass
+        self.assertEqual(self.executed(cursor), ["SET statement_timeout = 2000", "RESET statement_timeout"])
+
+    def test_mysql(self):
+        conn, cursor = self.mock_connection("mysql")
+        with statement_timeout(conn, 2):
+            pass
+        self.assertEqual(self.executed(cursor), ["SET SESSION max_execution_time = 2000",
+                                                 "SET SESSION max_execution_time = DEFAULT"])
+
+    def test_no_timeout_does_nothing(self):
+        conn, cursor = self.mock_connection("postgresql")
+        with statement_timeout(conn, None):
+            pass
+        cursor.execute.assert_not_called()
+
+    def test_sqlite_interrupts_long_queries(self):
+        conn = default_db_connection().as_django_connection()
+        sql = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) "
+               "SELECT COUNT(*) FROM c")
+        with self.assertRaisesMessage(DatabaseError, "timeout"):
+            with conn.cursor() as cursor:
+                with statement_timeout(conn, 0.1):
+                    cursor.execute(sql)
+        # The progress handler is removed again afterwards
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_backend_pid(self):
+        conn, cursor = self.mock_connection("postgresql")
+        cursor.fetchone.return_value = (123,)
+        self.assertEqual(backend_pid(conn), 123)
+        self.assertEqual(self.executed(cursor), ["SELECT pg_backend_pid()"])
+        self.assertIsNone(backend_pid(self.mock_connection("mysql")[0]))
+        self.assertIsNone(backend_pid(default_db_connection().as_django_connection()))
+
+    def test_backend_pid_is_looked_up_once_per_connection(self):
+        conn, cursor = self.mock_connection("postgresql")
+        cursor.fetchone.return_value = (123,)
+        self.assertEqual(backend_pid(conn), 123)
+        self.assertEqual(backend_pid(conn), 123)
+        self.assertEqual(cursor.execute.call_count, 1)
+        # A new underlying connection is a new backend
+        conn.connection = MagicMock()
+        cursor.fetchone.return_value = (456,)
+        self.assertEqual(backend_pid(conn), 456)
+        self.assertEqual(cursor.execute.call_count, 2)
+
+    def test_cancel_backend(self):
+        conn, cursor = self.mock_connection("postgresql")
+        cursor.fetchone.return_value = (True,)
+        self.assertTrue(cancel_backend(conn, 123))
+        cursor.execute.assert_called_once_with("SELECT pg_cancel_backend(%s)", [123])
+
+        with self.assertRaises(NotImplementedError):
+            cancel_backend(self.mock_connection("mysql")[0], 123)
+        with self.assertRaises(NotImplementedError):
+            cancel_backend(default_db_connection().as_django_connection(), 123)
+
+
+class TestConnectionPool(TestCase):
+
+    # Not in-memory databases, because Django never closes those
+    def setUp(self):
+        pool.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = DatabaseConnection.objects.create(
+            alias="pooled", name=os.path.join(self.tmp.name, "pooled.db"), engine=DatabaseConnection.SQLITE
+        )
+
+    def tearDown(self):
+        pool.clear()
+        self.tmp.cleanup()
+
+    def test_connection_is_reused(self):
+        wrapper = self.conn.as_django_connection()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        self.assertIs(DatabaseConnection.objects.get(pk=self.conn.pk).as_django_connection(), wrapper)
+        self.assertIs(wrapper.connection, raw)
+
+    def test_atomic_uses_the_pooled_connection(self):
+        wrapper = self.conn.as_django_connection()
+        with transaction.atomic(using=self.conn.alias):
+            self.assertTrue(wrapper.in_atomic_block)
+
+    def test_unpooled_connections(self):
+        wrapper = self.conn.as_django_connection()
+        self.assertIsNot(self.conn.as_django_connection(pooled=False), wrapper)
+        unsaved = DatabaseConnection(alias="unsaved", name=":memory:", engine=DatabaseConnection.SQLITE)
+        self.assertIsNot(unsaved.as_django_connection(), unsaved.as_django_connection())
+        with patch("explorer.app_settings.EXPLORER_CONNECTION_POOL_ENABLED", False):
+            self.assertIsNot(self.conn.as_django_connection(), self.conn.as_django_connection())
+
+    def test_editing_connection_replaces_pooled_connection(self):
+        wrapper = self.conn.as_django_connection()
+        wrapper.ensure_connection()
+        self.conn.name = os.path.join(self.tmp.name, "renamed.db")
+        self.conn.save()
+        self.assertIsNone(wrapper.connection)
+        self.assertIsNot(self.conn.as_django_connection(), wrapper)
+
+    def test_changed_settings_replace_pooled_connection(self):
+        # e.g. the connection was edited in another process
+        wrapper = self.conn.as_django_connection()
+        DatabaseConnection.objects.filter(pk=self.conn.pk).update(name=os.path.join(self.tmp.name, "renamed.db"))
+        self.assertIsNot(DatabaseConnection.objects.get(pk=self.conn.pk).as_django_connection(), wrapper)
+
+    def test_deleting_connection_closes_pooled_connection(self):
+        wrapper = self.conn.as_django_connection()
+        wrapper.ensure_connection()
+        self.conn.delete()
+        self.assertIsNone(wrapper.connection)
+
+    def test_idle_connections_are_closed(self):
+        wrapper = self.conn.as_django_connection()
+        wrapper.ensure_connection()
+        with patch("explorer.app_settings.EXPLORER_CONNECTION_POOL_MAX_IDLE", 0):
+            pool.evict_idle()
+        self.assertIsNone(wrapper.connection)
+        self.assertIsNot(self.conn.as_django_connection(), wrapper)
+
+    def test_pool_size(self):
+        other = DatabaseConnection.objects.create(
+            alias="other", name=os.path.join(self.tmp.name, "other.db"), engine=DatabaseConnection.SQLITE
+        )
+        wrapper = self.conn.as_django_connection()
+        wrapper.ensure_connection()
+        with patch("explorer.app_settings.EXPLORER_CONNECTION_POOL_SIZE", 1):
+            other.as_django_connection()
+        self.assertIsNone(wrapper.connection)
+
+    def test_unusable_connection_is_replaced(self):
+        wrapper = self.conn.as_django_connection()
+        wrapper.ensure_connection()
+        wrapper.errors_occurred = True
+        with patch.object(wrapper, "is_usable", return_value=False):
+            self.assertIs(self.conn.as_django_connection(), wrapper)
+        self.assertIsNone(wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    def test_connection_in_use_is_left_alone(self):
+        wrapper = self.conn.as_django_connection()
+        with transaction.atomic(using=self.conn.alias):
+            wrapper.ensure_connection()
+            pool.discard(self.conn.pk)
+            self.assertIsNotNone(wrapper.connection)
+
+    def test_pools_are_per_thread(self):
+        wrapper = self.conn.as_django_connection()
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.conn.as_django_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], wrapper)
@@ -1,18 +1,38 @@
 import json
+import sys
 import unittest
+import uuid
+from unittest.mock import patch
 from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+from zipfile import ZipFile
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.test import TestCase
 from django.utils import timezone
 
-from explorer.exporters import CSVExporter, ExcelExporter, JSONExporter
+from explorer.exporters import (
+    ArrowStreamExporter, CSVExporter, ExcelExporter, JSONColumnsExporter, JSONExporter, JSONLinesExporter,
+    ParquetExporter, _excel_converters,
+)
 from explorer.models import QueryResult
 from explorer.tests.factories import SimpleQueryFactory
-from explorer.utils import is_xls_writer_available
+from explorer.utils import is_pyarrow_available, is_xls_writer_available
 from explorer.ee.db_connections.utils import default_db_connection
 
 
+def result(rows, sql='select 1 as "a", 2 as "b"'):
+    """
+    A processed QueryResult with the given rows in place of the query's own, with the query's columns as headers.
+    """
+    res = QueryResult(SimpleQueryFactory(sql=sql).sql, default_db_connection().as_django_connection())
+    res.execute_query()
+    res.process()
+    res._data = rows
+    return res
+
+
 class TestCsv(TestCase):
 
     def test_writing_unicode(self):
@@ -39,6 +59,18 @@ class TestCsv(TestCase):
             "1|2\r\n1|2\r\n"
         )
 
+    def test_stream_matches_output(self):
+        q = SimpleQueryFactory(sql="select 1 as a, 'x' as b union all select 2, 'y'")
+        exporter = CSVExporter(query=q)
+        self.assertEqual("".join(exporter.get_output_stream()), exporter.get_output())
+
+    @patch("explorer.exporters.STREAM_CHUNK_SIZE", 8)
+    def test_stream_is_chunked(self):
+        q = SimpleQueryFactory(sql="select 'aaaaaaaaaa' as a union all select 'bbbbbbbbbb'")
+        chunks = list(CSVExporter(query=q).get_output_stream())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), "\ufeffa\r\naaaaaaaaaa\r\nbbbbbbbbbb\r\n")
+
     def test_writing_bom(self):
         q = SimpleQueryFactory(sql="select 1, 2")
         exporter = CSVExporter(query=q)
@@ -59,7 +91,7 @@ class TestJson(TestCase):
 
         res = JSONExporter(query=None)._get_output(res).getvalue()
         expected = [{"a": 1, "": None}, {"a": "Jenét", "": "1"}]
-        self.assertEqual(res, json.dumps(expected))
+        self.assertEqual(res.decode("utf-8"), json.dumps(expected, separators=(",", ":"), ensure_ascii=False))
 
     def test_writing_datetimes(self):
         res = QueryResult(
@@ -72,7 +104,60 @@ class TestJson(TestCase):
 
         res = JSONExporter(query=None)._get_output(res).getvalue()
         expected = [{"a": 1, "b": date.today()}]
-        self.assertEqual(res, json.dumps(expected, cls=DjangoJSONEncoder))
+        self.assertEqual(json.loads(res), json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+
+    def test_stream_matches_output(self):
+        q = SimpleQueryFactory(sql="select 1 as a, 'x' as b union all select 2, 'y'")
+        exporter = JSONExporter(query=q)
+        self.assertEqual(b"".join(exporter.get_output_stream()), exporter.get_output())
+
+
+class TestCompactJson(TestCase):
+
+    rows = [
+        [1, "Jenét"],
+        [Decimal("1.50"), datetime(2024, 5, 1, 12, 30, 15, 123456)],
+        [uuid.UUID(int=1), {"x": [1, None]}],
+        [2 ** 70, date(2024, 5, 1)],
+    ]
+
+    def test_json_lines(self):
+        output = JSONLinesExporter(query=None)._get_output(result(self.rows)).getvalue()
+        lines = output.decode("utf-8").splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[0]), {"a": 1, "b": "Jenét"})
+        self.assertEqual(json.loads(lines[3]), {"a": 2 ** 70, "b": "2024-05-01"})
+        for line, row in zip(lines, self.rows, strict=True):
+            expected = json.dumps(dict(zip(["a", "b"], row, strict=True)), cls=DjangoJSONEncoder)
+            self.assertEqual(json.loads(line), json.loads(expected))
+
+    @patch("explorer.exporters.JSON_BATCH_SIZE", 3)
+    def test_json(self):
+        output = JSONExporter(query=None)._get_output(result(self.rows)).getvalue()
+        expected = [dict(zip(["a", "b"], row, strict=True)) for row in self.rows]
+        self.assertEqual(json.loads(output), json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+
+    @patch("explorer.exporters.JSON_BATCH_SIZE", 3)
+    def test_json_columns(self):
+        output = JSONColumnsExporter(query=None)._get_output(result(self.rows)).getvalue()
+        expected = {"columns": ["a", "b"], "rows": self.rows}
+        self.assertEqual(json.loads(output), json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+
+    def test_json_columns_empty(self):
+        output = JSONColumnsExporter(query=None)._get_output(result([])).getvalue()
+        self.assertEqual(json.loads(output), {"columns": ["a", "b"], "rows": []})
+
+    def test_same_output_without_orjson(self):
+        for exporter in (JSONExporter, JSONLinesExporter, JSONColumnsExporter):
+            output = exporter(query=None)._get_output(result(self.rows)).getvalue()
+            with patch.dict(sys.modules, {"orjson": None}):
+                self.assertEqual(exporter(query=None)._get_output(result(self.rows)).getvalue(), output)
+
+    def test_stream_matches_output(self):
+        q = SimpleQueryFactory(sql="select 1 as a, 'x' as b union all select 2, 'y'")
+        exporter = JSONLinesExporter(query=q)
+        self.assertEqual(b"".join(exporter.get_output_stream()), exporter.get_output())
+        self.assertEqual(exporter.get_output(), b'{"a":1,"b":"x"}\n{"a":2,"b":"y"}\n')
 
 
 class TestExcel(TestCase):
@@ -133,3 +218,156 @@ class TestExcel(TestCase):
         expected = b"PK"
 
         self.assertEqual(res[:2], expected)
+
+
+@unittest.skipIf(not is_xls_writer_available(), "excel exporter not available")
+class TestExcelSheets(TestCase):
+
+    def sheets(self, output):
+        with ZipFile(BytesIO(output)) as xlsx:
+            workbook = xlsx.read("xl/workbook.xml").decode()
+            sheets = sorted(n for n in xlsx.namelist() if n.startswith("xl/worksheets/sheet"))
+            return workbook, [xlsx.read(n).decode() for n in sheets]
+
+    @patch("explorer.exporters.EXCEL_MAX_ROWS", 3)
+    def test_rows_are_split_across_sheets(self):
+        exporter = ExcelExporter(query=SimpleQueryFactory(title="split"))
+        output = exporter._get_output(result([[i, f"row {i}"] for i in range(5)])).getvalue()
+        workbook, sheets = self.sheets(output)
+        self.assertIn('name="split"', workbook)
+        self.assertIn('name="split (2)"', workbook)
+        self.assertIn('name="split (3)"', workbook)
+        # Each sheet has the header and up to two rows
+        self.assertEqual([s.count("<row ") for s in sheets], [3, 3, 2])
+        self.assertTrue(all("<is><t>a</t></is>" in s for s in sheets))
+
+    def test_stream_matches_output(self):
+        rows = [[1, {"foo": "bar"}], [2, "baz"], [None, ["x"]]]
+        exporter = ExcelExporter(query=SimpleQueryFactory(title="stream"))
+        streamed = b"".join(exporter._get_output_stream(result(rows)))
+        output = exporter._get_output(result(rows)).getvalue()
+        self.assertEqual(self.sheets(streamed), self.sheets(output))
+
+    def test_values_that_dont_match_their_column(self):
+        when = timezone.make_aware(datetime(2024, 5, 1, 12, 30), timezone.get_current_timezone())
+        rows = [[1, {"foo": "bar"}], [2, "baz"], [{"a": 1}, when], [uuid.UUID(int=1), None]]
+        output = ExcelExporter(query=SimpleQueryFactory(title="mixed"))._get_output(result(rows)).getvalue()
+        _, sheets = self.sheets(output)
+        self.assertIn("<t>baz</t>", sheets[0])
+        self.assertIn(str(when), sheets[0])
+        self.assertIn(str(uuid.UUID(int=1)), sheets[0])
+
+    @patch("explorer.exporters.EXCEL_CONVERTER_ROWS", 3)
+    def test_empty_columns_stop_being_resolved(self):
+        when = timezone.make_aware(datetime(2024, 5, 1, 12, 30), timezone.get_current_timezone())
+        rows = [[i, None] for i in range(10)] + [[10, when]]
+        exporter = ExcelExporter(query=SimpleQueryFactory(title="empty column"))
+        with patch("explorer.exporters._excel_converters", wraps=_excel_converters) as resolve:
+            output = exporter._get_output(result(rows)).getvalue()
+        self.assertEqual(resolve.call_count, 3)
+        _, sheets = self.sheets(output)
+        self.assertIn(str(when), sheets[0])
+
+    def test_empty_result(self):
+        output = ExcelExporter(query=SimpleQueryFactory(title="empty"))._get_output(result([])).getvalue()
+        workbook, sheets = self.sheets(output)
+        self.assertIn('name="empty"', workbook)
+        self.assertEqual(sheets[0].count("<row "), 1)
+
+
+@unittest.skipIf(not is_pyarrow_available(), "pyarrow not available")
+class TestArrow(TestCase):
+
+    def read_parquet(self, output):
+        import pyarrow.parquet as pq
+        return pq.read_table(BytesIO(output))
+
+    def test_parquet_keeps_types(self):
+        import pyarrow as pa
+        when = timezone.make_aware(datetime(2024, 5, 1, 12, 30), timezone.get_current_timezone())
+        an_id = uuid.uuid4()
+        res = result(
+            [[1, Decimal("1.50"), when, an_id, {"foo": "bar"}, None], [2, None, None, None, [1, 2], None]],
+            sql='select 1 as "i", 2 as "d", 3 as "t", 4 as "u", 5 as "j", 6 as "n"'
+        )
+        table = self.read_parquet(ParquetExporter(query=None)._get_output(res).getvalue())
+        self.assertEqual(table.column_names, ["i", "d", "t", "u", "j", "n"])
+        self.assertEqual(table.schema.field("i").type, pa.int64())
+        self.assertEqual(table.schema.field("d").type, pa.decimal128(38, 2))
+        self.assertTrue(pa.types.is_timestamp(table.schema.field("t").type))
+        self.assertIsNotNone(table.schema.field("t").type.tz)
+        self.assertEqual(table.schema.field("n").type, pa.null())
+        rows = table.to_pylist()
+        self.assertEqual(rows[0]["d"], Decimal("1.50"))
+        self.assertEqual(rows[0]["t"], when)
+        self.assertIn(rows[0]["u"], (an_id, an_id.bytes, str(an_id)))
+        self.assertEqual(json.loads(rows[1]["j"]), [1, 2])
+
+    def test_arrow_stream(self):
+        import pyarrow as pa
+        res = result([[1, "foo"], [2, None]])
+        output = ArrowStreamExporter(query=None)._get_output(res).getvalue()
+        table = pa.ipc.open_stream(output).read_all()
+        self.assertEqual(table.to_pylist(), [{"a": 1, "b": "foo"}, {"a": 2, "b": None}])
+
+    @patch("explorer.exporters.ARROW_BATCH_SIZE", 2)
+    def test_written_in_batches(self):
+        res = result([[1, "x"], [2, "y"], [3, 4], [Decimal("1.5"), "z"], [5, None]])
+        table = self.read_parquet(ParquetExporter(query=None)._get_output(res).getvalue())
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column("a").to_pylist(), [1, 2, 3, Decimal("1.5"), 5])
+        self.assertEqual(table.column("b").to_pylist(), ["x", "y", "4", "z", None])
+
+    @patch("explorer.exporters.ARROW_BATCH_SIZE", 1)
+    def test_decimals_gain_digits_in_later_batches(self):
+        import pyarrow as pa
+        res = result([[Decimal("1.5"), 1], [Decimal("2.25"), 2]])
+        table = self.read_parquet(ParquetExporter(query=None)._get_output(res).getvalue())
+        self.assertEqual(table.schema.field("a").type, pa.decimal128(38, 2))
+        self.assertEqual(table.column("a").to_pylist(), [Decimal("1.5"), Decimal("2.25")])
+
+    def assert_drift(self, exporter, values, arrow_type):
+        import pyarrow as pa
+        with patch("explorer.exporters.ARROW_BATCH_SIZE", 2):
+            output = exporter._get_output(result([[v, i] for i, v in enumerate(values)])).getvalue()
+        if isinstance(exporter, ParquetExporter):
+            table = self.read_parquet(output)
+        else:
+            table = pa.ipc.open_stream(output).read_all()
+        self.assertEqual(table.schema.field("a").type, arrow_type)
+        self.assertEqual(table.column("b").to_pylist(), list(range(len(values))))
+        return table.column("a").to_pylist()
+
+    def test_type_drift_across_batches(self):
+        import pyarrow as pa
+        big = 2 ** 70
+        for exporter in (ParquetExporter(query=None), ArrowStreamExporter(query=None)):
+            with self.subTest(exporter=exporter.name):
+                self.assertEqual(self.assert_drift(exporter, [1, 2, 2.5], pa.float64()), [1, 2, 2.5])
+                self.assertEqual(self.assert_drift(exporter, [1, 2, "x"], pa.string()), ["1", "2", "x"])
+                self.assertEqual(self.assert_drift(exporter, [1, 2, big], pa.decimal128(38, 0)), [1, 2, big])
+                self.assertEqual(
+                    self.assert_drift(exporter, [1, 2, 10 ** 40], pa.string()), ["1", "2", str(10 ** 40)]
+                )
+                self.assertEqual(self.assert_drift(exporter, [None, None, 3], pa.int64()), [None, None, 3])
+                self.assertEqual(
+                    self.assert_drift(exporter, [None, None, None, None, "x"], pa.string()), [None] * 4 + ["x"]
+                )
+                self.assertEqual(self.assert_drift(exporter, [1, None, None, 4], pa.int64()), [1, None, None, 4])
+
+    def test_floats_never_round_large_integers(self):
+        import pyarrow as pa
+        exporter = ParquetExporter(query=None)
+        big = 2 ** 60 + 1
+        self.assertEqual(self.assert_drift(exporter, [big, 2, 2.5], pa.string()), [str(big), "2", "2.5"])
+        self.assertEqual(self.assert_drift(exporter, [1, 2, big, 2.5], pa.string()), ["1", "2", str(big), "2.5"])
+
+    def test_empty_result(self):
+        res = result([])
+        table = self.read_parquet(ParquetExporter(query=None)._get_output(res).getvalue())
+        self.assertEqual((table.column_names, table.num_rows), (["a", "b"], 0))
+
+    def test_streamed_from_query(self):
+        q = SimpleQueryFactory(sql="select 1 as a, 'x' as b union all select 2, 'y'")
+        output = b"".join(ParquetExporter(query=q).get_output_stream())
+        self.assertEqual(self.read_parquet(output).to_pylist(), [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}])
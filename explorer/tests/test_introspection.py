@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.postgresql.introspection import DatabaseIntrospection as PostgresIntrospection
+from django.test import TestCase
+
+from explorer import schema
+from explorer.ee.db_connections.utils import default_db_connection
+from explorer.introspection import describe_all_tables
+
+
+try:
+    import MySQLdb
+except ImportError:
+    MySQLdb = None
+
+
+def snowflake_identifier_converter(name):
+    # As django-snowflake's: unquoted (uppercase) identifiers are lowercased, mixed case ones are left alone
+    return name.lower() if name == name.upper() else name
+
+
+class TestDescribeAllTables(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE introspection_test (
+                    id integer PRIMARY KEY AUTOINCREMENT,
+                    name varchar(20) NOT NULL,
+                    price decimal(10, 2),
+                    ratio real,
+                    created datetime,
+                    blob_col blob,
+                    "Data" text CHECK (JSON_VALID("Data")),
+                    odd_type frobnicator
+                )
+            """)
+            cursor.execute("CREATE VIEW introspection_test_view AS SELECT id, name FROM introspection_test")
+
+    def _describe_each(self, table_names):
+        with patch("explorer.introspection.BULK_INTROSPECTORS", {}), patch("explorer.schema._include_views") as views:
+            views.return_value = True
+            return {t: cols for t, cols in schema.build_schema_info(default_db_connection()) if t in table_names}
+
+    def test_matches_describing_each_table(self):
+        with connection.cursor() as cursor:
+            described = describe_all_tables(connection, cursor)
+        expected = self._describe_each(set(described))
+        self.assertIn("introspection_test", expected)
+        self.assertIn("introspection_test_view", expected)
+        self.assertEqual({t: described[t] for t in expected}, expected)
+        self.assertEqual(dict(described["introspection_test"])["Data"], "JSONField")
+        self.assertEqual(dict(described["introspection_test"])["id"], "AutoField")
+        self.assertEqual(dict(described["introspection_test"])["odd_type"], "Unknown")
+
+    def test_schema_is_built_without_describing_each_table(self):
+        describe = "django.db.backends.sqlite3.introspection.DatabaseIntrospection.get_table_description"
+        with patch(describe) as described:
+            res = dict(schema.build_schema_info(default_db_connection()))
+        described.assert_not_called()
+        self.assertIn("introspection_test", res)
+
+    @patch("explorer.introspection.BULK_INTROSPECTORS", {"sqlite": lambda connection, cursor: cursor.execute("nope")})
+    def test_falls_back_to_describing_each_table(self):
+        res = dict(schema.build_schema_info(default_db_connection()))
+        self.assertEqual([c for c, _ in res["introspection_test"]][:2], ["id", "name"])
+
+    def test_unsupported_vendor(self):
+        with patch.object(connection, "vendor", "other"), connection.cursor() as cursor:
+            self.assertIsNone(describe_all_tables(connection, cursor))
+
+
+class TestBulkIntrospectors(TestCase):
+
+    def mock_connection(self, vendor, rows, introspection=None):
+        conn = MagicMock(vendor=vendor)
+        if introspection:
+            conn.introspection = introspection(conn)
+        else:
+            conn.introspection.identifier_converter = lambda name: name
+        cursor = MagicMock()
+        cursor.fetchall.return_value = rows
+        return conn, cursor
+
+    def test_postgresql(self):
+        conn, cursor = self.mock_connection("postgresql", [
+            ("orders", "id", 23, None, True),
+            ("orders", "legacy_id", 20, "nextval('orders_legacy_id_seq'::regclass)", False),
+            ("orders", "total", 1700, None, False),
+            ("orders", "note", 25, None, False),
+            ("orders", "shape", 999999, None, False),
+            ("Line Items", "Qty", 21, None, False),
+        ], PostgresIntrospection)
+        self.assertEqual(describe_all_tables(conn, cursor), {
+            "orders": [("id", "AutoField"), ("legacy_id", "BigAutoField"), ("total", "DecimalField"),
+                       ("note", "TextField"), ("shape", "Unknown")],
+            "Line Items": [("Qty", "SmallIntegerField")],
+        })
+        self.assertIn("pg_catalog.pg_attribute", cursor.execute.call_args.args[0])
+
+    @unittest.skipIf(MySQLdb is None, "mysqlclient not installed")
+    def test_mysql(self):
+        from django.db.backends.mysql.introspection import DatabaseIntrospection
+        conn, cursor = self.mock_connection("mysql", [
+            ("orders", "id", "int", "auto_increment", 0),
+            ("orders", "views", "bigint", "", 1),
+            ("orders", "data", "json", "", 0),
+            ("orders", "name", "VARCHAR", "", 0),
+        ], DatabaseIntrospection)
+        self.assertEqual(describe_all_tables(conn, cursor), {
+            "orders": [("id", "AutoField"), ("views", "PositiveBigIntegerField"), ("data", "JSONField"),
+                       ("name", "CharField")],
+        })
+
+    def test_mysql_without_driver(self):
+        conn, cursor = self.mock_connection("mysql", [("orders", "id", "int", "", 0)])
+        with patch.dict("sys.modules", {"MySQLdb": None, "MySQLdb.constants": None}):
+            self.assertIsNone(describe_all_tables(conn, cursor))
+
+    def test_sql_server(self):
+        conn, cursor = self.mock_connection("microsoft", [
+            ("Orders", "OrderID", "int"),
+            ("Orders", "Name", "NVARCHAR"),
+            ("Orders", "Placed", "datetime2"),
+            ("Orders", "Location", "geography"),
+        ])
+        self.assertEqual(describe_all_tables(conn, cursor), {
+            "Orders": [("OrderID", "IntegerField"), ("Name", "CharField"), ("Placed", "DateTimeField"),
+                       ("Location", "Unknown")],
+        })
+        self.assertIn("SCHEMA_NAME()", cursor.execute.call_args.args[0])
+
+    def test_snowflake_names_match_its_introspection(self):
+        conn, cursor = self.mock_connection("snowflake", [
+            ("ORDERS", "ID", "NUMBER"),
+            ("ORDERS", "CREATED", "TIMESTAMP_NTZ"),
+            ("MixedCase", "Payload", "VARIANT"),
+        ])
+        conn.introspection.identifier_converter = snowflake_identifier_converter
+        self.assertEqual(describe_all_tables(conn, cursor), {
+            "orders": [("id", "DecimalField"), ("created", "DateTimeField")],
+            "MixedCase": [("Payload", "JSONField")],
+        })
+        self.assertIn("CURRENT_SCHEMA()", cursor.execute.call_args.args[0])
+
+    def test_snowflake_stamps_match_its_introspection(self):
+        conn, cursor = self.mock_connection("snowflake", [("ORDERS", "2024-01-01"), ("MixedCase", "2024-01-02")])
+        conn.introspection.identifier_converter = snowflake_identifier_converter
+        self.assertEqual(set(schema._table_stamps(conn, cursor)), {"orders", "MixedCase"})
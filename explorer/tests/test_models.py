@@ -1,15 +1,24 @@
+import pickle
 import unittest
 import os
+from array import array
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import Mock, patch, MagicMock
 
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, connections
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from explorer import app_settings
-from explorer.models import ColumnHeader, ColumnSummary, Query, QueryLog, QueryResult, DatabaseConnection
+from explorer import app_settings, column_stats
+from explorer.models import (
+    ColumnHeader, ColumnSummary, Query, QueryLog, QueryResult, QueryStats, DatabaseConnection, StreamingQueryResult
+)
+from explorer.columnar import ColumnarRows, to_column
 from explorer.tests.factories import SimpleQueryFactory
-from explorer.ee.db_connections.utils import default_db_connection
+from explorer.ee.db_connections.utils import default_db_connection, end_transaction
 
 
 class TestQueryModel(TestCase):
@@ -68,19 +77,28 @@ class TestQueryModel(TestCase):
         self.assertEqual(q.get_run_count(), 0)
         expected = 4
         for _ in range(0, expected):
-            q.log()
+            q.log().finish(duration=1)
         self.assertEqual(q.get_run_count(), expected)
 
+    def test_unfinished_runs_are_not_counted(self):
+        q = SimpleQueryFactory()
+        q.log()
+        self.assertEqual(q.get_run_count(), 0)
+        QueryStats.rebuild([q.id])
+        self.assertEqual(q.get_run_count(), 0)
+
+    def test_log_does_not_touch_stats(self):
+        q = SimpleQueryFactory()
+        with CaptureQueriesContext(connection) as ctx:
+            q.log()
+        self.assertFalse([c for c in ctx.captured_queries if "explorer_querystats" in c["sql"]])
+
     def test_avg_duration(self):
         q = SimpleQueryFactory()
         self.assertIsNone(q.avg_duration())
         expected = 2.5
-        ql = q.log()
-        ql.duration = 2
-        ql.save()
-        ql = q.log()
-        ql.duration = 3
-        ql.save()
+        q.log().finish(duration=2)
+        q.log().finish(duration=3)
         self.assertEqual(q.avg_duration(), expected)
 
     def test_log_saves_duration(self):
@@ -103,6 +121,42 @@ class TestQueryModel(TestCase):
         self.assertFalse(log.success)
         self.assertIsNotNone(log.error)
 
+    def _querylog_writes(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        return [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"].startswith(("INSERT", "UPDATE")) and "explorer_querylog" in q["sql"]
+        ]
+
+    @patch("explorer.app_settings.EXPLORER_BUFFERED_QUERY_LOGS", True)
+    def test_buffered_log_is_written_once(self):
+        q = SimpleQueryFactory()
+        writes = self._querylog_writes(lambda: q.execute_with_logging(None))
+        self.assertEqual(len(writes), 1)
+        log = QueryLog.objects.get()
+        self.assertIsNotNone(log.duration)
+        self.assertTrue(log.success)
+        stats = q.get_stats()
+        self.assertEqual((stats.run_count, stats.success_count, stats.last_run_at), (1, 1, log.run_at))
+
+    @patch("explorer.app_settings.EXPLORER_BUFFERED_QUERY_LOGS", True)
+    def test_buffered_log_saves_errors(self):
+        q = SimpleQueryFactory(sql="select wildly invalid query")
+        with self.assertRaises(DatabaseError):
+            q.execute_with_logging(None)
+        log = QueryLog.objects.get()
+        self.assertFalse(log.success)
+        self.assertIsNotNone(log.error)
+        stats = q.get_stats()
+        self.assertEqual((stats.run_count, stats.failure_count, stats.last_run_success), (1, 1, False))
+
+    def test_unbuffered_log_is_written_when_the_query_starts(self):
+        q = SimpleQueryFactory()
+        writes = self._querylog_writes(lambda: q.execute_with_logging(None))
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(writes[0].startswith("INSERT"))
+
     @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
     @patch("explorer.models.s3_url")
     @patch("explorer.models.get_s3_bucket")
@@ -138,6 +192,119 @@ class TestQueryModel(TestCase):
         with self.assertRaises(ValidationError):
             q.execute_query_only()
 
+    def test_count_rows(self):
+        q = SimpleQueryFactory(sql="select 1 union all select 2 union all select 3;")
+        self.assertEqual(q.count_rows(), 3)
+
+    @patch("explorer.models.statement_timeout")
+    def test_count_rows_has_a_timeout(self, mocked_timeout):
+        q = SimpleQueryFactory(sql="select 1", timeout=5)
+        self.assertEqual(q.count_rows(), 1)
+        self.assertEqual(mocked_timeout.call_args[0][1], 5)
+
+    def test_count_rows_ending_in_a_comment(self):
+        q = SimpleQueryFactory(sql="select 1 union select 2 -- note")
+        self.assertEqual(q.count_rows(), 2)
+
+    def test_execute_with_max_rows(self):
+        q = SimpleQueryFactory(sql="select 1 as a union all select 2 union all select 3;")
+        res = q.execute(max_rows=2)
+        self.assertEqual(res.data, [[1], [2]])
+        self.assertTrue(res.has_more)
+
+    @patch("explorer.app_settings.EXPLORER_BIND_PARAMS", True)
+    def test_bound_params(self):
+        q = SimpleQueryFactory(sql="select '$$name$$' as name, 1 as n where 'x%' like $$pattern:x%$$")
+        q.params = {"name": "O'Brien"}
+        self.assertEqual(
+            q.sql_and_params(), ("select %s as name, 1 as n where 'x%%' like %s", ["O'Brien", "x%"])
+        )
+        res = q.execute()
+        self.assertEqual(res.data, [["O'Brien", 1]])
+        self.assertEqual(q.count_rows(), 1)
+        # The log still shows the SQL with the values filled in
+        res, ql = q.execute_with_logging(None)
+        self.assertEqual(ql.sql, "select 'O'Brien' as name, 1 as n where 'x%' like x%")
+
+    def test_substituted_params(self):
+        q = SimpleQueryFactory(sql="select '$$name$$' as name")
+        q.params = {"name": "Jo"}
+        self.assertEqual(q.sql_and_params(), ("select 'Jo' as name", None))
+
+    def test_effective_timeout(self):
+        q = SimpleQueryFactory()
+        self.assertIsNone(q.effective_timeout())
+        with patch("explorer.app_settings.EXPLORER_DEFAULT_QUERY_TIMEOUT", 30):
+            self.assertEqual(q.effective_timeout(), 30)
+            q.database_connection.query_timeout = 20
+            self.assertEqual(q.effective_timeout(), 20)
+            q.timeout = 10
+            self.assertEqual(q.effective_timeout(), 10)
+
+    def test_timeout_is_enforced(self):
+        q = SimpleQueryFactory(
+            sql="WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) "
+                "SELECT COUNT(*) FROM c",
+            timeout=1
+        )
+        with self.assertRaisesMessage(DatabaseError, "timeout of 1 seconds"):
+            q.execute_with_logging(None)
+        log = QueryLog.objects.first()
+        self.assertFalse(log.success)
+        self.assertIsNone(log.backend_pid)
+
+    @patch("explorer.models.backend_pid", return_value=4321)
+    def test_backend_pid_is_recorded_while_running(self, mocked_backend_pid):
+        q = SimpleQueryFactory(sql="select 1;")
+        pids = []
+        orig = QueryLog.record_backend_pid
+
+        def record(ql, connection):
+            orig(ql, connection)
+            pids.append(QueryLog.objects.get(pk=ql.pk).backend_pid)
+
+        with patch.object(QueryLog, "record_backend_pid", record):
+            res, ql = q.execute_with_logging(None)
+        self.assertEqual(pids, [4321])
+        ql.refresh_from_db()
+        self.assertIsNone(ql.backend_pid)
+        self.assertFalse(ql.is_running)
+
+    @patch("explorer.models.backend_pid", return_value=4321)
+    def test_backend_pid_is_cleared_on_any_error(self, mocked_backend_pid):
+        q = SimpleQueryFactory(sql="select 1;")
+        with patch("explorer.models.QueryResult.process", side_effect=ValueError("bad row")):
+            with self.assertRaises(ValueError):
+                q.execute_with_logging(None)
+        ql = QueryLog.objects.get()
+        self.assertIsNone(ql.backend_pid)
+        self.assertFalse(ql.success)
+        self.assertEqual(ql.error, "bad row")
+
+        QueryLog.objects.all().delete()
+        with patch("explorer.models.QueryResult.process", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                q.execute_with_logging(None)
+        self.assertIsNone(QueryLog.objects.get().backend_pid)
+
+    @patch("explorer.models.cancel_backend", return_value=True)
+    def test_cancel(self, mocked_cancel):
+        ql = QueryLog.objects.create(sql="select 1;", backend_pid=99,
+                                     database_connection=default_db_connection())
+        self.assertTrue(ql.is_running)
+        self.assertTrue(ql.cancel())
+        self.assertEqual(mocked_cancel.call_args[0][1], 99)
+
+        ql.duration = 10
+        self.assertFalse(ql.cancel())
+        self.assertEqual(mocked_cancel.call_count, 1)
+
+    @patch("explorer.models.cancel_backend", return_value=True)
+    def test_cancel_on_default_connection(self, mocked_cancel):
+        ql = QueryLog.objects.create(sql="select 1;", backend_pid=99, database_connection=None)
+        self.assertTrue(ql.cancel())
+        self.assertEqual(mocked_cancel.call_args[0][1], 99)
+
     def test_query_will_execute_with_null_database_connection(self):
         q = SimpleQueryFactory(sql="select 1;")
         q.database_connection_id = None
@@ -206,11 +373,112 @@ class TestQueryResults(TestCase):
         self.qr.process()
         self.assertEqual(['<a href="1">1</a>', "x: 2"], self.qr._data[0])
 
+    def test_max_rows_limits_fetch(self):
+        conn = default_db_connection().as_django_connection()
+        sql = "select 1 as a union all select 2 union all select 3"
+        qr = QueryResult(sql, conn, max_rows=2)
+        self.assertEqual(qr.data, [[1], [2]])
+        self.assertTrue(qr.has_more)
+        self.assertEqual(str(qr.headers[0]), "a")
+
+        qr = QueryResult(sql, conn, max_rows=3)
+        self.assertEqual(qr.data, [[1], [2], [3]])
+        self.assertFalse(qr.has_more)
+
     def test_get_headers_no_results(self):
         self.qr._description = None
         self.assertEqual([ColumnHeader("--")][0].title, self.qr._get_headers()[0].title)
 
 
+class TestStreamingQueryResult(TestCase):
+
+    def setUp(self):
+        self.conn = default_db_connection().as_django_connection()
+
+    def test_rows_are_fetched_in_batches(self):
+        sql = "select 1 as a union all select 2 union all select 3 union all select 4 union all select 5"
+        res = StreamingQueryResult(sql, self.conn, fetch_size=2)
+        self.assertEqual([str(h) for h in res.headers], ["a"])
+        with patch.object(res._cursor, "fetchmany", wraps=res._cursor.fetchmany) as fetchmany:
+            rows = list(res.iter_rows())
+        self.assertEqual(rows, [[1], [2], [3], [4], [5]])
+        # The first batch is fetched up front, then two more full batches and one empty one
+        self.assertEqual(fetchmany.call_count, 3)
+        self.assertIsNone(res._cursor)
+
+    def test_iter_rows_is_single_use(self):
+        res = StreamingQueryResult("select 1 as a", self.conn)
+        self.assertEqual(list(res.iter_rows()), [[1]])
+        self.assertEqual(list(res.iter_rows()), [])
+
+    def test_data_materializes_remaining_rows(self):
+        res = StreamingQueryResult("select 1 as a union all select 2", self.conn, fetch_size=1)
+        self.assertEqual(res.data, [[1], [2]])
+        self.assertEqual(list(res.iter_rows()), [[1], [2]])
+
+    def test_empty_result(self):
+        res = StreamingQueryResult("select 1 as a where 1 = 0", self.conn)
+        self.assertEqual(str(res.headers[0]), "a")
+        self.assertEqual(list(res.iter_rows()), [])
+
+    @patch.object(StreamingQueryResult, "_uses_named_cursor", lambda self: True)
+    def test_rows_are_read_in_a_transaction(self):
+        # The test case's own transaction is on the connection already, so the result's transaction is a savepoint
+        with patch.object(self.conn, "savepoint_commit", wraps=self.conn.savepoint_commit) as commit:
+            res = StreamingQueryResult("select 1 as a union all select 2", self.conn, fetch_size=1)
+            savepoint = res._transaction
+            self.assertIsNotNone(savepoint)
+            commit.assert_not_called()
+            self.assertEqual(list(res.iter_rows()), [[1], [2]])
+        commit.assert_called_once_with(savepoint)
+        self.assertIsNone(res._transaction)
+
+    @patch.object(StreamingQueryResult, "_uses_named_cursor", lambda self: True)
+    def test_transaction_is_on_the_results_own_connection(self):
+        # e.g. a connection that isn't pooled, so isn't the one registered under its alias
+        own = connections.create_connection(self.conn.alias)
+        try:
+            res = StreamingQueryResult("select 1 as a union all select 2", own, fetch_size=1)
+            self.assertFalse(own.get_autocommit())
+            self.assertEqual(list(res.iter_rows()), [[1], [2]])
+            self.assertTrue(own.get_autocommit())
+        finally:
+            own.close()
+
+    @patch.object(StreamingQueryResult, "_uses_named_cursor", lambda self: True)
+    def test_abandoned_rows_end_the_transaction(self):
+        res = StreamingQueryResult("select 1 as a union all select 2", self.conn, fetch_size=1)
+        rows = res.iter_rows()
+        next(rows)
+        with patch("explorer.models.end_transaction", wraps=end_transaction) as end:
+            rows.close()
+        self.assertTrue(end.call_args.args[2])
+        self.assertIsNone(res._transaction)
+        self.assertIsNone(res._cursor)
+
+    @patch.object(StreamingQueryResult, "_uses_named_cursor", lambda self: True)
+    def test_sql_errors_end_the_transaction(self):
+        with patch("explorer.models.end_transaction", wraps=end_transaction) as end:
+            with self.assertRaises(DatabaseError):
+                StreamingQueryResult("select * from no_such_table", self.conn)
+        end.assert_called_once()
+        self.assertTrue(end.call_args.args[2])
+
+    @patch.object(StreamingQueryResult, "_uses_named_cursor", lambda self: True)
+    def test_closing_unread_output_ends_the_transaction(self):
+        from explorer.exporters import CSVExporter
+        output = CSVExporter(SimpleQueryFactory(sql="select 1 as a")).get_output_stream()
+        with patch("explorer.models.end_transaction", wraps=end_transaction) as end:
+            output.close()
+        end.assert_called_once()
+
+    def test_execute_query_only_streams(self):
+        q = SimpleQueryFactory(sql="select 1 as a;")
+        res = q.execute_query_only(stream=True)
+        self.assertIsInstance(res, StreamingQueryResult)
+        self.assertEqual(list(res.iter_rows()), [[1]])
+
+
 class TestColumnSummary(TestCase):
 
     def test_executes(self):
@@ -225,6 +493,186 @@ class TestColumnSummary(TestCase):
         res = ColumnSummary("foo", [])
         self.assertEqual(res.stats, {"Min": 0, "Max": 0, "Avg": 0, "Sum": 0,  "NUL": 0})
 
+    def test_decimals(self):
+        res = ColumnSummary("foo", [Decimal("1.25"), Decimal("2.5"), None])
+        self.assertEqual(res.stats, {"Min": 0, "Max": 2.5, "Avg": 1.25, "Sum": 3.75, "NUL": 1})
+
+    def test_all_null(self):
+        res = ColumnSummary("foo", [None, None])
+        self.assertEqual(res.stats, {"Min": 0, "Max": 0, "Avg": 0, "Sum": 0, "NUL": 2})
+
+    @patch("explorer.app_settings.EXPLORER_SUMMARY_EXTRA_STATS", ["distinct", "stddev", "p50", "p90"])
+    def test_extra_stats(self):
+        res = ColumnSummary("foo", [1, 2, 2, 5, None])
+        self.assertEqual(res.stats, {
+            "Min": 0, "Max": 5, "Avg": 2, "Sum": 10, "NUL": 1,
+            "Distinct": 3, "StdDev": 1.5, "P50": 2, "P90": 4.1
+        })
+
+    @patch("explorer.app_settings.EXPLORER_SUMMARY_EXTRA_STATS", ["median"])
+    def test_unknown_extra_stat(self):
+        with self.assertRaises(ValueError):
+            ColumnSummary("foo", [1])
+
+    @unittest.skipIf(column_stats.np is None, "numpy not installed")
+    def test_numpy_matches_python(self):
+        extra = ["distinct", "stddev", "p25", "p99.9"]
+        cols = [
+            [i % 17 - 8 for i in range(2000)],
+            [None if i % 5 == 0 else Decimal(i) / 7 for i in range(3000)],
+            [None] * 1000 + [3],
+            [2.5] * 1500,
+        ]
+        for col in cols:
+            with patch("explorer.column_stats.NUMPY_MIN_VALUES", 0):
+                vectorized = column_stats.summarize(col, extra)
+            with patch("explorer.column_stats.np", None):
+                pure = column_stats.summarize(col, extra)
+            self.assertEqual([label for label, _, _ in vectorized], [label for label, _, _ in pure])
+            for (label, v, _), (_, p, _) in zip(vectorized, pure, strict=True):
+                self.assertAlmostEqual(float(v), float(p), places=6, msg=label)
+
+    def test_columns_are_collected_in_one_pass(self):
+        conn = default_db_connection().as_django_connection()
+        qr = QueryResult("select 1 as a, 'x' as b, 2 as c union all select 3, 'y', null", conn)
+        self.assertEqual([list(c) for c in qr.columns([0, 2])], [[1, 3], [2, None]])
+        self.assertEqual(qr.columns([1]), [["x", "y"]])
+        self.assertEqual(qr.columns([]), [])
+        qr.process()
+        self.assertEqual(qr.headers[2].summary.stats["NUL"], 1)
+
+
+class TestColumnarResults(TestCase):
+
+    def test_to_column(self):
+        self.assertEqual(to_column([1, 2]), array("q", [1, 2]))
+        self.assertEqual(to_column((1.5, 2.0)), array("d", [1.5, 2.0]))
+        self.assertEqual(to_column([1, None]), [1, None])
+        self.assertEqual(to_column([1, 2.5]), [1, 2.5])
+        self.assertEqual(to_column([True, False]), [True, False])
+        self.assertEqual(to_column([2 ** 70]), [2 ** 70])
+        self.assertEqual(to_column(["a"]), ["a"])
+
+    def test_rows(self):
+        rows = ColumnarRows.from_rows([(1, "a", 1.5), (2, None, 2.5), (3, "c", 3.5)], 3)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], [2, None, 2.5])
+        self.assertEqual(rows[-1], [3, "c", 3.5])
+        self.assertEqual(rows[:2], [[1, "a", 1.5], [2, None, 2.5]])
+        self.assertEqual(list(rows), [[1, "a", 1.5], [2, None, 2.5], [3, "c", 3.5]])
+        self.assertEqual(rows, [[1, "a", 1.5], [2, None, 2.5], [3, "c", 3.5]])
+        self.assertIsInstance(rows.columns[0], array)
+        self.assertIsInstance(rows.columns[1], list)
+
+    def test_empty(self):
+        rows = ColumnarRows.from_rows([], 2)
+        self.assertEqual(len(rows), 0)
+        self.assertEqual(list(rows), [])
+        self.assertEqual(rows[:10], [])
+
+    @patch("explorer.app_settings.EXPLORER_COLUMNAR_RESULTS", True)
+    def test_query_result(self):
+        conn = default_db_connection().as_django_connection()
+        sql = "select 1 as a, 'x' as b, 2.5 as c union all select 3, 'y', null"
+        res = QueryResult(sql, conn)
+        res.process()
+        self.assertTrue(res.is_columnar)
+        self.assertEqual(res.data, [[1, "x", 2.5], [3, "y", None]])
+        self.assertEqual(res.column(0), array("q", [1, 3]))
+        self.assertEqual(res.headers[0].summary.stats, {"Sum": 4, "Avg": 2, "Min": 1, "Max": 3, "NUL": 0})
+        self.assertEqual(list(res.iter_rows()), [[1, "x", 2.5], [3, "y", None]])
+
+        restored = pickle.loads(pickle.dumps(res))
+        self.assertEqual(restored.data, res.data)
+
+    @patch("explorer.app_settings.EXPLORER_COLUMNAR_RESULTS", True)
+    @patch("explorer.app_settings.EXPLORER_TRANSFORMS", [("a", "<b>{0}</b>")])
+    def test_transforms(self):
+        conn = default_db_connection().as_django_connection()
+        res = QueryResult("select 1 as a, 2 as b", conn)
+        res.process()
+        self.assertEqual(res.data, [["<b>1</b>", 2]])
+
+    @patch("explorer.app_settings.EXPLORER_COLUMNAR_RESULTS", True)
+    def test_max_rows(self):
+        conn = default_db_connection().as_django_connection()
+        res = QueryResult("select 1 union all select 2 union all select 3", conn, max_rows=2)
+        self.assertTrue(res.has_more)
+        self.assertEqual(res.data, [[1], [2]])
+
+
+class TestQueryStats(TestCase):
+
+    def _run(self, q, duration=None, error=None):
+        ql = q.log()
+        ql.finish(duration=duration, error=error)
+        return ql
+
+    def _fields(self, stats):
+        return {f.name: getattr(stats, f.name) for f in QueryStats._meta.fields}
+
+    def test_incremental_updates(self):
+        q = SimpleQueryFactory()
+        for duration in (3, 40, 40, 2000):
+            self._run(q, duration=duration)
+        last = self._run(q, error="boom")
+        q.log()  # still running, so not counted yet
+
+        stats = q.get_stats()
+        self.assertEqual(stats.run_count, 5)
+        self.assertEqual(stats.success_count, 4)
+        self.assertEqual(stats.failure_count, 1)
+        self.assertEqual(stats.duration_count, 4)
+        self.assertEqual(stats.avg_duration, 520.75)
+        self.assertEqual(stats.max_duration, 2000)
+        self.assertEqual(stats.p50_duration, 50)
+        self.assertEqual(stats.p95_duration, 2000)
+        self.assertEqual(stats.last_run_at, last.run_at)
+        self.assertFalse(stats.last_run_success)
+
+    def test_last_run_failed(self):
+        q = SimpleQueryFactory()
+        self._run(q, duration=1)
+        self._run(q, error="boom")
+        self.assertFalse(q.get_stats().last_run_success)
+
+    def test_never_run(self):
+        stats = SimpleQueryFactory().get_stats()
+        self.assertEqual(stats.run_count, 0)
+        self.assertIsNone(stats.avg_duration)
+        self.assertIsNone(stats.last_run_at)
+
+    def test_playground_queries_have_no_stats(self):
+        Query(sql="select 1;", title="Playground").log().finish(duration=1)
+        self.assertFalse(QueryStats.objects.exists())
+
+    def test_rebuild_matches_incremental(self):
+        q1 = SimpleQueryFactory()
+        q2 = SimpleQueryFactory()
+        for i in range(20):
+            self._run(q1, duration=i * 7.5)
+        self._run(q1, error="boom")
+        self._run(q2, duration=100000)
+        self._run(q2, duration=400000)
+        q2.log()  # still running
+        incremental = {s.pk: self._fields(s) for s in QueryStats.objects.all()}
+
+        self.assertEqual(QueryStats.rebuild(), 2)
+        self.assertEqual({s.pk: self._fields(s) for s in QueryStats.objects.all()}, incremental)
+        self.assertEqual(incremental[q2.pk]["p95_duration"], 400000)
+
+    def test_rebuild_command(self):
+        q1 = SimpleQueryFactory()
+        q2 = SimpleQueryFactory()
+        self._run(q1, duration=1)
+        self._run(q2, duration=1)
+        QueryStats.objects.update(run_count=0)
+        out = StringIO()
+        call_command("rebuild_query_stats", str(q1.pk), stdout=out)
+        self.assertIn("1 queries", out.getvalue())
+        self.assertEqual(q1.get_run_count(), 1)
+        self.assertEqual(q2.get_run_count(), 0)
+
 
 class TestDatabaseConnection(TestCase):
 
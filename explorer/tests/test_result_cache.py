@@ -0,0 +1,126 @@
+import pickle
+import tempfile
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from explorer.models import QueryLog
+from explorer.result_cache import (
+    DiskStorage, DjangoCacheStorage, cache_result, get_cached_result, result_cache_key
+)
+from explorer.tests.factories import SimpleQueryFactory
+
+
+class TestResultCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_results_are_cached(self):
+        q = SimpleQueryFactory(sql="select 1 as a, 2 as b", cache_ttl=60)
+        res, ql = q.execute_with_logging(None)
+        self.assertIsNone(res.cache_age)
+        self.assertIsNotNone(ql)
+
+        cached, ql = q.execute_with_logging(None)
+        self.assertIsNone(ql)
+        self.assertEqual(cached.data, [[1, 2]])
+        self.assertEqual(cached.header_strings, ["a", "b"])
+        self.assertEqual(cached.headers[0].summary.stats["Sum"], 1)
+        self.assertGreaterEqual(cached.cache_age, 0)
+        self.assertEqual(QueryLog.objects.count(), 1)
+
+    def test_refresh(self):
+        q = SimpleQueryFactory(sql="select 1", cache_ttl=60)
+        q.execute_with_logging(None)
+        res, ql = q.execute_with_logging(None, refresh=True)
+        self.assertIsNotNone(ql)
+        self.assertIsNone(res.cache_age)
+        self.assertEqual(QueryLog.objects.count(), 2)
+
+    def test_not_cached_without_ttl(self):
+        q = SimpleQueryFactory(sql="select 1")
+        q.execute_with_logging(None)
+        res, ql = q.execute_with_logging(None)
+        self.assertIsNotNone(ql)
+        self.assertIsNone(q.cached_result())
+
+    def test_key_depends_on_sql_params_and_row_limit(self):
+        q = SimpleQueryFactory(sql="select $$x:1$$", cache_ttl=60)
+        q.execute()
+        self.assertIsNotNone(q.cached_result())
+        self.assertIsNone(q.cached_result(max_rows=10))
+        q.params = {"x": "2"}
+        self.assertIsNone(q.cached_result())
+        self.assertNotEqual(result_cache_key("select 1", 1), result_cache_key("select 1", 2))
+
+    def test_expiry(self):
+        q = SimpleQueryFactory(sql="select 1", cache_ttl=60)
+        q.execute()
+        with patch("explorer.result_cache.time", return_value=10 ** 11):
+            self.assertIsNone(q.cached_result())
+
+    def test_unpicklable_results_are_not_cached(self):
+        q = SimpleQueryFactory(sql="select 1", cache_ttl=60)
+        res = q.execute()
+        res._data = [[lambda: 1]]
+        cache_result("key", res, 60)
+        self.assertIsNone(get_cached_result("key"))
+
+    def test_corrupt_entries_are_discarded(self):
+        cache.set("key", b"not a pickle")
+        self.assertIsNone(get_cached_result("key"))
+        self.assertIsNone(cache.get("key"))
+
+
+class TestDjangoCacheStorage(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_least_recently_used_are_evicted(self):
+        storage = DjangoCacheStorage("default")
+        with patch("explorer.app_settings.EXPLORER_RESULT_CACHE_MAX_SIZE", 20):
+            storage.set("a", b"0123456789", 60)
+            storage.set("b", b"0123456789", 60)
+            storage.get("a")
+            storage.set("c", b"0123456789", 60)
+        self.assertEqual(storage.get("a"), b"0123456789")
+        self.assertIsNone(storage.get("b"))
+        self.assertEqual(storage.get("c"), b"0123456789")
+
+
+class TestDiskStorage(TestCase):
+
+    def test_roundtrip_and_eviction(self):
+        with tempfile.TemporaryDirectory() as d, \
+                patch("explorer.app_settings.EXPLORER_RESULT_CACHE_STORAGE", "disk"), \
+                patch("explorer.app_settings.EXPLORER_RESULT_CACHE_DIR", d):
+            q = SimpleQueryFactory(sql="select 1", cache_ttl=60)
+            q.execute()
+            self.assertEqual(q.cached_result().data, [[1]])
+
+            storage = DiskStorage(d)
+            with patch("explorer.app_settings.EXPLORER_RESULT_CACHE_MAX_SIZE", 20), \
+                    patch("os.utime") as utime:
+                storage.set("a", b"0123456789", 60)
+                storage.set("b", b"0123456789", 60)
+                self.assertIsNone(storage.get(q.result_cache_key()))
+                self.assertEqual(storage.get("a"), b"0123456789")
+                utime.assert_called()
+
+    def test_missing_entry(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.assertIsNone(DiskStorage(d).get("nope"))
+            DiskStorage(d).delete("nope")
+
+
+class TestPickling(TestCase):
+
+    def test_connection_is_not_pickled(self):
+        res = SimpleQueryFactory(sql="select 1 as a").execute()
+        restored = pickle.loads(pickle.dumps(res))
+        self.assertIsNone(restored.connection)
+        self.assertEqual(restored.data, [[1]])
+        self.assertEqual(restored.headers[0].summary.stats["Avg"], 1)
@@ -1,7 +1,8 @@
 from unittest.mock import patch
 
 from django.core.cache import cache
-from django.db import connection
+from django.db import DatabaseError, connection
+from django.db.backends.sqlite3.introspection import DatabaseIntrospection
 from django.test import TestCase
 
 from explorer import schema
@@ -12,6 +13,9 @@ def conn():
     return default_db_connection()
 
 
+get_table_description = DatabaseIntrospection.get_table_description
+
+
 class TestSchemaInfo(TestCase):
 
     def setUp(self):
@@ -88,6 +92,81 @@ class TestSchemaInfo(TestCase):
             "table2": ["col1", "col2"],
         })
 
+    def test_encode_schema(self):
+        schema_info = [
+            ("table1", [("id", "AutoField"), ("name", "CharField")]),
+            ("table2", [("id", "AutoField"), ("table1_id", "IntegerField")]),
+            ("empty", []),
+        ]
+        version, payload = schema.encode_schema(schema_info)
+        self.assertEqual(schema.decode_schema(payload), schema_info)
+        self.assertEqual(schema.encode_schema(list(schema_info))[0], version)
+        self.assertNotEqual(schema.encode_schema(schema_info[:2])[0], version)
+
+    def test_schema_is_cached_encoded(self):
+        res = schema.schema_info(conn())
+        version, payload = cache.get(schema.connection_schema_cache_key(conn().id))
+        self.assertEqual(schema.decode_schema(payload), res)
+        self.assertEqual(schema.schema_payload(conn()), (version, payload))
+
+    def test_old_cache_format_is_ignored(self):
+        cache.set(schema.connection_schema_cache_key(conn().id), [("old", [])])
+        self.assertIn("explorer_query", schema.schema_json_info(conn()))
+
+
+@patch("explorer.introspection.BULK_INTROSPECTORS", {})
+class TestIncrementalSchema(TestCase):
+
+    describe = "django.db.backends.sqlite3.introspection.DatabaseIntrospection.get_table_description"
+
+    def setUp(self):
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE schema_test_a (id integer)")
+            cursor.execute("CREATE TABLE schema_test_b (id integer)")
+
+    def _build(self):
+        with patch(self.describe, autospec=True, side_effect=get_table_description) as described:
+            res = dict(schema.build_schema_info(conn()))
+        return res, [call.args[2] for call in described.call_args_list]
+
+    def test_only_changed_tables_are_described(self):
+        first, described = self._build()
+        self.assertIn("schema_test_a", described)
+        self.assertEqual(len(described), len(first))
+
+        with connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE schema_test_a ADD COLUMN added text")
+        second, described = self._build()
+        self.assertEqual(described, ["schema_test_a"])
+        self.assertEqual([c for c, _ in second["schema_test_a"]], ["id", "added"])
+        self.assertEqual(second["schema_test_b"], first["schema_test_b"])
+
+    def test_refresh_is_incremental(self):
+        schema.schema_info(conn())
+        schema.clear_schema_cache(conn())
+        _, described = self._build()
+        self.assertEqual(described, [])
+
+    @patch("explorer.app_settings.EXPLORER_SCHEMA_TABLE_CACHE_TIMEOUT", 1234)
+    def test_tables_are_cached_with_their_own_timeout(self):
+        with patch("explorer.schema.cache.set_many", wraps=cache.set_many) as set_many:
+            self._build()
+        self.assertEqual(set_many.call_args.kwargs["timeout"], 1234)
+
+    @patch("explorer.schema.TABLE_STAMP_QUERIES", {})
+    def test_without_stamps_everything_is_described(self):
+        first, _ = self._build()
+        second, described = self._build()
+        self.assertEqual(second, first)
+        self.assertEqual(len(described), len(first))
+
+    @patch("explorer.schema.TABLE_STAMP_QUERIES", {"sqlite": "SELECT nonsense FROM nowhere"})
+    def test_failing_stamp_query_describes_everything(self):
+        first, described = self._build()
+        self.assertEqual(len(described), len(first))
+        self.assertIn("schema_test_a", first)
+
 
 def setup_sample_database_view():
     with connection.cursor() as cursor:
@@ -96,3 +175,97 @@ def setup_sample_database_view():
             "sql from explorer_query"
         )
     return "v_explorer_query"
+
+
+class TestBackgroundSchemaBuild(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.background = []
+        patcher = patch("explorer.schema._run_in_background", lambda func, *args: self.background.append((func, args)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        enabled = patch("explorer.app_settings.EXPLORER_SCHEMA_BUILD_IN_BACKGROUND", True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+
+    def run_background_builds(self):
+        while self.background:
+            func, args = self.background.pop(0)
+            with patch("explorer.schema.connections"), patch("explorer.schema.pool"):
+                func(*args)
+
+    def test_building_status_until_built(self):
+        self.assertEqual(schema.schema_status(conn()), (schema.SCHEMA_BUILDING, None))
+        self.assertIsNone(schema.schema_json_info(conn(), wait=False))
+        self.run_background_builds()
+        status, info = schema.schema_status(conn())
+        self.assertEqual(status, schema.SCHEMA_READY)
+        self.assertIn("explorer_query", [t[0] for t in info])
+
+    def test_only_one_build_at_a_time(self):
+        self.assertTrue(schema.start_schema_build(conn()))
+        self.assertFalse(schema.start_schema_build(conn()))
+        self.assertEqual(len(self.background), 1)
+        self.run_background_builds()
+        self.assertTrue(schema.start_schema_build(conn()))
+
+    def test_stale_schema_is_served_while_rebuilding(self):
+        built = schema.schema_info(conn())
+        # As when the current schema expires
+        cache.delete(schema.connection_schema_cache_key(conn().id))
+        self.assertEqual(schema.schema_info(conn(), wait=False), built)
+        self.assertEqual(schema.schema_status(conn()), (schema.SCHEMA_READY, built))
+        self.assertEqual(len(self.background), 1)
+        # The stale schema isn't cached as the current one
+        self.assertIsNone(cache.get(schema.connection_schema_cache_key(conn().id)))
+
+    def test_clearing_drops_the_stale_schema(self):
+        schema.schema_info(conn())
+        schema.clear_schema_cache(conn())
+        self.assertIsNone(cache.get(schema.connection_schema_stale_cache_key(conn().id)))
+        self.assertIsNone(schema.schema_info(conn(), wait=False))
+        self.assertEqual(schema.schema_status(conn()), (schema.SCHEMA_BUILDING, None))
+
+    @patch("explorer.schema.build_schema_info")
+    def test_failed_build_is_not_retried_immediately(self, mocked_build):
+        mocked_build.side_effect = DatabaseError("down")
+        schema.start_schema_build(conn())
+        self.run_background_builds()
+        self.assertEqual(schema.schema_status(conn()), (schema.SCHEMA_FAILED, None))
+        self.assertFalse(schema.start_schema_build(conn()))
+        schema.clear_schema_cache(conn())
+        self.assertTrue(schema.start_schema_build(conn()))
+
+    @patch("explorer.schema.build_schema_cache_async")
+    @patch("explorer.app_settings.EXPLORER_ASYNC_SCHEMA", True)
+    @patch("explorer.app_settings.ENABLE_TASKS", True)
+    def test_async_schema_uses_celery(self, mocked_task):
+        schema.start_schema_build(conn())
+        mocked_task.delay.assert_called_once_with(conn().id)
+        self.assertEqual(self.background, [])
+
+
+class TestRebuildSchemaCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rebuild_reports_tables(self):
+        report = schema.rebuild_schema_cache(conn())
+        self.assertEqual(report["status"], schema.SCHEMA_READY)
+        self.assertEqual(report["tables"], len(schema.schema_info(conn())))
+        self.assertIn("tables in", schema.format_schema_report(report))
+
+    def test_rebuild_is_skipped_while_building(self):
+        cache.add(schema.connection_schema_lock_key(conn().id), True)
+        report = schema.rebuild_schema_cache(conn())
+        self.assertEqual(report["status"], schema.SCHEMA_BUILDING)
+        self.assertIsNone(cache.get(schema.connection_schema_cache_key(conn().id)))
+
+    @patch("explorer.schema.build_schema_info")
+    def test_rebuild_reports_failures(self, mocked_build):
+        mocked_build.side_effect = DatabaseError("down")
+        report = schema.rebuild_schema_cache(conn())
+        self.assertEqual((report["status"], report["error"]), (schema.SCHEMA_FAILED, "down"))
+        self.assertIsNone(cache.get(schema.connection_schema_lock_key(conn().id)))
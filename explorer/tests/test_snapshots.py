@@ -0,0 +1,112 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from explorer.ee.db_connections.models import DatabaseConnection
+from explorer.models import QueryStats
+from explorer.snapshots import (
+    claim_lanes, due_snapshots, is_due, plan_lanes, plan_snapshots, release_lane, retry_delay,
+)
+from explorer.tests.factories import SimpleQueryFactory
+
+
+def query_costing(duration, **kwargs):
+    q = SimpleQueryFactory(snapshot=True, **kwargs)
+    if duration is not None:
+        QueryStats.objects.create(query=q, duration_count=1, total_duration=duration, p95_duration=duration)
+    return q
+
+
+class TestSchedule(TestCase):
+
+    def test_is_due(self):
+        now = timezone.now()
+        q = SimpleQueryFactory.build(snapshot=True, snapshot_interval=60)
+        self.assertTrue(is_due(q, now))
+        q.last_snapshot_at = now - timedelta(minutes=30)
+        self.assertFalse(is_due(q, now))
+        # A run that starts a few seconds early still counts
+        q.last_snapshot_at = now - timedelta(minutes=60) + timedelta(seconds=5)
+        self.assertTrue(is_due(q, now))
+
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_INTERVAL", 1440)
+    def test_no_interval_uses_the_default(self):
+        now = timezone.now()
+        q = SimpleQueryFactory.build(snapshot=True, last_snapshot_at=now - timedelta(hours=2))
+        self.assertFalse(is_due(q, now))
+        q.last_snapshot_at = now - timedelta(days=1)
+        self.assertTrue(is_due(q, now))
+
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_INTERVAL", None)
+    def test_no_default_interval_is_always_due(self):
+        now = timezone.now()
+        q = SimpleQueryFactory.build(snapshot=True, last_snapshot_at=now)
+        self.assertTrue(is_due(q, now))
+
+    def test_due_snapshots(self):
+        now = timezone.now()
+        due = SimpleQueryFactory(snapshot=True, snapshot_interval=60, last_snapshot_at=now - timedelta(hours=2))
+        SimpleQueryFactory(snapshot=True, snapshot_interval=60, last_snapshot_at=now - timedelta(minutes=10))
+        SimpleQueryFactory(snapshot=False)
+        self.assertEqual([q.id for q in due_snapshots(now)], [due.id])
+
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_RETRY_DELAY", 60)
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_MAX_RETRY_DELAY", 600)
+    def test_retry_delay(self):
+        self.assertEqual([retry_delay(r) for r in range(5)], [60, 120, 240, 480, 600])
+
+
+class TestPlanning(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def lane_queries(self, lanes, queries):
+        names = {q.id: q.title for q in queries}
+        return [[names[qid] for qid in lane] for lane in lanes]
+
+    def test_expensive_queries_first_and_balanced(self):
+        queries = [query_costing(d, title=str(d)) for d in (10, 1000, 400, 500, 100)]
+        lanes = plan_lanes(queries, 2)
+        self.assertEqual(self.lane_queries(lanes, queries), [["1000", "10"], ["500", "400", "100"]])
+
+    def test_unknown_costs_go_first(self):
+        queries = [query_costing(100, title="known"), query_costing(None, title="unknown")]
+        self.assertEqual(self.lane_queries(plan_lanes(queries, 1), queries), [["unknown", "known"]])
+
+    def test_fewer_queries_than_lanes(self):
+        self.assertEqual(len(plan_lanes([query_costing(1)], 4)), 1)
+
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_CONCURRENCY", 3)
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_CONNECTION_CONCURRENCY", {"warehouse": 1})
+    def test_lanes_per_connection(self):
+        default = DatabaseConnection.objects.default()
+        alt = DatabaseConnection.objects.create(
+            alias="warehouse", name="warehouse", engine="django.db.backends.postgresql"
+        )
+        queries = [query_costing(1) for _ in range(4)]
+        queries += [query_costing(1, database_connection_id=alt.id) for _ in range(3)]
+        queries.append(query_costing(1, database_connection_id=None))
+        plan = plan_snapshots(queries)
+        self.assertEqual(set(plan), {default.id, alt.id})
+        self.assertEqual(len(plan[default.id]), 3)
+        self.assertEqual(sum(len(lane) for _, lane in plan[default.id]), 5)
+        self.assertEqual(len(plan[alt.id]), 1)
+
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_CONCURRENCY", 2)
+    def test_busy_lanes_are_not_reused(self):
+        conn_id = DatabaseConnection.objects.default().id
+        running = claim_lanes(conn_id, 1)
+        self.assertEqual(len(running), 1)
+
+        plan = plan_snapshots([query_costing(1) for _ in range(3)])
+        self.assertEqual(len(plan[conn_id]), 1)
+        self.assertNotIn(running[0], [key for key, _ in plan[conn_id]])
+        # Both lanes are taken now
+        self.assertEqual(plan_snapshots([query_costing(1)]), {})
+
+        release_lane(running[0])
+        self.assertEqual(claim_lanes(conn_id, 2), running)
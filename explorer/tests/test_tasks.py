@@ -1,3 +1,8 @@
+import gzip
+import json
+import tempfile
+import threading
+import time
 import unittest
 from datetime import datetime, timedelta
 from io import StringIO
@@ -5,14 +10,17 @@ from unittest.mock import patch
 import os
 
 from django.core import mail
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 
 from explorer import app_settings
 from explorer.models import QueryLog
 from explorer.ee.db_connections.models import DatabaseConnection
-from explorer.tasks import execute_query, snapshot_queries, truncate_querylogs, \
-    remove_unused_sqlite_dbs
+from explorer.schema import SCHEMA_READY, SCHEMA_TIMED_OUT, connection_schema_cache_key
+from explorer.snapshots import claim_lanes, release_lane
+from explorer.tasks import TRUNCATE_CURSOR_CACHE_KEY, build_async_schemas, execute_query, snapshot_queries, \
+    snapshot_query, truncate_querylogs, remove_unused_sqlite_dbs
 from explorer.tests.factories import SimpleQueryFactory
 
 
@@ -21,7 +29,8 @@ class TestTasks(TestCase):
     @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
     @patch("explorer.tasks.s3_csv_upload")
     def test_async_results(self, mocked_upload):
-        mocked_upload.return_value = "http://s3.com/your-file.csv"
+        uploaded = []
+        mocked_upload.side_effect = lambda key, data, compression: uploaded.append("".join(data))
 
         q = SimpleQueryFactory(
             sql='select 1 "a", 2 "b", 3 "c";', title="testquery"
@@ -37,9 +46,7 @@ class TestTasks(TestCase):
         )
         self.assertIn("[SQL Explorer] Report ", mail.outbox[1].subject)
         self.assertEqual(
-            mocked_upload
-            .call_args[0][1].getvalue()
-            .decode("utf-8-sig"),
+            uploaded[0].lstrip("\ufeff"),
             output.getvalue()
         )
         self.assertEqual(mocked_upload.call_count, 1)
@@ -72,6 +79,88 @@ class TestTasks(TestCase):
         snapshot_queries()
         self.assertEqual(mocked_upload.call_count, 3)
 
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    @patch("explorer.tasks.s3_csv_upload")
+    def test_snapshots_follow_their_schedules(self, mocked_upload):
+        recent = timezone.now() - timedelta(minutes=10)
+        hourly = SimpleQueryFactory(snapshot=True, snapshot_interval=60, last_snapshot_at=recent)
+        daily = SimpleQueryFactory(snapshot=True, last_snapshot_at=recent)
+        never_run = SimpleQueryFactory(snapshot=True)
+
+        self.assertEqual(snapshot_queries(), 1)
+        self.assertEqual(mocked_upload.call_count, 1)
+        never_run.refresh_from_db()
+        self.assertGreater(never_run.last_snapshot_at, recent)
+
+        hourly.last_snapshot_at = timezone.now() - timedelta(hours=1)
+        hourly.save()
+        self.assertEqual(snapshot_queries(), 1)
+        daily.last_snapshot_at = timezone.now() - timedelta(days=1)
+        daily.save()
+        self.assertEqual(snapshot_queries(), 1)
+        self.assertEqual(mocked_upload.call_count, 3)
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_CONCURRENCY", 1)
+    @patch("explorer.tasks.s3_csv_upload")
+    def test_snapshots_wait_for_a_free_lane(self, mocked_upload):
+        mocked_upload.return_value = "http://s3.com/your-file.csv"
+        q = SimpleQueryFactory(snapshot=True)
+        lanes = claim_lanes(q.database_connection_id, 1)
+
+        self.assertEqual(snapshot_queries(), 0)
+        q.refresh_from_db()
+        self.assertIsNone(q.last_snapshot_at)
+
+        release_lane(lanes[0])
+        self.assertEqual(snapshot_queries(), 1)
+        # Released again once the lane's snapshots are done
+        self.assertEqual(claim_lanes(q.database_connection_id, 1), lanes)
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    @patch("explorer.tasks.s3_csv_upload")
+    def test_snapshot_keys_have_the_time(self, mocked_upload):
+        mocked_upload.return_value = "http://s3.com/your-file.csv"
+        q = SimpleQueryFactory(snapshot=True)
+        with patch("explorer.tasks.timezone") as mocked_timezone:
+            mocked_timezone.now.return_value = timezone.make_aware(datetime(2024, 5, 1, 12, 30, 15))
+            snapshot_query(q.id)
+        self.assertEqual(mocked_upload.call_args[0][0], f"query-{q.id}/snap-20240501-12:30:15.csv")
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_CONCURRENCY", 1)
+    @patch("explorer.app_settings.EXPLORER_SNAPSHOT_MAX_RETRIES", 2)
+    @patch("explorer.tasks.retry_delay")
+    @patch("explorer.tasks.s3_csv_upload")
+    def test_failed_snapshots_back_off_and_give_up(self, mocked_upload, mocked_delay):
+        mocked_delay.side_effect = lambda retries: 60 * 2 ** retries
+        failing = SimpleQueryFactory(snapshot=True, title="failing")
+        SimpleQueryFactory(snapshot=True, title="working")
+        uploaded = []
+
+        def upload(key, data, compression):
+            if key.startswith(f"query-{failing.id}/"):
+                raise ValueError("S3 is down")
+            uploaded.append(key)
+            return "http://s3.com/your-file.csv"
+
+        mocked_upload.side_effect = upload
+        snapshot_queries()
+        self.assertEqual([c[0][0] for c in mocked_delay.call_args_list], [0, 1])
+        # Both queries share the one lane; the failing one doesn't stop the other
+        self.assertEqual(len(uploaded), 1)
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    @patch("explorer.app_settings.EXPLORER_EXPORT_COMPRESSION", {"csv": "gzip"})
+    @patch("explorer.tasks.s3_csv_upload")
+    def test_snapshots_are_compressed(self, mocked_upload):
+        mocked_upload.return_value = "http://s3.com/your-file.csv.gz"
+
+        SimpleQueryFactory(snapshot=True)
+
+        snapshot_queries()
+        self.assertEqual(mocked_upload.call_args[0][2], "gzip")
+
     @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
     def test_truncating_querylogs(self):
         QueryLog(sql="foo").save()
@@ -88,6 +177,44 @@ class TestTasks(TestCase):
         truncate_querylogs(30)
         self.assertEqual(QueryLog.objects.count(), 1)
 
+    def _make_logs(self, old, recent):
+        old_time = timezone.now() - timedelta(days=31)
+        for i in range(old + recent):
+            ql = QueryLog(sql=f"select {i}")
+            ql.save()
+            if i < old:
+                QueryLog.objects.filter(pk=ql.pk).update(run_at=old_time)
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    def test_truncating_querylogs_in_batches(self):
+        self._make_logs(old=7, recent=2)
+        with self.assertNumQueries(2 + 4):  # bounds, then one delete per batch of 2 ids
+            truncate_querylogs(30, batch_size=2)
+        self.assertEqual(QueryLog.objects.count(), 2)
+        self.assertIsNone(cache.get(TRUNCATE_CURSOR_CACHE_KEY))
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    def test_truncating_querylogs_resumes(self):
+        self._make_logs(old=7, recent=2)
+        truncate_querylogs(30, batch_size=2, max_batches=2)
+        self.assertEqual(QueryLog.objects.count(), 5)
+        self.assertIsNotNone(cache.get(TRUNCATE_CURSOR_CACHE_KEY))
+        truncate_querylogs(30, batch_size=2)
+        self.assertEqual(QueryLog.objects.count(), 2)
+        self.assertIsNone(cache.get(TRUNCATE_CURSOR_CACHE_KEY))
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    def test_truncating_querylogs_with_archive(self):
+        self._make_logs(old=3, recent=1)
+        with tempfile.TemporaryDirectory() as archive_dir:
+            truncate_querylogs(30, batch_size=2, archive_dir=archive_dir)
+            files = os.listdir(archive_dir)
+            self.assertEqual(len(files), 1)
+            with gzip.open(os.path.join(archive_dir, files[0]), "rt") as f:
+                archived = [json.loads(line) for line in f]
+        self.assertEqual([row["sql"] for row in archived], ["select 0", "select 1", "select 2"])
+        self.assertEqual(list(QueryLog.objects.values_list("sql", flat=True)), ["select 3"])
+
 
 class RemoveUnusedSQLiteDBsTestCase(TestCase):
 
@@ -126,3 +253,63 @@ class RemoveUnusedSQLiteDBsTestCase(TestCase):
         os.remove(dbc.local_name)
         dbc.delete()
         ql.delete()
+
+
+class TestBuildAsyncSchemas(TestCase):
+
+    databases = ["default", "alt"]
+
+    def setUp(self):
+        cache.clear()
+
+    @unittest.skipIf(not app_settings.ENABLE_TASKS, "tasks not enabled")
+    def test_schemas_are_built_by_subtasks(self):
+        connections = list(DatabaseConnection.objects.non_uploads())
+        self.assertEqual(build_async_schemas(concurrency=2), len(connections))
+        for c in connections:
+            self.assertIsNotNone(cache.get(connection_schema_cache_key(c.id)))
+
+    @patch("explorer.app_settings.ENABLE_TASKS", False)
+    @patch("explorer.schema.build_schema_info")
+    def test_schemas_are_built_in_a_thread_pool(self, mocked_build):
+        for i in range(6):
+            DatabaseConnection.objects.create(
+                alias=f"warm{i}", name=f"warm{i}", engine="django.db.backends.postgresql"
+            )
+        lock = threading.Lock()
+        running = []
+        most_running = []
+
+        def build(db_connection):
+            with lock:
+                running.append(db_connection.id)
+                most_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(db_connection.id)
+            return [("table", [("id", "IntegerField")])] * db_connection.id
+
+        mocked_build.side_effect = build
+        reports = build_async_schemas(concurrency=2)
+        connections = list(DatabaseConnection.objects.non_uploads())
+        self.assertEqual([r["connection"] for r in reports], [c.id for c in connections])
+        self.assertTrue(all(r["status"] == SCHEMA_READY for r in reports))
+        self.assertEqual([r["tables"] for r in reports], [c.id for c in connections])
+        self.assertLessEqual(max(most_running), 2)
+
+    @patch("explorer.app_settings.ENABLE_TASKS", False)
+    @patch("explorer.schema.build_schema_info")
+    def test_slow_schemas_are_reported_and_skipped(self, mocked_build):
+        slow = DatabaseConnection.objects.create(alias="slow", name="slow", engine="django.db.backends.postgresql")
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def build(db_connection):
+            if db_connection.id == slow.id:
+                release.wait(5)
+            return []
+
+        mocked_build.side_effect = build
+        reports = {r["connection"]: r for r in build_async_schemas(concurrency=4, time_budget=0.2)}
+        self.assertEqual(reports[slow.id]["status"], SCHEMA_TIMED_OUT)
+        self.assertTrue(all(r["status"] == SCHEMA_READY for c, r in reports.items() if c != slow.id))
@@ -1,12 +1,21 @@
-from unittest.mock import Mock
+import gzip
+import random
+from io import BytesIO
+from unittest.mock import Mock, patch
 
+import sqlparse
+from sqlparse.sql import TokenList
+from sqlparse.tokens import Keyword
+
+from django.db import connection
 from django.test import TestCase
 
 from explorer import app_settings
 from explorer.tests.factories import SimpleQueryFactory
 from explorer.utils import (
     EXPLORER_PARAM_TOKEN, extract_params, get_params_for_url, get_params_from_request, param, passes_blacklist,
-    shared_dict_update, swap_params, secure_filename
+    shared_dict_update, swap_params, secure_filename, bind_params, param_template, sql_keywords, walk_tokens,
+    cache_by_sql_hash, s3_csv_upload, chunk_reader
 )
 
 
@@ -182,6 +191,89 @@ class TestSqlBlacklist(TestCase):
         passes, words = passes_blacklist(sql)
         self.assertFalse(passes)
 
+    def test_blacklist_setting_changes_are_honored_for_cached_sql(self):
+        sql = "DELETE FROM some_table;"
+        self.assertFalse(passes_blacklist(sql)[0])
+        app_settings.EXPLORER_SQL_BLACKLIST = []
+        self.assertTrue(passes_blacklist(sql)[0])
+
+
+def _parsed_keywords(sql):
+    # The original implementation: fully parse and group every statement, then walk the tree.
+    keywords = set()
+    for sql_string in sqlparse.split(sql):
+        for statement in sqlparse.parse(sql_string):
+            for token in walk_tokens(statement):
+                if not token.is_whitespace and not isinstance(token, TokenList) and token.ttype in Keyword:
+                    keywords.add(str(token.value).upper())
+    return keywords
+
+
+class TestSqlKeywords(TestCase):
+
+    vocabulary = [
+        "select", "SELECT", "delete", "from", "t", "where", "a", "=", "1", "'x'", "'it''s'", '"col"', "(", ")", ";",
+        ",", "--c\n", "/*c*/", "case", "when", "then", "else", "end", "insert", "into", "values", "update", "set",
+        "drop", "table", "create", "as", "$$p$$", "begin", "commit", "merge", "replace(a,b)", "grant", "revoke",
+        "on", "truncate", "rename", "alter", "`x`", "[x]", "::int", "$tag$ drop $tag$", "\n", "x.delete",
+        "deleted_at", "create_date", "select*from", "%s", "union", "all", "with", "over", "partition", "by", "order",
+        "limit", "null", "is", "not", "and", "or", "in", "like", "CREATE", "OR", "REPLACE", "VIEW",
+    ]
+
+    def test_matches_full_parse(self):
+        rng = random.Random(1234)
+        for _ in range(2000):
+            words = [rng.choice(self.vocabulary) for _ in range(rng.randint(1, 25))]
+            sql = rng.choice([" ", "", "\n"]).join(words)
+            self.assertEqual(sql_keywords(sql), _parsed_keywords(sql), sql)
+
+    def test_matches_full_parse_for_blacklist_cases(self):
+        for sql in [
+            "SELECT 1+1 AS TWO; DROP TABLE foo;",
+            'SELECT 1 AS "DELETE" FROM foo /* DROP */ -- UPDATE',
+            "select case when deleted_at is null then 'insert' else 'x' end from t",
+            "WITH a AS (SELECT 1) MERGE INTO t USING a ON true WHEN MATCHED THEN DELETE",
+            "CREATE OR REPLACE VIEW v AS SELECT 1",
+            "REVOKE ON kinds; FROM manuel;",
+        ]:
+            self.assertEqual(sql_keywords(sql), _parsed_keywords(sql), sql)
+
+
+class TestCacheBySqlHash(TestCase):
+
+    def cached_len(self, **kwargs):
+        calls = []
+
+        @cache_by_sql_hash(**kwargs)
+        def f(sql):
+            calls.append(sql)
+            return len(sql)
+        return f, calls
+
+    def test_results_are_cached(self):
+        f, calls = self.cached_len()
+        self.assertEqual((f("select 1"), f("select 1"), f("select 22")), (8, 8, 9))
+        self.assertEqual(calls, ["select 1", "select 22"])
+
+    def test_least_recently_used_are_evicted(self):
+        f, calls = self.cached_len(maxsize=2)
+        for sql in ["a", "b", "a", "c", "a", "b"]:
+            f(sql)
+        self.assertEqual(calls, ["a", "b", "c", "b"])
+        self.assertEqual(f.cache_len(), 2)
+
+    def test_size_is_bounded_by_bytes(self):
+        f, calls = self.cached_len(max_bytes=10)
+        f("x" * 6)
+        f("y" * 6)
+        f("x" * 6)
+        self.assertEqual(len(calls), 3)
+        # Too big to be cached at all
+        f("z" * 11)
+        f("z" * 11)
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(f.cache_len(), 1)
+
 
 class TestParams(TestCase):
 
@@ -209,6 +301,44 @@ class TestParams(TestCase):
         got = swap_params(sql, params)
         self.assertEqual(got, expected)
 
+    def test_params_are_swapped_in_one_pass(self):
+        # A value that looks like a parameter is not substituted again
+        sql = "select $$a$$, $$b$$"
+        self.assertEqual(swap_params(sql, {"a": "$$b$$", "b": "x"}), "select $$b$$, x")
+
+    def test_unknown_params_are_left_alone(self):
+        sql = "select $$a$$, $$b:2$$"
+        self.assertEqual(swap_params(sql, {"a": 1, "c": 3}), "select 1, $$b:2$$")
+
+    def test_templates_are_cached(self):
+        sql = "select $$a:1$$"
+        self.assertIs(param_template(sql), param_template(sql))
+        extract_params(sql)["a"]["default"] = "changed"
+        self.assertEqual(extract_params(sql), {"a": {"default": "1", "label": ""}})
+
+    def test_bind_params(self):
+        sql = "select * from t where a = '$$a$$' and b = $$B|Label:2$$ and c like 'x%' and d = $$d$$"
+        self.assertEqual(
+            bind_params(sql, {"a": "O'Brien", "b": 3}),
+            ("select * from t where a = %s and b = %s and c like 'x%%' and d = $$d$$", ["O'Brien", 3])
+        )
+
+    def test_bind_params_inside_literals_and_comments(self):
+        sql = "select * from t where a like '%$$q$$%' -- $$q$$\nand b = $$q$$ /* $$c$$ */"
+        self.assertEqual(
+            bind_params(sql, {"q": "it's\n", "c": "*/ drop"}),
+            ("select * from t where a like '%%it''s\n%%' -- it's \nand b = %s /* * / drop */", ["it's\n"])
+        )
+
+    def test_bound_params_inside_literals_run(self):
+        sql, bound = bind_params("select 'abc' like '%$$q$$%', 'x' || $$q$$", {"q": "b"})
+        with connection.cursor() as cursor:
+            cursor.execute(sql, bound)
+            self.assertEqual(cursor.fetchone(), (1, "xb"))
+
+    def test_bind_params_without_params(self):
+        self.assertEqual(bind_params("select '$$a$$'", None), ("select '$$a$$'", []))
+
     def _assertSwap(self, tuple):
         self.assertEqual(extract_params(tuple[0]), tuple[1])
 
@@ -292,3 +422,63 @@ class TestSecureFilename(TestCase):
 
     def test_spaces(self):
         self.assertEqual(secure_filename("file name.txt"), "file_name.txt")
+
+
+@patch("explorer.utils.s3_url", lambda bucket, key: f"https://s3/{key}")
+@patch("explorer.utils.get_s3_bucket")
+class TestS3CsvUpload(TestCase):
+
+    def upload_args(self, mocked_bucket):
+        (data, key), kwargs = mocked_bucket.return_value.upload_fileobj.call_args
+        return data, key, kwargs
+
+    def test_upload(self, mocked_bucket):
+        url = s3_csv_upload("snap.csv", BytesIO(b"a\r\n1\r\n"))
+        data, key, kwargs = self.upload_args(mocked_bucket)
+        self.assertEqual((url, key, data.read()), ("https://s3/snap.csv", "snap.csv", b"a\r\n1\r\n"))
+        self.assertEqual(kwargs["ExtraArgs"], {"ContentType": "text/csv"})
+
+    def test_compressed_upload(self, mocked_bucket):
+        url = s3_csv_upload("snap.csv", BytesIO(b"a\r\n1\r\n"), "gzip")
+        data, key, kwargs = self.upload_args(mocked_bucket)
+        self.assertEqual((url, key), ("https://s3/snap.csv.gz", "snap.csv.gz"))
+        self.assertEqual(gzip.decompress(data.read()), b"a\r\n1\r\n")
+        self.assertEqual(kwargs["ExtraArgs"], {"ContentType": "application/gzip"})
+
+    def test_streamed_upload(self, mocked_bucket):
+        chunks = iter(["\ufeffa,b\r\n", "Jenét,2\r\n"])
+        s3_csv_upload("snap.csv", chunks)
+        data, key, kwargs = self.upload_args(mocked_bucket)
+        self.assertEqual(data.read().decode("utf-8-sig"), "a,b\r\nJenét,2\r\n")
+
+    def test_streamed_compressed_upload(self, mocked_bucket):
+        s3_csv_upload("snap.csv", iter(["a,b\r\n", "1,2\r\n"]), "gzip")
+        data, key, kwargs = self.upload_args(mocked_bucket)
+        self.assertEqual(gzip.decompress(data.read()), b"a,b\r\n1,2\r\n")
+
+    def test_transfer_config(self, mocked_bucket):
+        with patch.object(app_settings, "EXPLORER_S3_MULTIPART_CHUNK_SIZE", 5 * 1024 * 1024), \
+                patch.object(app_settings, "EXPLORER_S3_UPLOAD_CONCURRENCY", 2):
+            s3_csv_upload("snap.csv", iter(["a\r\n"]))
+        config = self.upload_args(mocked_bucket)[2]["Config"]
+        self.assertEqual((config.multipart_chunksize, config.max_concurrency), (5 * 1024 * 1024, 2))
+
+
+class TestChunkReader(TestCase):
+
+    def test_reads_fill_up(self):
+        # Each read but the last returns as many bytes as asked for, however the chunks are split
+        reader = chunk_reader(iter(["ab", b"c", "", "déf", b"g" * 10]))
+        self.assertEqual([reader.read(4), reader.read(4), reader.read(4), reader.read(4), reader.read(4)],
+                         [b"abcd", "éfg".encode(), b"gggg", b"gggg", b"g"])
+        self.assertEqual(reader.read(4), b"")
+
+    def test_consumes_lazily(self):
+        def chunks():
+            for i in range(1000):
+                consumed.append(i)
+                yield "x" * 100
+        consumed = []
+        reader = chunk_reader(chunks())
+        reader.read(250)
+        self.assertLess(len(consumed), 1000)
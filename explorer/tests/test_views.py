@@ -1,3 +1,4 @@
+import gzip
 import importlib
 import json
 import time
@@ -9,10 +10,11 @@ from unittest import skipIf
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.db import DatabaseError
+from django.db import DatabaseError, connection
 from django.forms.models import model_to_dict
 from django.shortcuts import redirect
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from explorer import app_settings
@@ -22,7 +24,7 @@ from explorer.models import MSG_FAILED_BLACKLIST, Query, QueryFavorite, QueryLog
 from explorer.tests.factories import QueryLogFactory, SimpleQueryFactory
 from explorer.utils import user_can_see_query
 from explorer.ee.db_connections.utils import default_db_connection
-from explorer.schema import connection_schema_cache_key, connection_schema_json_cache_key
+from explorer.schema import clear_schema_cache, connection_schema_cache_key
 from explorer.assistant.models import TableDescription
 
 
@@ -34,6 +36,13 @@ def reload_app_settings():
     importlib.reload(app_settings)
 
 
+def query_form_data(query):
+    """
+    Form data for posting a query, leaving out unset optional fields (as a browser would)
+    """
+    return {k: v for k, v in model_to_dict(query).items() if v is not None}
+
+
 class TestQueryListView(TestCase):
 
     def setUp(self):
@@ -72,10 +81,46 @@ class TestQueryListView(TestCase):
     def test_run_count(self):
         q = SimpleQueryFactory(title="foo - bar1")
         for _ in range(0, 4):
-            q.log()
+            q.log().finish(duration=1)
         resp = self.client.get(reverse("explorer_index"))
         self.assertContains(resp, "4</td>")
 
+    def _index_query_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("explorer_index"))
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_queries(self):
+        conn = default_db_connection()
+        for i in range(2):
+            SimpleQueryFactory(title=f"foo - {i}", created_by_user=self.user, database_connection=conn).log()
+        baseline = self._index_query_count()
+
+        for i in range(2, 12):
+            q = SimpleQueryFactory(title=f"foo - {i}", created_by_user=self.user, database_connection=conn)
+            q.log()
+            q.log()
+        SimpleQueryFactory(title="never run")
+        with self.assertNumQueries(baseline):
+            self.client.get(reverse("explorer_index"))
+
+    def test_last_run_details(self):
+        q = SimpleQueryFactory(title="foo", sql="select 1")
+        q.execute_with_logging(None)
+        q.sql = "error"
+        with self.assertRaises(DatabaseError):
+            q.execute_with_logging(None)
+        never_run = SimpleQueryFactory(title="bar")
+
+        resp = self.client.get(reverse("explorer_index"))
+        rows = {row["title"]: row for row in resp.context["object_list"]}
+        self.assertEqual(rows["foo"]["run_count"], 2)
+        self.assertFalse(rows["foo"]["ran_successfully"])
+        self.assertEqual(rows["foo"]["last_run_at"], QueryLog.objects.filter(query=q).first().run_at)
+        self.assertEqual(rows["bar"]["run_count"], 0)
+        self.assertTrue(rows["bar"]["ran_successfully"])
+        self.assertEqual(rows["bar"]["last_run_at"], never_run.created_at)
+
 
 class TestQueryCreateView(TestCase):
 
@@ -132,7 +177,7 @@ class TestQueryDetailView(TestCase):
     def test_posting_query_saves_correctly(self):
         expected = "select 2;"
         query = SimpleQueryFactory(sql="select 1;")
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data["sql"] = expected
         self.client.post(
             reverse("query_detail", kwargs={"query_id": query.id}),
@@ -184,6 +229,54 @@ class TestQueryDetailView(TestCase):
         self.assertTemplateUsed(resp, "explorer/query.html")
         self.assertNotContains(resp, "6872")
 
+    @patch("explorer.app_settings.EXPLORER_ROW_LIMIT_PUSHDOWN", True)
+    def test_row_limit_pushdown(self):
+        query = SimpleQueryFactory(sql="select 1 union all select 2 union all select 3;")
+        url = reverse("query_detail", kwargs={"query_id": query.id})
+        resp = self.client.get(url + "?rows=2")
+        self.assertEqual(len(resp.context["data"]), 2)
+        self.assertIsNone(resp.context["total_rows"])
+        self.assertContains(resp, "of more than 2 rows.")
+        self.assertContains(resp, "count=1")
+
+        resp = self.client.get(url + "?rows=2&count=1")
+        self.assertEqual(len(resp.context["data"]), 2)
+        self.assertEqual(resp.context["total_rows"], 3)
+        self.assertContains(resp, "of 3 total rows.")
+
+    @patch("explorer.app_settings.EXPLORER_ROW_LIMIT_PUSHDOWN", True)
+    def test_row_limit_pushdown_with_all_rows_fetched(self):
+        query = SimpleQueryFactory(sql="select 1 union all select 2;")
+        resp = self.client.get(reverse("query_detail", kwargs={"query_id": query.id}) + "?rows=2")
+        self.assertEqual(resp.context["total_rows"], 2)
+        self.assertNotContains(resp, "Count total rows")
+
+    @patch("explorer.app_settings.EXPLORER_COLUMNAR_RESULTS", True)
+    def test_columnar_results(self):
+        query = SimpleQueryFactory(sql="select 'a' as label, 6870 as n union all select 'b', 3;")
+        resp = self.client.get(reverse("query_detail", kwargs={"query_id": query.id}))
+        self.assertEqual(resp.context["data"], [["a", 6870], ["b", 3]])
+        self.assertContains(resp, "6870")
+        self.assertEqual(resp.context["total_rows"], 2)
+
+    def test_cached_results(self):
+        cache.clear()
+        query = SimpleQueryFactory(sql="select 1;", cache_ttl=60)
+        url = reverse("query_detail", kwargs={"query_id": query.id})
+        resp = self.client.get(url)
+        self.assertIsNone(resp.context["cache_age"])
+        self.assertNotContains(resp, "served from cache")
+
+        resp = self.client.get(url)
+        self.assertIsNotNone(resp.context["cache_age"])
+        self.assertContains(resp, "served from cache")
+        self.assertContains(resp, "refresh=1")
+        self.assertEqual(QueryLog.objects.count(), 1)
+
+        resp = self.client.get(url + "?refresh=1")
+        self.assertIsNone(resp.context["cache_age"])
+        self.assertEqual(QueryLog.objects.count(), 2)
+
     def test_doesnt_render_results_if_params_and_no_autorun(self):
         with self.settings(EXPLORER_AUTORUN_QUERY_WITH_PARAMS=False):
             reload_app_settings()
@@ -435,11 +528,115 @@ class TestDownloadView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["content-type"], "application/json")
 
-        json_data = json.loads(response.content.decode("utf-8"))
+        json_data = json.loads(b"".join(response.streaming_content).decode("utf-8"))
         self.assertIsInstance(json_data, list)
         self.assertEqual(len(json_data), 1)
         self.assertEqual(json_data, [{"TWO": 2}])
 
+    def test_download_is_streamed(self):
+        query = SimpleQueryFactory(sql="select 1 as a union all select 2")
+        url = reverse("download_query", args=[query.pk]) + "?format=csv"
+
+        response = self.client.get(url)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content).decode("utf-8-sig"), "a\r\n1\r\n2\r\n")
+
+    def test_download_fails_on_an_error_mid_stream(self):
+        def failing_stream(exporter, res, **kwargs):
+            yield "a\r\n1\r\n"
+            raise DatabaseError("connection lost")
+
+        query = SimpleQueryFactory(sql="select 1 as a union all select 2")
+        stream = patch("explorer.exporters.CSVExporter._get_output_stream", failing_stream)
+        for params in ("?format=csv", "?format=csv&compression=gzip"):
+            with self.subTest(params=params), stream:
+                response = self.client.get(reverse("download_query", args=[query.pk]) + params)
+                with self.assertRaises(DatabaseError), self.assertLogs("explorer.views.export", "ERROR"):
+                    b"".join(response.streaming_content)
+
+    @patch("explorer.app_settings.EXPLORER_STREAMING_EXPORTS", False)
+    def test_download_without_streaming(self):
+        query = SimpleQueryFactory(sql="select 1 as a union all select 2")
+        url = reverse("download_query", args=[query.pk]) + "?format=csv"
+
+        response = self.client.get(url)
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content.decode("utf-8-sig"), "a\r\n1\r\n2\r\n")
+
+    def test_download_compressed(self):
+        query = SimpleQueryFactory(sql="select 1 as a union all select 2", title="two rows")
+        url = reverse("download_query", args=[query.pk]) + "?format=csv&compression=gzip"
+
+        response = self.client.get(url)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["content-type"], "application/gzip")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="two_rows.csv.gz"')
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(content.decode("utf-8-sig"), "a\r\n1\r\n2\r\n")
+
+    @patch("explorer.app_settings.EXPLORER_STREAMING_EXPORTS", False)
+    @patch("explorer.app_settings.EXPLORER_EXPORT_COMPRESSION", {"csv": "gzip"})
+    def test_download_compressed_by_default(self):
+        query = SimpleQueryFactory(sql="select 1 as a union all select 2")
+        url = reverse("download_query", args=[query.pk]) + "?format=csv"
+
+        response = self.client.get(url)
+
+        self.assertEqual(gzip.decompress(response.content).decode("utf-8-sig"), "a\r\n1\r\n2\r\n")
+        response = self.client.get(url + "&compression=none")
+        self.assertEqual(response["content-type"], "text/csv")
+
+    def test_download_unknown_compression(self):
+        url = reverse("download_query", args=[self.query.pk]) + "?compression=rar"
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCancelQueryView(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            "admin", "admin@admin.com", "pwd"
+        )
+        self.client.login(username="admin", password="pwd")
+
+    @patch("explorer.models.cancel_backend", return_value=True)
+    def test_cancels_running_query(self, mocked_cancel):
+        ql = QueryLogFactory(backend_pid=42)
+        resp = self.client.post(reverse("cancel_query", args=[ql.id]))
+        self.assertEqual(json.loads(resp.content.decode("utf-8")), {"cancelled": True})
+        self.assertEqual(mocked_cancel.call_args[0][1], 42)
+
+    @patch("explorer.models.cancel_backend", return_value=True)
+    def test_finished_query_is_not_cancelled(self, mocked_cancel):
+        ql = QueryLogFactory(backend_pid=42, duration=10)
+        resp = self.client.post(reverse("cancel_query", args=[ql.id]))
+        self.assertEqual(json.loads(resp.content.decode("utf-8")), {"cancelled": False})
+        mocked_cancel.assert_not_called()
+
+    @patch("explorer.models.cancel_backend", return_value=True)
+    def test_redirects_to_next(self, mocked_cancel):
+        ql = QueryLogFactory(backend_pid=42)
+        resp = self.client.post(reverse("cancel_query", args=[ql.id]), {"next": reverse("explorer_logs")})
+        self.assertRedirects(resp, reverse("explorer_logs"))
+
+    def test_unsupported_backend(self):
+        ql = QueryLogFactory(backend_pid=42)
+        resp = self.client.post(reverse("cancel_query", args=[ql.id]))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_can_only_cancel_own_queries_without_change_permission(self):
+        other = User.objects.create_user("other", "other@other.com", "pwd")
+        ql = QueryLogFactory(backend_pid=42, run_by_user=other)
+        with patch("explorer.app_settings.EXPLORER_PERMISSION_CHANGE", lambda r: False):
+            resp = self.client.post(reverse("cancel_query", args=[ql.id]))
+        self.assertEqual(resp.status_code, 403)
+
 
 class TestQueryPlayground(TestCase):
 
@@ -618,7 +815,7 @@ class TestSQLDownloadViews(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["content-type"], "text/csv")
-        self.assertEqual(response.content.decode("utf-8-sig"), "1|2\r\n1|2\r\n")
+        self.assertEqual(b"".join(response.streaming_content).decode("utf-8-sig"), "1|2\r\n1|2\r\n")
 
     def test_sql_download_csv_with_tab_delim(self):
         url = reverse("download_sql") + "?format=csv&delim=tab"
@@ -627,7 +824,7 @@ class TestSQLDownloadViews(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["content-type"], "text/csv")
-        self.assertEqual(response.content.decode("utf-8-sig"), "1\t2\r\n1\t2\r\n")
+        self.assertEqual(b"".join(response.streaming_content).decode("utf-8-sig"), "1\t2\r\n1\t2\r\n")
 
     def test_sql_download_csv_with_bad_delim(self):
         url = reverse("download_sql") + "?format=csv&delim=foo"
@@ -636,7 +833,7 @@ class TestSQLDownloadViews(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["content-type"], "text/csv")
-        self.assertEqual(response.content.decode("utf-8-sig"), "1,2\r\n1,2\r\n")
+        self.assertEqual(b"".join(response.streaming_content).decode("utf-8-sig"), "1,2\r\n1,2\r\n")
 
     def test_sql_download_json(self):
         url = reverse("download_sql") + "?format=json"
@@ -670,6 +867,38 @@ class TestSchemaView(TestCase):
         self.assertContains(resp, "explorer_query")
         self.assertEqual(resp.headers["Content-Type"], "application/json")
 
+    def test_schema_json_not_modified(self):
+        url = reverse("explorer_schema_json", kwargs={"connection": default_db_connection().id})
+        resp = self.client.get(url)
+        etag = resp.headers["ETag"]
+        resp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b"")
+
+        # Rebuilding an unchanged schema keeps its ETag
+        clear_schema_cache(default_db_connection())
+        resp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(url, headers={"If-None-Match": '"other"'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "explorer_query")
+
+    @patch("explorer.app_settings.EXPLORER_SCHEMA_BUILD_IN_BACKGROUND", True)
+    @patch("explorer.schema._run_in_background")
+    def test_schema_being_built(self, mocked_background):
+        resp = self.client.get(
+            reverse("explorer_schema", kwargs={"connection": default_db_connection().id})
+        )
+        self.assertTemplateUsed(resp, "explorer/schema_building.html")
+        self.assertEqual(mocked_background.call_count, 1)
+        resp = self.client.get(
+            reverse("explorer_schema_json", kwargs={"connection": default_db_connection().id})
+        )
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json(), {"status": "building"})
+        self.assertEqual(mocked_background.call_count, 1)
+
     def test_returns_404_if_conn_doesnt_exist(self):
         resp = self.client.get(
             reverse("explorer_schema", kwargs={"connection": "bananas"})
@@ -721,7 +950,7 @@ class TestParamsInViews(TestCase):
 
     def test_saving_non_executing_query_with__wrong_url_params_works(self):
         q = SimpleQueryFactory(sql="select $$swap$$;")
-        data = model_to_dict(q)
+        data = query_form_data(q)
         url = "{}?params={}".format(
             reverse("query_detail", kwargs={"query_id": q.id}),
             "foo:123"
@@ -749,8 +978,8 @@ class TestCreatedBy(TestCase):
         )
         self.client.login(username="admin", password="pwd")
         self.query = SimpleQueryFactory.build(created_by_user=self.user)
-        self.data = model_to_dict(self.query)
-        del self.data["id"]
+        self.data = query_form_data(self.query)
+        self.data.pop("id", None)
         self.data["created_by_user_id"] = self.user2.id
 
     def test_query_update_doesnt_change_created_user(self):
@@ -785,12 +1014,12 @@ class TestQueryLog(TestCase):
     # Since it will be saved on the initial query creation, no need to log it
     def test_creating_query_does_not_save_to_log(self):
         query = SimpleQueryFactory()
-        self.client.post(reverse("query_create"), model_to_dict(query))
+        self.client.post(reverse("query_create"), query_form_data(query))
         self.assertEqual(0, QueryLog.objects.count())
 
     def test_query_saves_to_log(self):
         query = SimpleQueryFactory()
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data["sql"] = "select 12345;"
         self.client.post(
             reverse("query_detail", kwargs={"query_id": query.id}),
@@ -800,7 +1029,7 @@ class TestQueryLog(TestCase):
 
     def test_query_gets_logged_and_appears_on_log_page(self):
         query = SimpleQueryFactory()
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data["sql"] = "select 12345;"
         self.client.post(
             reverse("query_detail", kwargs={"query_id": query.id}),
@@ -1090,9 +1319,7 @@ class TestDatabaseConnectionRefreshView(TestCase):
             host="foo"
         )
         self.k = connection_schema_cache_key(self.dbc.id)
-        self.kj = connection_schema_json_cache_key(self.dbc.id)
         cache.set(self.k, "foo")
-        cache.set(self.kj, "foo")
 
     def test_refresh_connection(self):
         # Create a file on disk
@@ -1114,7 +1341,6 @@ class TestDatabaseConnectionRefreshView(TestCase):
 
         # Assert that the cache keys are clear
         self.assertIsNone(cache.get(self.k))
-        self.assertIsNone(cache.get(self.kj))
 
     def tearDown(self):
         # Clean up any files that might have been created
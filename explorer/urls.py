@@ -2,9 +2,9 @@ from django.urls import path
 
 from explorer.ee.urls import ee_urls
 from explorer.views import (
-    CreateQueryView, DeleteQueryView, DownloadFromSqlView, DownloadQueryView, EmailCsvQueryView, ListQueryLogView,
-    ListQueryView, PlayQueryView, QueryFavoritesView, QueryFavoriteView, QueryView, SchemaJsonView, SchemaView,
-    StreamQueryView, format_sql
+    CancelQueryView, CreateQueryView, DeleteQueryView, DownloadFromSqlView, DownloadQueryView, EmailCsvQueryView,
+    ListQueryLogView, ListQueryView, PlayQueryView, QueryFavoritesView, QueryFavoriteView, QueryView, SchemaJsonView,
+    SchemaView, StreamQueryView, format_sql
 )
 from explorer.assistant.urls import assistant_urls
 
@@ -39,6 +39,7 @@ urlpatterns = [
         name="explorer_schema_json"
     ),
     path("logs/", ListQueryLogView.as_view(), name="explorer_logs"),
+    path("logs/<int:querylog_id>/cancel", CancelQueryView.as_view(), name="cancel_query"),
     path("format/", format_sql, name="format_sql"),
     path("favorites/", QueryFavoritesView.as_view(), name="query_favorites"),
     path("favorite/<int:query_id>", QueryFavoriteView.as_view(), name="query_favorite"),
@@ -1,35 +1,33 @@
+from __future__ import annotations
+
+import hashlib
+import io
 import re
 import os
+import threading
 import unicodedata
-from collections import deque
-from typing import Iterable, Tuple
+from collections import OrderedDict, deque, namedtuple
+from functools import partial, wraps
+from typing import Iterable
 
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.views import LoginView
 
-import sqlparse
 from sqlparse import format as sql_format
+from sqlparse.lexer import tokenize
 from sqlparse.sql import Token, TokenList
 from sqlparse.tokens import Keyword
 
 from explorer import app_settings
+from explorer.compression import compress_stream, compressed_content_type, compressed_filename
 
 
 EXPLORER_PARAM_TOKEN = "$$"
 
 
-def passes_blacklist(sql: str) -> Tuple[bool, Iterable[str]]:
-    sql_strings = sqlparse.split(sql)
-    keyword_tokens = set()
-    for sql_string in sql_strings:
-        statements = sqlparse.parse(sql_string)
-        for statement in statements:
-            for token in walk_tokens(statement):
-                if not token.is_whitespace and not isinstance(token, TokenList):
-                    if token.ttype in Keyword:
-                        keyword_tokens.add(str(token.value).upper())
-
+def passes_blacklist(sql: str) -> tuple[bool, Iterable[str]]:
+    keyword_tokens = sql_keywords(sql)
     fails = [
         bl_word
         for bl_word in app_settings.EXPLORER_SQL_BLACKLIST
@@ -39,6 +37,58 @@ def passes_blacklist(sql: str) -> Tuple[bool, Iterable[str]]:
     return not bool(fails), fails
 
 
+def cache_by_sql_hash(maxsize=256, max_bytes=16 * 1024 * 1024):
+    """
+    An LRU cache for functions of a single SQL string, keyed by the SQL's SHA-256 rather than by the SQL itself, and
+    limited both to maxsize entries and to max_bytes of SQL (which bounds the size of results, like parsed templates,
+    that grow with the SQL). SQL longer than max_bytes isn't cached at all.
+    """
+    def decorator(f):
+        entries = OrderedDict()  # digest -> (result, size)
+        lock = threading.Lock()
+        total = 0
+
+        @wraps(f)
+        def cached(sql):
+            nonlocal total
+            digest = hashlib.sha256(sql.encode("utf-8")).digest()
+            with lock:
+                if digest in entries:
+                    entries.move_to_end(digest)
+                    return entries[digest][0]
+            result = f(sql)
+            size = len(sql)
+            if size > max_bytes:
+                return result
+            with lock:
+                if digest not in entries:
+                    entries[digest] = (result, size)
+                    total += size
+                while len(entries) > maxsize or total > max_bytes:
+                    total -= entries.popitem(last=False)[1][1]
+            return result
+
+        def cache_clear():
+            nonlocal total
+            with lock:
+                entries.clear()
+                total = 0
+
+        cached.cache_clear = cache_clear
+        cached.cache_len = lambda: len(entries)
+        return cached
+    return decorator
+
+
+@cache_by_sql_hash()
+def sql_keywords(sql: str) -> frozenset[str]:
+    """
+    The upper-cased keywords in sql. Only the lexer is run, as grouping never changes a token's type, and the result is
+    cached (independently of EXPLORER_SQL_BLACKLIST) so that checking the same SQL again is free.
+    """
+    return frozenset(value.upper() for ttype, value in tokenize(sql) if ttype in Keyword)
+
+
 def walk_tokens(token: TokenList) -> Iterable[Token]:
     """
     Generator to walk all tokens in a Statement
@@ -61,25 +111,119 @@ def param(name):
     return f"{EXPLORER_PARAM_TOKEN}{name}{EXPLORER_PARAM_TOKEN}"
 
 
+PARAM_REGEX = re.compile(r"\$\$([a-z0-9_]+)(?:\|([^\$\:]+))?(?:\:([^\$]+))?\$\$", re.IGNORECASE)
+
+# "context" is where the token is: None in SQL code, or inside a string literal ("'") or a comment ("--" or "/*")
+ParamToken = namedtuple("ParamToken", ["name", "label", "default", "text", "quoted", "context"])
+
+SQL_CONTEXT_REGEX = re.compile(r"'|--|/\*|\*/|\n")
+
+
+def _sql_context(text, context=None):
+    """
+    :return: Whether the end of text is in SQL code (None), a string literal or a comment, given where it starts
+    """
+    for m in SQL_CONTEXT_REGEX.finditer(text):
+        mark = m.group(0)
+        if context is None and mark in ("'", "--", "/*"):
+            context = mark
+        elif (context, mark) in (("'", "'"), ("--", "\n"), ("/*", "*/")):
+            context = None
+    return context
+
+
+def _inline_value(value, context):
+    # Keeps a value that is substituted into a literal or comment from ending it early
+    value = str(value)
+    if context == "'":
+        return value.replace("'", "''")
+    if context == "--":
+        return value.replace("\n", " ").replace("\r", " ")
+    return value.replace("*/", "* /")
+
+
+class ParamTemplate:
+    """
+    SQL split into literal text and $$name|label:default$$ parameter tokens, so that the parameters can be listed and
+    filled in without scanning the SQL again. Get one with param_template(), which caches them.
+    """
+
+    def __init__(self, sql):
+        self.parts = []
+        self.params = {}
+        pos = 0
+        context = None
+        for m in PARAM_REGEX.finditer(sql):
+            name, label, default = m.groups()
+            # A token written as '$$name$$' is a quoted string; when binding, the value replaces the quotes too
+            quoted = sql[m.start() - 1:m.start()] == "'" and sql[m.end():m.end() + 1] == "'"
+            context = _sql_context(sql[pos:m.start()], context)
+            self.parts.append(sql[pos:m.start()])
+            self.parts.append(ParamToken(
+                name.lower(), label or "", default or "", m.group(0), quoted, None if quoted else context
+            ))
+            # If a parameter appears more than once, the last occurrence's label and default win
+            self.params[name.lower()] = {"label": label or "", "default": default or ""}
+            pos = m.end()
+        self.parts.append(sql[pos:])
+
+    def render(self, params):
+        """
+        :return: The SQL with the given parameters' values substituted in
+        """
+        values = {str(k).lower(): str(v) for k, v in params.items()} if params else {}
+        return "".join(
+            values.get(part.name, part.text) if isinstance(part, ParamToken) else part for part in self.parts
+        )
+
+    def render_bound(self, params):
+        """
+        :return: The SQL with a %s placeholder for each of the given parameters, and the list of values to pass to
+                 cursor.execute() alongside it. Literal % characters are escaped, as the DB-API requires. Parameters
+                 inside a string literal (other than one that is the whole string) or a comment can't be bound, so
+                 their values are substituted in, with quotes doubled inside literals.
+        """
+        values = {str(k).lower(): v for k, v in params.items()} if params else {}
+        sql, bound = [], []
+        for i, part in enumerate(self.parts):
+            if not isinstance(part, ParamToken):
+                # Drop the quotes around quoted tokens that are being bound
+                start = 1 if i > 0 and self._binds(self.parts[i - 1], values) else 0
+                end = -1 if i + 1 < len(self.parts) and self._binds(self.parts[i + 1], values) else None
+                sql.append(part[start:end].replace("%", "%%"))
+            elif part.name in values and part.context:
+                sql.append(_inline_value(values[part.name], part.context).replace("%", "%%"))
+            elif part.name in values:
+                sql.append("%s")
+                bound.append(values[part.name])
+            else:
+                sql.append(part.text.replace("%", "%%"))
+        return "".join(sql), bound
+
+    @staticmethod
+    def _binds(part, values):
+        return isinstance(part, ParamToken) and part.quoted and part.name in values
+
+
+@cache_by_sql_hash()
+def param_template(sql):
+    return ParamTemplate(sql)
+
+
 def swap_params(sql, params):
-    p = params.items() if params else {}
-    for k, v in p:
-        fmt_k = re.escape(str(k).lower())
-        regex = re.compile(rf"\$\${fmt_k}(?:\|([^\$\:]+))?(?:\:([^\$]+))?\$\$", re.I)
-        sql = regex.sub(str(v), sql)
-    return sql
+    return param_template(sql).render(params)
+
+
+def bind_params(sql, params):
+    """
+    Like swap_params, but rather than substituting the values into the SQL, return SQL with placeholders and the values
+    to pass to the database driver separately. See ParamTemplate.render_bound.
+    """
+    return param_template(sql).render_bound(params)
 
 
 def extract_params(text):
-    regex = re.compile(r"\$\$([a-z0-9_]+)(?:\|([^\$\:]+))?(?:\:([^\$]+))?\$\$", re.IGNORECASE)
-    params = re.findall(regex, text)
-    # Matching will result to ('name', 'label', 'default')
-    return {
-        p[0].lower(): {
-            "label": p[1],
-            "default": p[2]
-        } for p in params if len(p) > 1
-    }
+    return {k: dict(v) for k, v in param_template(text).params.items()}
 
 
 def safe_login_prompt(request):
@@ -154,6 +298,14 @@ def url_get_fullscreen(request):
     return bool(get_int_from_request(request, "fullscreen", 0))
 
 
+def url_get_count(request):
+    return bool(get_int_from_request(request, "count", 0))
+
+
+def url_get_refresh(request):
+    return bool(get_int_from_request(request, "refresh", 0))
+
+
 def url_get_params(request):
     return get_params_from_request(request)
 
@@ -216,11 +368,89 @@ def get_s3_bucket():
     return s3.Bucket(name=app_settings.S3_BUCKET)
 
 
-def s3_csv_upload(key, data):
+class ClosingIterator:
+    """
+    An iterator that runs a callback when it is closed, as well as closing the iterator it wraps. Unlike a
+    generator's finally block, the callback also runs if the iterator is closed before it was ever advanced.
+    """
+
+    def __init__(self, iterator, on_close):
+        self._iterator = iter(iterator)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._iterator, "close"):
+                self._iterator.close()
+        finally:
+            self._on_close()
+
+
+class _ChunkReader(io.RawIOBase):
+    # A read-only binary file over an iterator of str (encoded as UTF-8) or bytes chunks
+
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def chunk_reader(chunks):
+    """
+    A binary file that reads from an iterator of str or bytes chunks as it is read. read(n) returns n bytes unless
+    the chunks run out, as boto3 needs of the files it uploads in parts.
+    """
+    return io.BufferedReader(_ChunkReader(chunks))
+
+
+def s3_csv_upload(key, data, compression=None):
+    """
+    Upload a CSV to S3 as a multipart upload, EXPLORER_S3_UPLOAD_CONCURRENCY parts at a time, so only those parts are
+    ever held in memory.
+
+    :param data: A binary file, or an iterator of str or bytes chunks
+    :param compression: Optional. See explorer.compression.
+    :return: A presigned URL of the upload
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    content_type = "text/csv"
+    if compression:
+        key = compressed_filename(key, compression)
+        content_type = compressed_content_type(content_type, compression)
+        if hasattr(data, "read"):
+            data = iter(partial(data.read, app_settings.EXPLORER_S3_MULTIPART_CHUNK_SIZE), b"")
+        data = compress_stream(data, compression)
+    if not hasattr(data, "read"):
+        data = chunk_reader(data)
     if app_settings.S3_DESTINATION:
         key = "/".join([app_settings.S3_DESTINATION, key])
     bucket = get_s3_bucket()
-    bucket.upload_fileobj(data, key, ExtraArgs={"ContentType": "text/csv"})
+    config = TransferConfig(
+        multipart_chunksize=app_settings.EXPLORER_S3_MULTIPART_CHUNK_SIZE,
+        max_concurrency=app_settings.EXPLORER_S3_UPLOAD_CONCURRENCY,
+    )
+    bucket.upload_fileobj(data, key, ExtraArgs={"ContentType": content_type}, Config=config)
     return s3_url(bucket, key)
 
 
@@ -240,6 +470,14 @@ def is_xls_writer_available():
         return False
 
 
+def is_pyarrow_available():
+    try:
+        import pyarrow  # noqa
+        return True
+    except ImportError:
+        return False
+
+
 def secure_filename(filename):
     filename, ext = os.path.splitext(filename)
     if not filename and not ext:
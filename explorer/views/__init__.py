@@ -1,4 +1,5 @@
 from .auth import PermissionRequiredMixin, SafeLoginView
+from .cancel import CancelQueryView
 from .create import CreateQueryView
 from .delete import DeleteQueryView
 from .download import DownloadFromSqlView, DownloadQueryView
@@ -11,6 +12,7 @@ from .schema import SchemaJsonView, SchemaView
 from .stream import StreamQueryView
 
 __all__ = [
+    "CancelQueryView",
     "CreateQueryView",
     "DeleteQueryView",
     "DownloadQueryView",
@@ -0,0 +1,29 @@
+from django.http import HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views import View
+
+from explorer import app_settings
+from explorer.models import QueryLog
+from explorer.views.auth import PermissionRequiredMixin
+
+
+class CancelQueryView(PermissionRequiredMixin, View):
+
+    permission_required = "view_permission"
+
+    def post(self, request, querylog_id, *args, **kwargs):
+        ql = get_object_or_404(QueryLog, pk=querylog_id)
+        if not (app_settings.EXPLORER_PERMISSION_CHANGE(request) or
+                (ql.run_by_user_id and ql.run_by_user_id == request.user.id)):
+            return JsonResponse({"error": "You can only cancel your own queries."}, status=403)
+
+        try:
+            cancelled = ql.cancel()
+        except NotImplementedError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        redirect_to = request.POST.get("next")
+        if redirect_to and url_has_allowed_host_and_scheme(redirect_to, allowed_hosts={request.get_host()}):
+            return HttpResponseRedirect(redirect_to)
+        return JsonResponse({"cancelled": cancelled})
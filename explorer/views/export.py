@@ -1,8 +1,17 @@
+import logging
+
 from django.db import DatabaseError
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
+from explorer import app_settings
+from explorer.compression import (
+    UnsupportedCompression, compress, compress_stream, compressed_content_type, compressed_filename, get_compression,
+)
 from explorer.exporters import get_exporter_class
-from explorer.utils import url_get_params
+from explorer.utils import ClosingIterator, url_get_params
+
+
+logger = logging.getLogger(__name__)
 
 
 def _export(request, query, download=True):
@@ -12,18 +21,44 @@ def _export(request, query, download=True):
     delim = request.GET.get("delim")
     exporter = exporter_class(query)
     try:
-        output = exporter.get_output(delim=delim)
+        compression = get_compression(request.GET.get("compression"), _fmt)
+    except UnsupportedCompression as e:
+        return HttpResponse(str(e), status=400)
+    try:
+        if app_settings.EXPLORER_STREAMING_EXPORTS:
+            output = exporter.get_output_stream(delim=delim)
+        else:
+            output = exporter.get_output(delim=delim)
     except DatabaseError as e:
         msg = f"Error executing query {query.title}: {e}"
         return HttpResponse(
             msg, status=500
         )
 
-    response = HttpResponse(
-        output,
-        content_type=exporter.content_type
-    )
+    content_type = compressed_content_type(exporter.content_type, compression)
+    if app_settings.EXPLORER_STREAMING_EXPORTS:
+        chunks = _log_stream_errors(output, query)
+        # The response closes what it is given, so that has to close the exporter's output too
+        response = StreamingHttpResponse(
+            ClosingIterator(compress_stream(chunks, compression) if compression else chunks, output.close),
+            content_type=content_type
+        )
+    else:
+        response = HttpResponse(
+            compress(output, compression) if compression else output,
+            content_type=content_type
+        )
     if download:
         response["Content-Disposition"] = \
-            f'attachment; filename="{exporter.get_filename()}"'
+            f'attachment; filename="{compressed_filename(exporter.get_filename(), compression)}"'
     return response
+
+
+def _log_stream_errors(output, query):
+    # Once streaming has started the status code has already been sent. Re-raising makes the server abort the
+    # connection, so that the client sees a failed download rather than a complete-looking, truncated file.
+    try:
+        yield from output
+    except DatabaseError as e:
+        logger.error(f"Error streaming results of query {query.title}: {e}")
+        raise
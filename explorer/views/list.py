@@ -44,18 +44,11 @@ class ListQueryView(PermissionRequiredMixin, ExplorerContextMixin, ListView):
         return context
 
     def get_queryset(self):
-        if app_settings.EXPLORER_PERMISSION_VIEW(self.request):
-            qs = (
-                Query.objects.prefetch_related(
-                    "created_by_user", "querylog_set"
-                ).all()
-            )
-        else:
-            qs = (
-                Query.objects.prefetch_related(
-                    "created_by_user", "querylog_set"
-                ).filter(pk__in=allowed_query_pks(self.request.user.id))
-            )
+        # Run history comes from each query's QueryStats rollup, so the page costs the same number of queries no matter
+        # how many queries (or logs) there are.
+        qs = Query.objects.select_related("created_by_user", "database_connection", "stats")
+        if not app_settings.EXPLORER_PERMISSION_VIEW(self.request):
+            qs = qs.filter(pk__in=allowed_query_pks(self.request.user.id))
         return qs
 
     def _build_queries_and_headers(self):
@@ -90,8 +83,9 @@ class ListQueryView(PermissionRequiredMixin, ExplorerContextMixin, ListView):
         pattern = re.compile(r"[\W_]+")
 
         headers = Counter([q.title.split(" - ")[0] for q in self.object_list])
-        query_favorites_for_user = QueryFavorite.objects.filter(user_id=self.request.user.pk).values_list("query_id",
-                                                                                                          flat=True)
+        query_favorites_for_user = set(
+            QueryFavorite.objects.filter(user_id=self.request.user.pk).values_list("query_id", flat=True)
+        )
 
         for q in self.object_list:
             model_dict = model_to_dict(q)
@@ -108,16 +102,18 @@ class ListQueryView(PermissionRequiredMixin, ExplorerContextMixin, ListView):
                 })
                 rendered_headers.append(header)
 
-            lrl = q.last_run_log()
+            stats = q.get_stats()
             model_dict.update({
                 "is_in_category": headers[header] > 1,
                 "collapse_target": collapse_target,
                 "created_at": q.created_at,
                 "is_header": False,
-                "run_count": q.querylog_set.count(),
+                "run_count": stats.run_count,
                 "connection_name": str(q.database_connection),
-                "ran_successfully": lrl.success,
-                "last_run_at": lrl.run_at,
+                # Queries that have never run are shown as having run successfully when they were created; see
+                # Query.last_run_log().
+                "ran_successfully": stats.last_run_success if stats.last_run_at is not None else True,
+                "last_run_at": stats.last_run_at or q.created_at,
                 "created_by_user":
                     str(q.created_by_user) if q.created_by_user else None,
                 "is_favorite": q.id in query_favorites_for_user
@@ -2,6 +2,7 @@ from django.core.exceptions import ValidationError
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.views import View
 
@@ -91,7 +92,9 @@ class QueryView(PermissionRequiredMixin, ExplorerContextMixin, View):
 
     def get(self, request, query_id):
         query, form = QueryView.get_instance_and_form(request, query_id)
-        query.save()  # updates the modified date
+        # Bump the modified date without re-saving the whole query
+        query.last_run_date = timezone.now()
+        Query.objects.filter(pk=query.pk).update(last_run_date=query.last_run_date)
         show = url_get_show(request)
         rows = url_get_rows(request)
         params = query.available_params()
@@ -1,12 +1,15 @@
 from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from explorer.ee.db_connections.models import DatabaseConnection
 from explorer.ee.db_connections.utils import default_db_connection_id
 
-from explorer.schema import schema_info, schema_json_info
+from explorer.schema import (
+    SCHEMA_BUILDING, SCHEMA_READY, decode_schema, schema_payload, schema_status, transform_to_json_schema,
+)
 from explorer.views.auth import PermissionRequiredMixin
 
 
@@ -26,13 +29,17 @@ class SchemaView(PermissionRequiredMixin, View):
             raise Http404 from e
         except ValueError as e:
             raise Http404 from e
-        schema = schema_info(connection)
-        if schema:
+        status, schema = schema_status(connection)
+        if status == SCHEMA_READY:
             return render(
                 request,
                 "explorer/schema.html",
                 {"schema": schema}
             )
+        elif status == SCHEMA_BUILDING:
+            return render(request,
+                          "explorer/schema_building.html",
+                          {"connection": connection.alias})
         else:
             return render(request,
                           "explorer/schema_error.html",
@@ -46,4 +53,16 @@ class SchemaJsonView(PermissionRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         connection = kwargs.get("connection", default_db_connection_id())
         conn = get_object_or_404(DatabaseConnection, id=connection)
-        return JsonResponse(schema_json_info(conn))
+        payload = schema_payload(conn, wait=False)
+        if payload is None:
+            # Still being built; the client should ask again shortly
+            return JsonResponse({"status": SCHEMA_BUILDING}, status=202)
+        version, data = payload
+        # The version only changes with the schema, so clients that have it already don't need it sent again
+        etag = f'"{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(transform_to_json_schema(decode_schema(data)))
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
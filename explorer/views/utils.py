@@ -3,7 +3,7 @@ import logging
 from explorer import app_settings
 from explorer.charts import get_chart
 from explorer.models import QueryFavorite
-from explorer.schema import schema_json_info
+from explorer.utils import url_get_count, url_get_refresh
 
 
 logger = logging.getLogger(__name__)
@@ -19,9 +19,10 @@ def query_viewmodel(request, query, title=None, form=None, message=None,
     """
     res = None
     ql = None
+    total_rows = None
     if run_query:
         try:
-            res, ql = query.execute_with_logging(request.user)
+            res, ql, total_rows = _run_query(request, query, rows)
         except DatabaseError as e:
             error = str(e)
     has_valid_results = not error and res and run_query
@@ -40,6 +41,8 @@ def query_viewmodel(request, query, title=None, form=None, message=None,
             "querylog_id": ql.id
         })
 
+    count_params, refresh_params = _count_and_refresh_params(request, query, ql)
+
     user = request.user
     is_favorite = False
     if user.is_authenticated and query.pk:
@@ -72,8 +75,12 @@ def query_viewmodel(request, query, title=None, form=None, message=None,
         "query_id": query.id,
         "data": res.data[:rows] if has_valid_results else None,
         "headers": res.headers if has_valid_results else None,
-        "total_rows": len(res.data) if has_valid_results else None,
+        "total_rows": total_rows if has_valid_results else None,
+        "has_more_rows": res.has_more if has_valid_results else False,
+        "count_params": count_params.urlencode(),
         "duration": res.duration if has_valid_results else None,
+        "cache_age": res.cache_age if has_valid_results else None,
+        "refresh_params": refresh_params.urlencode(),
         "has_stats":
             len([h for h in res.headers if h.summary])
             if has_valid_results else False,
@@ -84,6 +91,34 @@ def query_viewmodel(request, query, title=None, form=None, message=None,
         "charts_enabled": app_settings.EXPLORER_CHARTS_ENABLED,
         "is_favorite": is_favorite,
         "show_sql_by_default": app_settings.EXPLORER_SHOW_SQL_BY_DEFAULT,
-        "schema_json": schema_json_info(query.database_connection) if query and query.database_connection else None,
     }
     return {**ret, **charts}
+
+
+def _run_query(request, query, rows):
+    """
+    :return: The results, the query log, and the total number of rows if it is known (or was asked for)
+    """
+    max_rows = rows if app_settings.EXPLORER_ROW_LIMIT_PUSHDOWN else None
+    # Saving a query re-runs it rather than showing cached results
+    refresh = url_get_refresh(request) or request.method == "POST"
+    res, ql = query.execute_with_logging(request.user, max_rows=max_rows, refresh=refresh)
+    total_rows = None
+    if not res.has_more:
+        total_rows = len(res.data)
+    elif url_get_count(request):
+        total_rows = query.count_rows()
+    return res, ql, total_rows
+
+
+def _count_and_refresh_params(request, query, ql):
+    # Playground results come from a POST, so re-running them with a count goes via the query log instead
+    count_params = request.GET.copy()
+    count_params["count"] = 1
+    if not query.id and ql:
+        count_params["querylog_id"] = ql.id
+
+    refresh_params = request.GET.copy()
+    refresh_params.pop("count", None)
+    refresh_params["refresh"] = 1
+    return count_params, refresh_params
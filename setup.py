@@ -84,6 +84,7 @@ setup(
         "xls": requirements("extra/xls.txt"),
         "assistant": requirements("extra/assistant.txt"),
         "uploads": requirements("extra/uploads.txt"),
+        "arrow": requirements("extra/arrow.txt"),
     },
     cmdclass={
         "build_sphinx": BuildDoc,